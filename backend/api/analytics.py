@@ -0,0 +1,62 @@
+# dukani/backend/api/analytics.py
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ShopDailyRollup, ShopHourlyRollup
+
+# Longest date range the stock movement endpoint answers in one request
+STOCK_MOVEMENT_MAX_DAYS = 366
+# The manager dashboard's default chart
+STOCK_MOVEMENT_DEFAULT_DAYS = 7
+
+
+def daily_stock_movement(shop_id, start, end, zone):
+    """
+    Per-day stock received (stockIn), sold (stockOut) and missed-sale
+    quantities for a shop from `start` to `end` inclusive, as local days in
+    `zone`. Days without entries are included with zeros.
+
+    Reads the rollup tables, never raw entries: one indexed scan of the daily
+    rollups when `zone` is settings.TIME_ZONE (their bucketing zone), otherwise
+    of the hourly rollups, regrouped by local day in `zone`.
+    """
+    if str(zone) == settings.TIME_ZONE:
+        rows = ShopDailyRollup.objects.filter(
+            shop_id=shop_id, day__range=(start, end)
+        ).values_list("day", "stock_in_quantity", "sales_quantity", "missed_quantity")
+    else:
+        hourly = ShopHourlyRollup.objects.filter(
+            shop_id=shop_id,
+            hour__gte=datetime.combine(start, time.min, tzinfo=zone),
+            hour__lt=datetime.combine(end + timedelta(days=1), time.min, tzinfo=zone),
+        ).values_list("hour", "stock_in_quantity", "sales_quantity", "missed_quantity")
+        rows = [
+            (timezone.localtime(hour, zone).date(), stock_in, sales, missed)
+            for hour, stock_in, sales, missed in hourly
+        ]
+
+    totals = {}
+    for day, stock_in, sales, missed in rows:
+        day_totals = totals.setdefault(day, [Decimal("0.000")] * 3)
+        day_totals[0] += stock_in
+        day_totals[1] += sales
+        day_totals[2] += missed
+
+    movement = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        stock_in, stock_out, missed = totals.get(day, [Decimal("0.000")] * 3)
+        movement.append(
+            {
+                "date": day.isoformat(),
+                "day": day.strftime("%a"),
+                "stockIn": stock_in,
+                "stockOut": stock_out,
+                "missedSales": missed,
+            }
+        )
+    return movement
@@ -1,22 +1,31 @@
-from rest_framework.authentication import BaseAuthentication
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
 from rest_framework import exceptions
-from django.contrib.auth.models import User
-from .token_store import get_user_id
+from .token_store import lookup_token
+from .principal import load_principal
 
 class DummyTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates 'Authorization: Token <token>' headers issued by dummy_login.
+    The token itself is usually a cache hit (no query), and the principal -
+    the manager with their managed shop IDs, or the worker with their shop -
+    is loaded in one query, so authentication costs at most one query.
+    """
+    keyword = 'Token'
+
     def authenticate(self, request):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Token '):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
             return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
 
-        token = auth_header.replace('Token ', '')
-        user_id = get_user_id(token)
-        if not user_id:
+        token = auth[1].decode()
+        data = lookup_token(token)
+        if not data:
             raise exceptions.AuthenticationFailed('Invalid token')
 
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        principal = load_principal(*data)
+        if principal is None:
             raise exceptions.AuthenticationFailed('User not found')
 
-        return (user, None)
\ No newline at end of file
+        return (principal, token)
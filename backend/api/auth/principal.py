@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router
+
+
+class WorkerPrincipal:
+    """
+    request.user for a Worker token. Workers have no User account, so this
+    stands in for one: it is authenticated, never staff, manages no shops, and
+    exposes the Worker (with its shop already loaded) as `.worker`, which is
+    what the views and permissions check for.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+    managed_shop_ids = frozenset()
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.pk = self.id = None
+        self.username = worker.phone_number
+
+    def __str__(self):
+        return f"Worker {self.worker.full_name}"
+
+
+def load_principal(role, subject_id):
+    """
+    Loads the request principal for a token's (role, id) in a single query:
+    a WorkerPrincipal (worker + shop), or an active User with `managed_shop_ids`
+    already set. Returns None if the worker/user no longer exists or is inactive.
+    """
+    from api.models import Worker
+
+    if role == "worker":
+        worker = (
+            Worker.objects.select_related("shop")
+            .filter(pk=subject_id, is_active=True)
+            .first()
+        )
+        return WorkerPrincipal(worker) if worker else None
+
+    # One row per managed shop (LEFT JOIN), so the user and its shop IDs come
+    # back together.
+    field_names = [field.attname for field in User._meta.concrete_fields]
+    rows = list(
+        User.objects.filter(pk=subject_id, is_active=True).values_list(
+            *field_names, "managed_shops__id"
+        )
+    )
+    if not rows:
+        return None
+    user = User.from_db(router.db_for_read(User), field_names, rows[0][:-1])
+    user.managed_shop_ids = frozenset(row[-1] for row in rows if row[-1] is not None)
+    return user
+
+
+def _managed_shops_cache_key(user_id):
+    return f"managed_shop_ids:{user_id}"
+
+
+def managed_shop_ids(user):
+    """
+    IDs of the shops `user` manages, as a frozenset for membership tests and
+    `shop_id__in` filters. Token principals carry them already. For other
+    users the set comes from the cache (filled with one query on a miss) and
+    is kept on the user object for the rest of the request. The cached set is
+    dropped by api.signals whenever Shop.managers changes.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, "managed_shop_ids", None)
+    if ids is None:
+        key = _managed_shops_cache_key(user.pk)
+        ids = cache.get(key)
+        if ids is None:
+            ids = frozenset(user.managed_shops.values_list("id", flat=True))
+            cache.set(key, ids, getattr(settings, "MANAGED_SHOPS_CACHE_SECONDS", 30))
+        user.managed_shop_ids = ids
+    return ids
+
+
+def invalidate_managed_shop_ids(user_ids):
+    cache.delete_many([_managed_shops_cache_key(user_id) for user_id in user_ids])
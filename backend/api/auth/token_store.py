@@ -1,26 +1,140 @@
+import threading
 import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+# Tokens live in the AuthToken table so every server process sees the same set.
+# Each process keeps an LRU cache in front of it: {token: (role, id, expires_at, cached_at)}.
+# Cached entries are trusted for AUTH_TOKEN_CACHE_SECONDS, after which the next
+# lookup re-reads the row, so a logout in another process takes effect within that window.
+
+
+class _TokenCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                self._entries.move_to_end(token)
+            return entry
+
+    def set(self, token, entry):
+        with self._lock:
+            self._entries[token] = entry
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = _TokenCache(getattr(settings, "AUTH_TOKEN_CACHE_SIZE", 10000))
+
+
+def _token_ttl():
+    return timedelta(days=getattr(settings, "AUTH_TOKEN_TTL_DAYS", 30))
+
+
+def _cache_window():
+    return timedelta(seconds=getattr(settings, "AUTH_TOKEN_CACHE_SECONDS", 60))
 
-# In-memory token store: {token_str: {'id': user_or_worker_id, 'role': 'worker'/'manager'}}
-TOKENS = {}
 
 def generate_token_for(user_or_worker):
+    from api.models import AuthToken, Worker
+
+    now = timezone.now()
     token = uuid.uuid4().hex
-    role = 'worker' if hasattr(user_or_worker, 'phone_number') else 'manager'
-    TOKENS[token] = {'id': user_or_worker.id, 'role': role}
+    if isinstance(user_or_worker, Worker):
+        role, owner = 'worker', {'worker': user_or_worker}
+    else:
+        role, owner = 'manager', {'user': user_or_worker}
+    expires_at = now + _token_ttl()
+    AuthToken.objects.create(key=token, expires_at=expires_at, **owner)
+    _cache.set(token, (role, user_or_worker.id, expires_at, now))
     return token
 
+
+def clear_expired_tokens(batch_size=1000):
+    """
+    Deletes expired AuthToken rows, batch_size at a time so no single DELETE
+    holds locks for long. Returns the number deleted. Run periodically by the
+    clear_expired_tokens command.
+    """
+    from api.models import AuthToken
+
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            AuthToken.objects.filter(expires_at__lte=now).values_list("key", flat=True)[
+                :batch_size
+            ]
+        )
+        if not keys:
+            return deleted
+        deleted += AuthToken.objects.filter(key__in=keys).delete()[0]
+
+
+def lookup_token(token):
+    """
+    Returns (role, id) for a live token, or None. Costs no queries on a cache hit.
+    """
+    from api.models import AuthToken
+
+    now = timezone.now()
+    entry = _cache.get(token)
+    if entry is not None:
+        role, subject_id, expires_at, cached_at = entry
+        if expires_at <= now:
+            _cache.discard(token)
+            return None
+        if now - cached_at < _cache_window():
+            return role, subject_id
+
+    row = (
+        AuthToken.objects.filter(key=token, expires_at__gt=now)
+        .values_list('user_id', 'worker_id', 'expires_at')
+        .first()
+    )
+    if row is None:
+        _cache.discard(token)
+        return None
+    user_id, worker_id, expires_at = row
+    role, subject_id = ('worker', worker_id) if worker_id else ('manager', user_id)
+    _cache.set(token, (role, subject_id, expires_at, now))
+    return role, subject_id
+
+
 def get_user_or_worker_by_token(token):
     from api.models import Worker
     from django.contrib.auth.models import User
 
-    data = TOKENS.get(token)
+    data = lookup_token(token)
     if not data:
         return None
-    if data['role'] == 'worker':
-        return Worker.objects.filter(id=data['id']).first()
-    elif data['role'] == 'manager':
-        return User.objects.filter(id=data['id']).first()
+    role, subject_id = data
+    if role == 'worker':
+        return Worker.objects.filter(id=subject_id).first()
+    elif role == 'manager':
+        return User.objects.filter(id=subject_id).first()
     return None
 
+
 def remove_token(token):
-    TOKENS.pop(token, None)
+    from api.models import AuthToken
+
+    AuthToken.objects.filter(key=token).delete()
+    _cache.discard(token)
@@ -0,0 +1,132 @@
+# dukani/backend/api/autocomplete.py
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Product
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+def _normalize(text):
+    return (text or "").casefold().strip()
+
+
+class ShopPrefixIndex:
+    """
+    Sorted prefix index over one shop's products. Every word of a product's
+    name and its barcode are keys, so "oil" finds "Engine Oil 5W-30" and a
+    partially typed barcode finds its product. Lookups are a bisect into the
+    sorted keys plus a walk over the matching range; no database access.
+    """
+
+    def __init__(self, rows):
+        self.products = {}
+        keys = []
+        for product_id, name, barcode, price in rows:
+            words = _normalize(name).split()
+            self.products[product_id] = {
+                "id": str(product_id),
+                "name": name,
+                "barcode": barcode,
+                "price": str(price) if price is not None else None,
+                "words": words,
+            }
+            for word in set(words):
+                keys.append((word, product_id))
+            if barcode:
+                keys.append((_normalize(barcode), product_id))
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.product_ids = [product_id for _, product_id in keys]
+        self.built_at = time.monotonic()
+
+    def _ids_with_prefix(self, prefix):
+        position = bisect_left(self.keys, prefix)
+        ids = set()
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            ids.add(self.product_ids[position])
+            position += 1
+        return ids
+
+    def search(self, query, limit):
+        terms = _normalize(query).split()
+        if not terms:
+            return []
+        # Walk the range for the longest term, then check the others per product
+        terms.sort(key=len, reverse=True)
+        matches = []
+        for product_id in self._ids_with_prefix(terms[0]):
+            product = self.products[product_id]
+            if all(
+                any(word.startswith(term) for word in product["words"])
+                for term in terms[1:]
+            ):
+                matches.append(product)
+
+        full_query = _normalize(query)
+        matches.sort(
+            key=lambda p: (
+                not _normalize(p["name"]).startswith(full_query),
+                _normalize(p["name"]),
+            )
+        )
+        return [
+            {key: value for key, value in product.items() if key != "words"}
+            for product in matches[:limit]
+        ]
+
+
+class PrefixIndexCache:
+    """
+    Per-process LRU of ShopPrefixIndex objects, built on first use for a shop.
+    Product saves/deletes in this process drop the shop's index (api.signals);
+    an index is also rebuilt once it is older than AUTOCOMPLETE_INDEX_SECONDS,
+    which bounds staleness from changes made by other server processes.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate(), so an index built from rows read before an
+        # invalidation is not cached afterwards.
+        self._generation = 0
+
+    def get(self, shop_id):
+        max_age = getattr(settings, "AUTOCOMPLETE_INDEX_SECONDS", 60)
+        with self._lock:
+            index = self._indexes.get(shop_id)
+            if index is not None and time.monotonic() - index.built_at < max_age:
+                self._indexes.move_to_end(shop_id)
+                return index
+            generation = self._generation
+
+        rows = Product.objects.filter(shop_id=shop_id).values_list(
+            "id", "name", "barcode", "price"
+        )
+        index = ShopPrefixIndex(rows)
+        with self._lock:
+            if generation != self._generation:
+                return index
+            self._indexes[shop_id] = index
+            self._indexes.move_to_end(shop_id)
+            while len(self._indexes) > getattr(settings, "AUTOCOMPLETE_MAX_SHOPS", 200):
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, shop_id):
+        with self._lock:
+            self._generation += 1
+            self._indexes.pop(shop_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+prefix_indexes = PrefixIndexCache()
@@ -0,0 +1,60 @@
+# dukani/backend/api/barcodes.py
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import GlobalProduct, Product
+
+GLOBAL_SCOPE = "global"
+
+
+def _miss_key(scope, barcode):
+    digest = hashlib.md5(barcode.encode()).hexdigest()
+    return f"barcode-miss:{scope}:{digest}"
+
+
+def lookup_barcode(shop_id, barcode):
+    """
+    Resolves a scanned barcode for a shop: the shop's own Product if it has one,
+    otherwise the GlobalProduct with that barcode as a suggestion.
+    Returns ("shop", product), ("global", global_product) or (None, None).
+
+    Both lookups are exact matches on indexed columns. Misses are remembered in
+    the cache for BARCODE_MISS_CACHE_SECONDS, so rescanning an unknown item
+    doesn't reach the database; api.signals forgets a miss in this process
+    as soon as a product with that barcode is saved (and again on commit).
+    """
+    shop_key = _miss_key(shop_id, barcode)
+    global_key = _miss_key(GLOBAL_SCOPE, barcode)
+    known_misses = cache.get_many([shop_key, global_key])
+    timeout = getattr(settings, "BARCODE_MISS_CACHE_SECONDS", 30)
+
+    if shop_key not in known_misses:
+        product = (
+            Product.objects.select_related("shop", "global_product__category")
+            .filter(shop_id=shop_id, barcode=barcode)
+            .order_by("created_at")
+            .first()
+        )
+        if product:
+            return "shop", product
+        cache.set(shop_key, True, timeout)
+
+    if global_key not in known_misses:
+        global_product = (
+            GlobalProduct.objects.select_related("category")
+            .filter(barcode=barcode)
+            .first()
+        )
+        if global_product:
+            return "global", global_product
+        cache.set(global_key, True, timeout)
+
+    return None, None
+
+
+def forget_barcode_miss(scope, barcode):
+    if barcode:
+        cache.delete(_miss_key(scope, barcode))
@@ -0,0 +1,76 @@
+# dukani/backend/api/exports.py
+
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Rows fetched from the database cursor per round trip; also the number of
+# rows written per streamed chunk
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back each written line."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_chunks(rows, fields):
+    writer = csv.writer(_LineBuffer())
+    lines = [writer.writerow(fields)]
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def _ndjson_chunks(rows, fields):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + "\n")
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(queryset, columns, export_format="csv", compress=False):
+    """
+    Yields `queryset` as CSV or NDJSON. `columns` is a sequence of
+    (column name, field lookup) pairs. Rows are read with a server-side cursor
+    (iterator(chunk_size=EXPORT_CHUNK_SIZE)) and written out chunk by chunk,
+    so memory use stays flat however many rows are exported. With
+    `compress`, the output is gzip-compressed as it is produced.
+    """
+    fields = [name for name, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    )
+    if export_format == "ndjson":
+        chunks = _ndjson_chunks(rows, fields)
+    else:
+        chunks = _csv_chunks(rows, fields)
+    if compress:
+        return _gzipped(chunks)
+    return (chunk.encode() for chunk in chunks)
@@ -0,0 +1,119 @@
+# dukani/backend/api/image_matching.py
+
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from .models import GlobalProduct
+
+IMAGE_MATCH_DEFAULT_LIMIT = 5
+# The index splits hashes into 8 one-byte bands. Two hashes at most 7 bits
+# apart share at least one band, so every match within that distance is found.
+IMAGE_MATCH_BANDS = 8
+IMAGE_MATCH_MAX_SUPPORTED_DISTANCE = IMAGE_MATCH_BANDS - 1
+
+
+def perceptual_hash(image):
+    """
+    64-bit difference hash (dHash) of a Pillow image as 16 hex digits: each
+    bit says whether a pixel of a 9x8 grayscale thumbnail is brighter than
+    its right-hand neighbour. Re-encoded, resized or slightly recropped copies
+    of a photo get hashes only a few bits apart.
+    """
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = (value << 1) | (left > pixels[row * 9 + column + 1])
+    return f"{value:016x}"
+
+
+def _bands(value):
+    return [(band, (value >> (8 * band)) & 0xFF) for band in range(IMAGE_MATCH_BANDS)]
+
+
+class GlobalImageIndex:
+    """
+    In-memory index of the global catalog's image hashes, looked up by
+    Hamming distance. Hashes are bucketed by each of their bands, so a lookup
+    only compares against catalog images sharing a band with the query.
+    """
+
+    def __init__(self, rows):
+        self.hashes = {}
+        self.buckets = {}
+        for global_product_id, phash in rows:
+            value = int(phash, 16)
+            self.hashes[global_product_id] = value
+            for band in _bands(value):
+                self.buckets.setdefault(band, set()).add(global_product_id)
+        self.built_at = time.monotonic()
+
+    def nearest(self, phash, max_distance, limit):
+        """[(global product ID, distance)] within max_distance, closest first."""
+        value = int(phash, 16)
+        candidates = set()
+        for band in _bands(value):
+            candidates |= self.buckets.get(band, set())
+        matches = []
+        for global_product_id in candidates:
+            distance = (self.hashes[global_product_id] ^ value).bit_count()
+            if distance <= max_distance:
+                matches.append((distance, str(global_product_id), global_product_id))
+        matches.sort()
+        return [(global_product_id, distance) for distance, _, global_product_id in matches[:limit]]
+
+
+class GlobalImageIndexCache:
+    """
+    The per-process GlobalImageIndex, built on first use. GlobalProduct saves
+    and deletes in this process drop it (api.signals); it is also rebuilt
+    once older than IMAGE_MATCH_INDEX_SECONDS, which bounds staleness from
+    changes made by other server processes and the background worker.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self):
+        max_age = getattr(settings, "IMAGE_MATCH_INDEX_SECONDS", 300)
+        with self._lock:
+            index = self._index
+            if index is not None and time.monotonic() - index.built_at < max_age:
+                return index
+            generation = self._generation
+
+        rows = GlobalProduct.objects.exclude(image_phash="").values_list(
+            "id", "image_phash"
+        )
+        index = GlobalImageIndex(rows)
+        with self._lock:
+            if generation == self._generation:
+                self._index = index
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._index = None
+
+
+global_image_index = GlobalImageIndexCache()
+
+
+def similar_global_products(phash, limit=IMAGE_MATCH_DEFAULT_LIMIT):
+    """
+    GlobalProducts whose image looks like the one with perceptual hash
+    `phash`, as [(global product ID, distance)], closest first. Empty when
+    perceptual matching is switched off (IMAGE_MATCH_MAX_DISTANCE = None).
+    """
+    max_distance = getattr(settings, "IMAGE_MATCH_MAX_DISTANCE", 6)
+    if not phash or max_distance is None:
+        return []
+    max_distance = min(max_distance, IMAGE_MATCH_MAX_SUPPORTED_DISTANCE)
+    return global_image_index.get().nearest(phash, max_distance, limit)
@@ -0,0 +1,412 @@
+# dukani/backend/api/images.py
+
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .image_matching import global_image_index, perceptual_hash
+from .jobs import enqueue, job_handler
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Rendition format -> (Pillow format, file extension)
+RENDITION_FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+# Raised by Pillow for data it can't read as an image
+DECODE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def _flatten(image):
+    """RGB version of `image`, with any transparency composited onto white."""
+    if image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _encode(image, pillow_format):
+    buffer = BytesIO()
+    # Saved without exif=, so camera metadata (GPS position etc.) is dropped
+    image.save(
+        buffer,
+        pillow_format,
+        quality=getattr(settings, "IMAGE_QUALITY", 80),
+        optimize=True,
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def _decode(data):
+    """Upright RGB image from uploaded bytes, capped to IMAGE_MAX_DIMENSION."""
+    max_dimension = getattr(settings, "IMAGE_MAX_DIMENSION", 2048)
+    image = Image.open(BytesIO(data))
+    # JPEGs can be decoded directly at a reduced scale, which is much
+    # faster than decoding a full camera image and shrinking it.
+    image.draft("RGB", (max_dimension, max_dimension))
+    image = _flatten(ImageOps.exif_transpose(image))
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return image
+
+
+def process_image(data, base, storage):
+    """
+    Re-encodes the image in `data` and writes it and its renditions to
+    `storage`.
+
+    The image is stored as "<base>.jpg", a JPEG no larger than
+    IMAGE_MAX_DIMENSION on its longest side, upright (EXIF orientation
+    applied) and without EXIF data. For each of IMAGE_RENDITION_SIZES a WebP
+    and a JPEG rendition is written under "<upload dir>/renditions/". Returns
+    (value for the model's `image_renditions` field, perceptual hash), where
+    the field value is {"source": <stored image name>, "files": {size:
+    {format: name}}}, or None if `data` can't be decoded as an image. Storage
+    errors propagate.
+    """
+    try:
+        image = _decode(data)
+    except DECODE_ERRORS as exc:
+        logger.warning("Could not process image %s: %s", base, exc)
+        return None
+    sizes = getattr(settings, "IMAGE_RENDITION_SIZES", {"thumb": 240, "medium": 800})
+    phash = perceptual_hash(image)
+
+    directory, stem = os.path.split(base)
+    source = storage.save(f"{base}.jpg", _encode(image, "JPEG"))
+
+    files = {}
+    # Largest first, each rendition resized from the previous one
+    for label, dimension in sorted(sizes.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((dimension, dimension), Image.LANCZOS)
+        files[label] = {
+            format_name: storage.save(
+                os.path.join(directory, "renditions", f"{stem}_{label}.{extension}"),
+                _encode(image, pillow_format),
+            )
+            for format_name, (pillow_format, extension) in RENDITION_FORMATS.items()
+        }
+    return {"source": source, "files": files}, phash
+
+
+def store_image(instance, data, filename):
+    """
+    Stores uploaded bytes as a Product's or GlobalProduct's image, addressed
+    by content: files are named after the SHA-256 of `data`, and if another
+    row of the same model already holds an identical upload its stored image
+    and renditions are shared instead of being processed and written again.
+    Returns the field values to save on the instance.
+
+    The row shared from is locked (SELECT ... FOR UPDATE), so call this in
+    the transaction that saves the values (see _attach_image): a concurrent
+    _release_image() of those files waits for it and then sees the new row
+    sharing them.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    existing = (
+        type(instance)
+        .objects.select_for_update()
+        .filter(image_digest=digest)
+        .exclude(pk=instance.pk)
+        .values("image", "image_renditions", "image_phash")
+        .first()
+    )
+    if existing:
+        return {**existing, "image_digest": digest}
+
+    storage = instance.image.storage
+    directory = os.path.dirname(instance.image.field.generate_filename(instance, filename))
+    base = os.path.join(directory, digest)
+    processed = process_image(data, base, storage)
+    if processed is None:
+        # Not a readable image; kept as uploaded, without renditions
+        extension = os.path.splitext(filename)[1].lower()
+        renditions = {"source": storage.save(base + extension, ContentFile(data)), "files": {}}
+        phash = ""
+    else:
+        renditions, phash = processed
+    return {
+        "image": renditions["source"],
+        "image_renditions": renditions,
+        "image_digest": digest,
+        "image_phash": phash,
+    }
+
+
+def _delete_renditions(storage, renditions):
+    for formats in renditions.get("files", {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def _release_image(model, pk, name, renditions, storage):
+    """
+    Deletes an image a row no longer uses, with its renditions, unless other
+    rows of the model still share it. The rows sharing it are locked while
+    deciding, so it can't be deleted under a store_image() that is starting
+    to share it.
+    """
+    with transaction.atomic():
+        if name and list(
+            model.objects.select_for_update()
+            .filter(image=name)
+            .exclude(pk=pk)
+            .values_list("pk", flat=True)
+        ):
+            return
+        if name:
+            storage.delete(name)
+        _delete_renditions(storage, renditions)
+
+
+def _job_payload(instance):
+    return {"model": instance._meta.model_name, "pk": str(instance.pk)}
+
+
+def _job_instance(payload):
+    model = apps.get_model("api", payload["model"])
+    return model.objects.filter(pk=payload["pk"]).first()
+
+
+def _release_previous(instance, new_name):
+    """
+    Once `instance`'s row points at `new_name`, deletes the image files it
+    used before (the loaded image and renditions) that no other row shares.
+    """
+    storage = instance.image.storage
+    previous = instance.image_renditions or {}
+    for name in {instance.image.name, previous.get("source")} - {None, "", new_name}:
+        _release_image(
+            type(instance),
+            instance.pk,
+            name,
+            previous if name == previous.get("source") else {},
+            storage,
+        )
+
+
+def _save_image(instance, values):
+    """
+    Writes image field values (e.g. from store_image()) to `instance`'s row
+    with update(), so no save signals fire again, and releases the files it
+    used before if the image changed. In one transaction: until it commits,
+    the updated row stays locked to a store_image() looking to share the old
+    files, which then finds they are no longer there to share.
+    """
+    model = type(instance)
+    with transaction.atomic():
+        model.objects.filter(pk=instance.pk).update(**values)
+        if "image" in values:
+            _release_previous(instance, values["image"])
+    if model is apps.get_model("api", "globalproduct"):
+        global_image_index.invalidate()
+
+
+def _attach_image(instance, data, filename):
+    """store_image() and _save_image() in one transaction, see store_image."""
+    with transaction.atomic():
+        _save_image(instance, store_image(instance, data, filename))
+
+
+def queue_image_renditions(instance):
+    """
+    Queues processing of a Product's or GlobalProduct's current image unless
+    its renditions and hashes are already up to date. Called from post_save.
+
+    A changed image's digest is cleared straight away: it described the old
+    file, and store_image() must not share the new one under it.
+    """
+    previous = instance.image_renditions or {}
+    if instance.image:
+        if previous.get("source") == instance.image.name and instance.image_digest:
+            return
+    elif not previous:
+        return
+    if instance.image_digest:
+        type(instance).objects.filter(pk=instance.pk).update(image_digest="")
+        instance.image_digest = ""
+    enqueue(
+        "image_renditions",
+        _job_payload(instance),
+        key=f"image_renditions:{instance._meta.model_name}:{instance.pk}",
+    )
+
+
+@job_handler("image_renditions")
+def refresh_image_renditions(payload):
+    """
+    Brings a Product's or GlobalProduct's stored image in line with its image
+    field: a newly stored image is replaced by its content-addressed,
+    re-encoded version with renditions; the files of a removed image are
+    dropped.
+    """
+    instance = _job_instance(payload)
+    if instance is None:
+        return
+    image = instance.image
+    previous = instance.image_renditions or {}
+
+    if image and previous.get("source") == image.name:
+        if instance.image_digest:
+            return
+        # Processed before content hashes were kept: record them in place
+        with image.open("rb"):
+            data = image.read()
+        try:
+            phash = perceptual_hash(_decode(data))
+        except DECODE_ERRORS:
+            phash = ""
+        _save_image(
+            instance, {"image_digest": hashlib.sha256(data).hexdigest(), "image_phash": phash}
+        )
+        return
+
+    if not image:
+        _save_image(
+            instance, {"image": None, "image_renditions": {}, "image_digest": "", "image_phash": ""}
+        )
+        return
+    with image.open("rb"):
+        data = image.read()
+    _attach_image(instance, data, os.path.basename(image.name))
+
+
+def staging_storage():
+    """Local storage uploads wait in until the worker moves them to MediaStorage."""
+    return FileSystemStorage(location=settings.IMAGE_STAGING_ROOT)
+
+
+def _attach_key(source, name):
+    return f"attach_image:{source}:{name}"
+
+
+def _queue_attach(instance, name, filename, source):
+    enqueue(
+        "attach_image",
+        {**_job_payload(instance), "staged": name, "filename": filename, "source": source},
+        key=_attach_key(source, name),
+    )
+
+
+def stage_image_upload(instance, uploaded_file):
+    """
+    Saves an uploaded image for `instance` to local staging storage and
+    queues a job that stores it (re-encoded, with renditions) as the
+    instance's image. Keeps the slow object storage round trip out of the
+    request; the image field stays as it was until the worker has run. If
+    the surrounding transaction rolls back, the job goes with it and
+    sweep_staged_uploads() later removes the file.
+    """
+    filename = os.path.basename(uploaded_file.name)
+    _queue_attach(instance, staging_storage().save(filename, uploaded_file), filename, "staging")
+
+
+def sweep_staged_uploads():
+    """
+    Deletes staged uploads older than IMAGE_STAGING_MAX_AGE_SECONDS that no
+    queued attach_image job refers to: left behind by requests that rolled
+    back or processes that died while staging. Returns how many it deleted.
+    Run periodically by the run_jobs worker.
+    """
+    storage = staging_storage()
+    if not os.path.isdir(storage.location):
+        return 0
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, "IMAGE_STAGING_MAX_AGE_SECONDS", 3600)
+    )
+    old = [
+        name
+        for name in storage.listdir("")[1]
+        if storage.get_modified_time(name) < cutoff
+    ]
+    queued = set(
+        BackgroundJob.objects.filter(
+            kind="attach_image", payload__source="staging", payload__staged__in=old
+        ).values_list("payload__staged", flat=True)
+    )
+    for name in old:
+        if name not in queued:
+            storage.delete(name)
+    return len(old) - len(queued)
+
+
+def queue_uploaded_image(instance, name):
+    """
+    Queues a file uploaded straight to the image field's storage (under
+    `name`, e.g. through a presigned URL) to be attached like a staged one.
+    """
+    _queue_attach(instance, name, os.path.basename(name), "media")
+
+
+def upload_is_queued(name):
+    """
+    Whether a job for the direct upload `name` exists, in any state: it has
+    been confirmed already. (A job that succeeded is deleted, but only after
+    it deleted the upload.)
+    """
+    return BackgroundJob.objects.filter(key=_attach_key("media", name)).exists()
+
+
+def _upload_storage(payload):
+    if payload.get("source") == "media":
+        return apps.get_model("api", payload["model"])._meta.get_field("image").storage
+    return staging_storage()
+
+
+def discard_upload(payload):
+    """Deletes the upload of an attach_image job that has been given up on."""
+    _upload_storage(payload).delete(payload["staged"])
+
+
+@job_handler("attach_image", on_failure=discard_upload)
+def attach_staged_image(payload):
+    """
+    Stores a staged (or directly uploaded) file as the instance's image
+    (see store_image), then removes the upload.
+    """
+    instance = _job_instance(payload)
+    uploads = _upload_storage(payload)
+    if instance is not None:
+        with uploads.open(payload["staged"], "rb") as file:
+            data = file.read()
+        _attach_image(instance, data, payload["filename"])
+    uploads.delete(payload["staged"])
+
+
+def delete_image_files(instance):
+    """
+    Deletes a Product's or GlobalProduct's image and its renditions from
+    storage, unless another row shares them. Run after a delete commits
+    (see signals.py).
+    """
+    if instance.image:
+        _release_image(
+            type(instance),
+            instance.pk,
+            instance.image.name,
+            instance.image_renditions or {},
+            instance.image.storage,
+        )
+
+
+def rendition_urls(instance):
+    """{size: {format: url}} for a Product's or GlobalProduct's renditions."""
+    renditions = instance.image_renditions or {}
+    storage = instance.image.storage
+    return {
+        label: {name: storage.url(path) for name, path in formats.items()}
+        for label, formats in renditions.get("files", {}).items()
+    }
@@ -0,0 +1,371 @@
+# dukani/backend/api/imports.py
+
+import codecs
+import csv
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+
+from .autocomplete import prefix_indexes
+from .barcodes import forget_barcode_miss
+from .images import staging_storage
+from .jobs import enqueue, job_handler
+from .models import (
+    GlobalProduct,
+    Product,
+    ProductImportJob,
+    ProductStock,
+    StockEntry,
+    QUANTITY_TYPE_CHOICES,
+    QUALITY_TYPE_CHOICES,
+    UNIT,
+    PENDING_REVIEW,
+    LINKED,
+    IMPORT_DONE,
+    IMPORT_FAILED,
+    IMPORT_RUNNING,
+    record_rollups,
+)
+
+# Rows validated, matched and inserted together
+IMPORT_CHUNK_SIZE = 2000
+# Row errors listed in a report; the rest are only counted
+IMPORT_MAX_REPORTED_ERRORS = 500
+
+IMPORT_COLUMNS = (
+    "name",
+    "barcode",
+    "price",
+    "quantity",
+    "purchase_price",
+    "quantity_type",
+    "quality_type",
+    "description",
+)
+
+QUANTITY_TYPES = {value for value, _ in QUANTITY_TYPE_CHOICES}
+QUALITY_TYPES = {value for value, _ in QUALITY_TYPE_CHOICES}
+
+
+class ImportFileError(Exception):
+    """The file as a whole can't be imported (unreadable, missing columns)."""
+
+
+def _csv_rows(file):
+    # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+    reader = csv.reader(codecs.iterdecode(file, "utf-8-sig"))
+    try:
+        yield from reader
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ImportFileError(f"Could not read the CSV file: {exc}")
+
+
+def _xlsx_rows(file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFileError("XLSX imports need openpyxl; upload a CSV file instead.")
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFileError(f"Could not read the XLSX file: {exc}")
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(file, filename):
+    """
+    Yields (row number, {column: value}) for each data row of a CSV or XLSX
+    file, read incrementally. Row numbers are spreadsheet rows (the header
+    is row 1).
+    """
+    rows = _xlsx_rows(file) if filename.lower().endswith(".xlsx") else _csv_rows(file)
+    header = [column.strip().lower() for column in next(rows, [])]
+    if "name" not in header and "barcode" not in header:
+        raise ImportFileError(
+            f"The first row must name the columns, including 'name' or 'barcode'. Known columns: {', '.join(IMPORT_COLUMNS)}."
+        )
+    for row_number, values in enumerate(rows, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        yield row_number, {
+            column: value.strip()
+            for column, value in zip(header, values)
+            if column in IMPORT_COLUMNS
+        }
+
+
+def _decimal(value, field, errors, limit, default=None):
+    if not value:
+        return default
+    try:
+        number = Decimal(value.replace(",", ""))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        errors[field] = "A valid number is required."
+    elif number < 0:
+        errors[field] = "Must not be negative."
+    elif number >= limit:
+        errors[field] = f"Must be less than {limit}."
+    return number
+
+
+def _validate_row(row):
+    errors = {}
+    if not row.get("name") and not row.get("barcode"):
+        errors["name"] = "A product name or barcode is required."
+    elif len(row.get("name", "")) > 255:
+        errors["name"] = "Must be at most 255 characters."
+    if len(row.get("barcode", "")) > 100:
+        errors["barcode"] = "Must be at most 100 characters."
+    # Limits follow the max_digits/decimal_places of the model fields
+    price = _decimal(row.get("price"), "price", errors, Decimal("100000000"))
+    quantity = _decimal(
+        row.get("quantity"), "quantity", errors, Decimal("10000000"), Decimal("0")
+    )
+    purchase_price = _decimal(
+        row.get("purchase_price"), "purchase_price", errors, Decimal("100000000")
+    )
+    quantity_type = (row.get("quantity_type") or UNIT).upper()
+    if quantity_type not in QUANTITY_TYPES:
+        errors["quantity_type"] = f"Must be one of: {', '.join(sorted(QUANTITY_TYPES))}."
+    elif quantity_type == UNIT and "quantity" not in errors and quantity % 1 != 0:
+        errors["quantity"] = f"Quantity must be a whole number for '{UNIT}' type products."
+    quality_type = row.get("quality_type", "").upper() or None
+    if quality_type and quality_type not in QUALITY_TYPES:
+        errors["quality_type"] = f"Must be one of: {', '.join(sorted(QUALITY_TYPES))}."
+    cleaned = {
+        "name": row.get("name", ""),
+        "barcode": row.get("barcode") or None,
+        "price": price,
+        "quantity": quantity,
+        "purchase_price": purchase_price,
+        "quantity_type": quantity_type,
+        "quality_type": quality_type,
+        "description": row.get("description") or None,
+    }
+    return cleaned, errors
+
+
+class ProductImport:
+    """
+    Imports products with opening stock into a shop from parsed rows.
+
+    Rows are handled in chunks of IMPORT_CHUNK_SIZE: each chunk is validated,
+    matched against the global catalog (barcode first, then name) and the
+    shop's existing products with one query each, and its products and
+    opening StockEntry rows are inserted with bulk_create() in one transaction.
+    Rows naming a product the shop already has are reported, not imported,
+    so re-running an import does not double the opening stock.
+
+    With a ProductImportJob, each chunk's transaction also records the last
+    row it covered and the report so far, and a run picks up after the
+    recorded row: an import whose worker died resumes where it stopped.
+    """
+
+    def __init__(self, shop, job=None):
+        self.shop = shop
+        self.job = job
+        report = job.report if job else {}
+        self.created = report.get("created", 0)
+        self.linked = report.get("linked_to_global_product", 0)
+        self.stock_entries = report.get("stock_entries", 0)
+        self.error_count = report.get("error_count", 0)
+        self.errors = report.get("errors", [])
+        self.seen_names = set()
+
+    def run(self, rows):
+        rows_done = self.job.rows_done if self.job else 0
+        chunk = []
+        for row in rows:
+            if row[0] <= rows_done:
+                continue
+            chunk.append(row)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        if self.created:
+            prefix_indexes.invalidate(self.shop.pk)
+        return self.report()
+
+    def report(self):
+        return {
+            "created": self.created,
+            "linked_to_global_product": self.linked,
+            "stock_entries": self.stock_entries,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    def _error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def _import_chunk(self, chunk):
+        valid = []
+        for row_number, row in chunk:
+            cleaned, errors = _validate_row(row)
+            if errors:
+                self._error(row_number, errors)
+            else:
+                valid.append((row_number, cleaned))
+
+        barcodes = {row["barcode"] for _, row in valid if row["barcode"]}
+        names = {row["name"] for _, row in valid if row["name"]}
+        global_by_barcode, global_by_name = {}, {}
+        for global_product in GlobalProduct.objects.filter(
+            Q(barcode__in=barcodes) | Q(name__in=names)
+        ).only("id", "name", "barcode", "suggested_price"):
+            global_by_name[global_product.name] = global_product
+            if global_product.barcode:
+                global_by_barcode[global_product.barcode] = global_product
+
+        resolved = []
+        for row_number, row in valid:
+            global_product = global_by_barcode.get(row["barcode"]) or global_by_name.get(
+                row["name"]
+            )
+            if global_product:
+                row["name"] = row["name"] or global_product.name
+                row["barcode"] = row["barcode"] or global_product.barcode
+                if row["price"] is None:
+                    row["price"] = global_product.suggested_price
+            if not row["name"]:
+                self._error(row_number, {"name": "Unknown barcode; a product name is required."})
+            elif row["price"] is None:
+                self._error(row_number, {"price": "A selling price is required."})
+            elif row["name"] in self.seen_names:
+                self._error(row_number, {"name": "Duplicate product name in this file."})
+            else:
+                self.seen_names.add(row["name"])
+                resolved.append((row_number, row, global_product))
+
+        existing_names, existing_barcodes = set(), set()
+        for name, barcode in Product.objects.filter(shop=self.shop).filter(
+            Q(name__in=[row["name"] for _, row, _ in resolved])
+            | Q(barcode__in=[row["barcode"] for _, row, _ in resolved if row["barcode"]])
+        ).values_list("name", "barcode"):
+            existing_names.add(name)
+            existing_barcodes.add(barcode)
+        products, stock_entries, received = [], [], {}
+        for row_number, row, global_product in resolved:
+            if row["name"] in existing_names:
+                self._error(row_number, {"name": "The shop already has a product with this name."})
+                continue
+            if row["barcode"] and row["barcode"] in existing_barcodes:
+                self._error(
+                    row_number, {"barcode": "The shop already has a product with this barcode."}
+                )
+                continue
+            existing_barcodes.add(row["barcode"])
+            product = Product(
+                shop=self.shop,
+                global_product=global_product,
+                name=row["name"],
+                barcode=row["barcode"],
+                description=row["description"],
+                price=row["price"],
+                quantity_type=row["quantity_type"],
+                quality_type=row["quality_type"],
+                status=LINKED if global_product else PENDING_REVIEW,
+            )
+            products.append(product)
+            if row["quantity"]:
+                stock_entries.append(
+                    StockEntry(
+                        shop=self.shop,
+                        product=product,
+                        quantity=row["quantity"],
+                        purchase_price=row["purchase_price"],
+                        notes="Opening stock (import)",
+                    )
+                )
+                received[product.pk] = row["quantity"]
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            stock_entries = StockEntry.objects.bulk_create(stock_entries)
+            # bulk_create() skips save() and post_save, so do their work here.
+            # The products are new, so are their ledger rows.
+            ProductStock.objects.bulk_create(
+                [
+                    ProductStock(product_id=product_id, quantity=quantity)
+                    for product_id, quantity in received.items()
+                ]
+            )
+            record_rollups(stock_entries)
+            self.created += len(products)
+            self.linked += sum(1 for product in products if product.global_product_id)
+            self.stock_entries += len(stock_entries)
+            if self.job:
+                self.job.rows_done = chunk[-1][0]
+                self.job.report = self.report()
+                self.job.save(update_fields=["rows_done", "report", "updated_at"])
+        for product in products:
+            forget_barcode_miss(self.shop.pk, product.barcode)
+
+
+def queue_product_import(shop, uploaded_file, user=None):
+    """
+    Stages an uploaded import file and queues its import by the run_jobs
+    worker. Returns the ProductImportJob to poll for the outcome.
+    """
+    filename = uploaded_file.name
+    storage = staging_storage()
+    staged_name = storage.save(f"imports/{os.path.basename(filename)}", uploaded_file)
+    try:
+        with transaction.atomic():
+            job = ProductImportJob.objects.create(
+                shop=shop, created_by=user, filename=filename, staged_name=staged_name
+            )
+            enqueue("import_products", {"import": str(job.pk)})
+    except Exception:
+        storage.delete(staged_name)
+        raise
+    return job
+
+
+def _finish_import(job, status, detail=""):
+    job.status = status
+    job.detail = detail
+    job.save(update_fields=["status", "detail", "updated_at"])
+    staging_storage().delete(job.staged_name)
+
+
+def fail_product_import(payload):
+    """Marks an import whose job has been given up on as FAILED."""
+    job = ProductImportJob.objects.filter(pk=payload["import"]).first()
+    if job is not None:
+        _finish_import(
+            job,
+            IMPORT_FAILED,
+            f"The import stopped after row {job.rows_done}; rows up to there "
+            "were imported. Upload the file again to import the rest.",
+        )
+
+
+@job_handler("import_products", on_failure=fail_product_import)
+def run_product_import(payload):
+    job = ProductImportJob.objects.select_related("shop").filter(pk=payload["import"]).first()
+    if job is None or job.status in (IMPORT_DONE, IMPORT_FAILED):
+        return
+    job.status = IMPORT_RUNNING
+    job.save(update_fields=["status", "updated_at"])
+    product_import = ProductImport(job.shop, job)
+    try:
+        with staging_storage().open(job.staged_name, "rb") as file:
+            product_import.run(read_rows(file, job.filename))
+    except ImportFileError as exc:
+        # Chunks before the unreadable part stay imported
+        _finish_import(job, IMPORT_FAILED, str(exc))
+    else:
+        _finish_import(job, IMPORT_DONE)
@@ -0,0 +1,162 @@
+# dukani/backend/api/jobs.py
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob, JOB_FAILED, JOB_PENDING, JOB_RUNNING
+
+logger = logging.getLogger(__name__)
+
+# Job kind -> function taking the job's payload, registered with @job_handler
+JOB_HANDLERS = {}
+# Job kind -> function taking the payload of a job that has been given up on
+JOB_FAILURE_HANDLERS = {}
+
+
+def job_handler(kind, on_failure=None):
+    """
+    Registers the decorated function as the handler for jobs of `kind`.
+    `on_failure`, if given, is called with the payload once such a job is
+    marked FAILED, to clean up after it (e.g. delete a staged upload).
+    """
+
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        if on_failure is not None:
+            JOB_FAILURE_HANDLERS[kind] = on_failure
+        return function
+
+    return register
+
+
+def _give_up(job):
+    """Marks `job` FAILED (the caller saves it) and runs its failure handler."""
+    job.status = JOB_FAILED
+    job.locked_until = None
+    on_failure = JOB_FAILURE_HANDLERS.get(job.kind)
+    if on_failure is not None:
+        try:
+            on_failure(job.payload)
+        except Exception:
+            logger.exception("Cleanup after failed job %s (%s) failed", job.pk, job.kind)
+
+
+def enqueue(kind, payload, key="", delay=None):
+    """
+    Queues a job. It becomes visible to workers when the surrounding
+    transaction commits, so it never runs against rows that were rolled
+    back. With a `key`, nothing is queued while a job with the same key is
+    still pending (a unique constraint settles concurrent enqueues); returns
+    None then.
+    """
+    if key and BackgroundJob.objects.filter(key=key, status=JOB_PENDING).exists():
+        return None
+    run_after = timezone.now() + delay if delay else timezone.now()
+    try:
+        with transaction.atomic():
+            return BackgroundJob.objects.create(
+                kind=kind, payload=payload, key=key, run_after=run_after
+            )
+    except IntegrityError:
+        if not key:
+            raise
+        return None  # Queued by a concurrent transaction meanwhile
+
+
+def claim_next_job():
+    """
+    Marks the next due job RUNNING and returns it, or None. Rows locked by
+    another worker are skipped (SELECT ... FOR UPDATE SKIP LOCKED), so
+    several workers can share the queue.
+
+    A RUNNING job whose lock has expired was abandoned by a worker that
+    died (e.g. killed for running out of memory on it). It is run again,
+    unless it has already had JOB_MAX_ATTEMPTS attempts: then it is marked
+    FAILED, so a job that kills its worker isn't retried forever.
+    """
+    max_attempts = getattr(settings, "JOB_MAX_ATTEMPTS", 5)
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                BackgroundJob.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=JOB_PENDING, run_after__lte=now)
+                    | Q(status=JOB_RUNNING, locked_until__lt=now)
+                )
+                .order_by("run_after", "id")
+                .first()
+            )
+            if job is None:
+                return None
+            if job.status == JOB_RUNNING and job.attempts >= max_attempts:
+                logger.error(
+                    "Background job %s (%s) was abandoned on its last attempt", job.pk, job.kind
+                )
+                job.last_error = "The worker running the job stopped before it finished."
+                _give_up(job)
+                job.save(update_fields=["status", "locked_until", "last_error", "updated_at"])
+                continue
+            job.status = JOB_RUNNING
+            job.attempts += 1
+            job.locked_until = now + timedelta(
+                seconds=getattr(settings, "JOB_LOCK_SECONDS", 600)
+            )
+            job.save(update_fields=["status", "attempts", "locked_until", "updated_at"])
+        return job
+
+
+def run_job(job):
+    """
+    Runs a claimed job. A job that succeeds is deleted; one that raises is
+    retried with exponential backoff until it has had JOB_MAX_ATTEMPTS
+    attempts, then left FAILED with its last traceback (and its failure
+    handler run).
+    """
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        handler(job.payload)
+    except Exception:
+        logger.exception("Background job %s (%s) failed", job.pk, job.kind)
+        job.last_error = traceback.format_exc()
+        job.locked_until = None
+        if job.attempts >= getattr(settings, "JOB_MAX_ATTEMPTS", 5):
+            _give_up(job)
+        else:
+            job.status = JOB_PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=getattr(settings, "JOB_RETRY_SECONDS", 30)
+                * 2 ** (job.attempts - 1)
+            )
+        try:
+            with transaction.atomic():
+                job.save(
+                    update_fields=[
+                        "status", "run_after", "locked_until", "last_error", "updated_at"
+                    ]
+                )
+        except IntegrityError:
+            # The same key was queued again while this job ran; that job
+            # does the work, so this retry isn't needed
+            job.delete()
+        return False
+    job.delete()
+    return True
+
+
+def run_pending_jobs(limit=None):
+    """Runs due jobs until the queue is empty (or `limit` ran); returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
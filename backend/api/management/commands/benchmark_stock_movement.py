@@ -0,0 +1,114 @@
+# dukani/backend/api/management/commands/benchmark_stock_movement.py
+
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Product, SaleEntry, Shop, ShopDailyRollup, ShopHourlyRollup
+from api.views import ShopViewSet
+
+# Sales are spread over this many days of history, during shop opening hours
+HISTORY_DAYS = 365
+OPENING_HOURS = range(8, 20)
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the shop stock-movement endpoint against a throwaway shop with "
+        "--sales sale entries of history and prints p50/p95 latencies. Runs "
+        "against the configured database; everything is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sales", type=int, default=1_000_000)
+        parser.add_argument("--products", type=int, default=200)
+        parser.add_argument("--runs", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            shop = Shop.objects.create(name=f"Benchmark Shop {uuid.uuid4().hex[:8]}")
+            admin = User.objects.create_superuser(
+                username=f"benchmark-{uuid.uuid4().hex[:8]}", password=None
+            )
+            self._create_sales(shop, options["sales"], options["products"])
+
+            self.stdout.write(
+                f"{SaleEntry.objects.filter(shop=shop).count()} sales, "
+                f"{ShopDailyRollup.objects.filter(shop=shop).count()} daily and "
+                f"{ShopHourlyRollup.objects.filter(shop=shop).count()} hourly rollup rows"
+            )
+            today = timezone.localdate()
+            scenarios = {
+                "last 7 days": {},
+                "last 7 days, UTC": {"tz": "UTC"},
+                "last 365 days": {"start": str(today - timedelta(days=364))},
+            }
+            for label, params in scenarios.items():
+                timings = self._time_requests(shop, admin, params, options["runs"])
+                self.stdout.write(
+                    f"{label}: p50={statistics.median(timings):.1f} ms "
+                    f"p95={statistics.quantiles(timings, n=20)[-1]:.1f} ms "
+                    f"max={max(timings):.1f} ms"
+                )
+            transaction.set_rollback(True)
+
+    def _create_sales(self, shop, count, product_count):
+        products = Product.objects.bulk_create(
+            [
+                Product(shop=shop, name=f"Benchmark Item {i}", price=Decimal("1000.00"))
+                for i in range(product_count)
+            ]
+        )
+        buckets = [
+            (day, hour) for day in range(HISTORY_DAYS) for hour in OPENING_HOURS
+        ]
+        now = timezone.localtime()
+        created = 0
+        for index, (day, hour) in enumerate(buckets):
+            batch_size = (count - created) // (len(buckets) - index)
+            batch = SaleEntry.objects.bulk_create(
+                [
+                    SaleEntry(
+                        shop=shop,
+                        product=products[(created + i) % len(products)],
+                        quantity=Decimal("1.000"),
+                        selling_price=Decimal("1000.00"),
+                    )
+                    for i in range(batch_size)
+                ]
+            )
+            # recorded_at is auto_now_add, so backdate each batch afterwards
+            recorded_at = (now - timedelta(days=day)).replace(
+                hour=hour, minute=30, second=0, microsecond=0
+            )
+            SaleEntry.objects.filter(pk__in=[entry.pk for entry in batch]).update(
+                recorded_at=recorded_at
+            )
+            created += batch_size
+        call_command("rebuild_rollups", "--shop", str(shop.pk), stdout=self.stdout)
+
+    def _time_requests(self, shop, user, params, runs):
+        factory = APIRequestFactory()
+        view = ShopViewSet.as_view({"get": "stock_movement"})
+        timings = []
+        for _ in range(runs):
+            request = factory.get(f"/api/shops/{shop.pk}/stock-movement/", params)
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = view(request, pk=str(shop.pk))
+            response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(
+                    f"stock-movement returned {response.status_code}: {response.data}"
+                )
+        return timings
@@ -0,0 +1,24 @@
+# dukani/backend/api/management/commands/clear_expired_tokens.py
+
+from django.core.management.base import BaseCommand
+
+from api.auth.token_store import clear_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired login tokens from the AuthToken table, in batches. "
+        "Run it periodically (e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows deleted per DELETE statement.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = clear_expired_tokens(options["batch_size"])
+        self.stdout.write(f"Deleted {deleted} expired token(s)")
@@ -0,0 +1,19 @@
+# dukani/backend/api/management/commands/clear_unconfirmed_uploads.py
+
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+from api.uploads import sweep_unconfirmed_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes direct image uploads (uploads/ in the media bucket) whose "
+        "upload token expired without them being confirmed. Run it "
+        "periodically (e.g. daily from cron)."
+    )
+
+    def handle(self, *args, **options):
+        # Products and global products share the media storage
+        deleted = sweep_unconfirmed_uploads(Product._meta.get_field("image").storage)
+        self.stdout.write(f"Deleted {deleted} unconfirmed upload(s)")
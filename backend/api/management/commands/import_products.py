@@ -0,0 +1,49 @@
+# dukani/backend/api/management/commands/import_products.py
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import ImportFileError, ProductImport, read_rows
+from api.models import Shop
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a CSV or XLSX file of products with opening stock into a shop "
+        "(same format as POST /api/shops/<id>/import-products/)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("shop", help="ID of the shop to import into.")
+        parser.add_argument("path", help="Path of the .csv or .xlsx file.")
+
+    def handle(self, *args, **options):
+        try:
+            shop = Shop.objects.get(pk=options["shop"])
+        except (Shop.DoesNotExist, ValidationError):  # also ids that aren't UUIDs
+            raise CommandError(f"Shop {options['shop']} not found.")
+
+        product_import = ProductImport(shop)
+        try:
+            with open(options["path"], "rb") as file:
+                report = product_import.run(read_rows(file, options["path"]))
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except ImportFileError as exc:
+            raise CommandError(
+                f"{exc} ({product_import.created} product(s) imported before this.)"
+            )
+
+        for error in report["errors"]:
+            self.stdout.write(f"Row {error['row']}: {error['errors']}")
+        if report["error_count"] > len(report["errors"]):
+            self.stdout.write(
+                f"... and {report['error_count'] - len(report['errors'])} more row error(s)."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']} product(s) "
+                f"({report['linked_to_global_product']} linked to global products) "
+                f"and {report['stock_entries']} opening stock entries."
+            )
+        )
@@ -0,0 +1,32 @@
+# dukani/backend/api/management/commands/process_product_images.py
+
+from django.core.management.base import BaseCommand
+
+from api.images import queue_image_renditions
+from api.models import GlobalProduct, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Queues Product and GlobalProduct images that have no renditions or "
+        "content hashes yet (e.g. uploaded before the image pipeline existed) "
+        "for re-encoding, thumb/medium renditions and hashing by the run_jobs "
+        "worker."
+    )
+
+    def handle(self, *args, **options):
+        for model in (GlobalProduct, Product):
+            pending = (
+                model.objects.exclude(image="")
+                .exclude(image__isnull=True)
+                .only("id", "image", "image_renditions", "image_digest")
+            )
+            queued = 0
+            for instance in pending.iterator(chunk_size=200):
+                if (
+                    (instance.image_renditions or {}).get("source") != instance.image.name
+                    or not instance.image_digest
+                ):
+                    queue_image_renditions(instance)
+                    queued += 1
+            self.stdout.write(f"{model.__name__}: queued {queued} images")
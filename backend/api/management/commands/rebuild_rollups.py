@@ -0,0 +1,71 @@
+# dukani/backend/api/management/commands/rebuild_rollups.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import (
+    ROLLUP_MODELS,
+    MissedSaleEntry,
+    SaleEntry,
+    StockEntry,
+    rollup_deltas,
+)
+
+# Entries read from the database per round trip while rebuilding
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the daily/hourly shop and product rollup tables from raw "
+        "StockEntry/SaleEntry/MissedSaleEntry rows. Use it to backfill history "
+        "and after entries were changed without going through their save()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            help="Limit the rebuild to a single shop ID.",
+        )
+
+    def handle(self, *args, **options):
+        entry_querysets = [
+            StockEntry.objects.only(
+                "shop", "product", "quantity", "purchase_price", "recorded_at"
+            ),
+            SaleEntry.objects.only(
+                "shop", "product", "quantity", "selling_price", "recorded_at"
+            ),
+            MissedSaleEntry.objects.only(
+                "shop", "product", "quantity_requested", "unit_price", "recorded_at"
+            ),
+        ]
+        if options["shop"]:
+            entry_querysets = [
+                entries.filter(shop_id=options["shop"]) for entries in entry_querysets
+            ]
+
+        with transaction.atomic():
+            # Bucketing is done by the same code as the incremental updates, so
+            # a rebuilt table matches what entry saves would have produced.
+            deltas = None
+            for entries in entry_querysets:
+                deltas = rollup_deltas(
+                    entries.order_by().iterator(chunk_size=CHUNK_SIZE), deltas=deltas
+                )
+
+            for model in ROLLUP_MODELS:
+                stale = model.objects.all()
+                if options["shop"]:
+                    stale = stale.filter(shop_id=options["shop"])
+                stale.delete()
+                model.objects.bulk_create(
+                    [
+                        model(**dict(zip(model.key_fields, key)), **counters)
+                        for key, counters in deltas[model].items()
+                    ],
+                    batch_size=1000,
+                )
+                self.stdout.write(f"{model.__name__}: {len(deltas[model])} row(s)")
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt entry rollups."))
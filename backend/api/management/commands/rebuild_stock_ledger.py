@@ -0,0 +1,85 @@
+# dukani/backend/api/management/commands/rebuild_stock_ledger.py
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from api.models import Product, ProductStock, SaleEntry, StockEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the ProductStock ledger from raw StockEntry/SaleEntry rows. "
+        "With --verify, only reports products whose stored balance has drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Compare stored balances against the entries without writing.",
+        )
+        parser.add_argument(
+            "--shop",
+            help="Limit the rebuild/verification to a single shop ID.",
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        stock_entries = StockEntry.objects.all()
+        sale_entries = SaleEntry.objects.all()
+        if options["shop"]:
+            products = products.filter(shop_id=options["shop"])
+            stock_entries = stock_entries.filter(shop_id=options["shop"])
+            sale_entries = sale_entries.filter(shop_id=options["shop"])
+
+        with transaction.atomic():
+            # Lock the ledger rows while the totals are computed so concurrent
+            # entries cannot slip in between the aggregation and the write.
+            stored = dict(
+                ProductStock.objects.select_for_update()
+                .filter(product__in=products)
+                .values_list("product_id", "quantity")
+            )
+            received = self._totals_by_product(stock_entries)
+            sold = self._totals_by_product(sale_entries)
+
+            mismatches = []
+            for product_id in products.values_list("id", flat=True):
+                expected = received.get(product_id, Decimal("0.000")) - sold.get(
+                    product_id, Decimal("0.000")
+                )
+                actual = stored.get(product_id)
+                if actual is None or actual != expected:
+                    mismatches.append((product_id, actual, expected))
+
+            for product_id, actual, expected in mismatches:
+                self.stdout.write(
+                    f"Product {product_id}: stored={actual} expected={expected}"
+                )
+
+            if options["verify"]:
+                if mismatches:
+                    raise CommandError(
+                        f"{len(mismatches)} product stock balance(s) out of sync."
+                    )
+                self.stdout.write(self.style.SUCCESS("Stock ledger is consistent."))
+                return
+
+            for product_id, actual, expected in mismatches:
+                ProductStock.objects.update_or_create(
+                    product_id=product_id, defaults={"quantity": expected}
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {len(mismatches)} product stock balance(s).")
+        )
+
+    def _totals_by_product(self, entries):
+        return dict(
+            entries.values("product_id")
+            .annotate(total=Sum("quantity"))
+            .values_list("product_id", "total")
+        )
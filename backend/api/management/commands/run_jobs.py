@@ -0,0 +1,54 @@
+# dukani/backend/api/management/commands/run_jobs.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.images import sweep_staged_uploads
+from api.jobs import claim_next_job, run_job
+
+# Seconds between sweeps of abandoned staged uploads while the queue is idle
+SWEEP_INTERVAL = 600
+
+
+class Command(BaseCommand):
+    help = (
+        "Background worker: runs queued jobs (image uploads, renditions) from "
+        "the BackgroundJob table, retrying failures with backoff. Several "
+        "workers can run side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when no job is due instead of waiting for more.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before checking an empty queue again.",
+        )
+
+    def handle(self, *args, **options):
+        succeeded = failed = 0
+        last_sweep = None
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if last_sweep is None or time.monotonic() - last_sweep > SWEEP_INTERVAL:
+                    sweep_staged_uploads()
+                    last_sweep = time.monotonic()
+                if options["once"]:
+                    break
+                # Drop connections the database may have closed while idle
+                close_old_connections()
+                time.sleep(options["poll_interval"])
+                continue
+            if run_job(job):
+                succeeded += 1
+            else:
+                failed += 1
+        self.stdout.write(f"Ran {succeeded + failed} job(s), {failed} failed")
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_product_stock(apps, schema_editor):
+    """
+    Seeds the ledger from existing StockEntry/SaleEntry history.
+    """
+    Product = apps.get_model("api", "Product")
+    ProductStock = apps.get_model("api", "ProductStock")
+    StockEntry = apps.get_model("api", "StockEntry")
+    SaleEntry = apps.get_model("api", "SaleEntry")
+
+    received = dict(
+        StockEntry.objects.values("product_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_id", "total")
+    )
+    sold = dict(
+        SaleEntry.objects.values("product_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_id", "total")
+    )
+    ProductStock.objects.bulk_create(
+        [
+            ProductStock(
+                product_id=product_id,
+                quantity=(received.get(product_id) or Decimal("0.000"))
+                - (sold.get(product_id) or Decimal("0.000")),
+            )
+            for product_id in Product.objects.values_list("id", flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_invitetoken_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='api.product')),
+                ('quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product Stock',
+            },
+        ),
+        migrations.RunPython(backfill_product_stock, migrations.RunPython.noop),
+    ]
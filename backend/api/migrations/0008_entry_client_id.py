@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_productstock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missedsaleentry',
+            name='client_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='saleentry',
+            name='client_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stockentry',
+            name='client_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='missedsaleentry',
+            constraint=models.UniqueConstraint(fields=('shop', 'client_id'), name='unique_missedsaleentry_client_id_per_shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='saleentry',
+            constraint=models.UniqueConstraint(fields=('shop', 'client_id'), name='unique_saleentry_client_id_per_shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockentry',
+            constraint=models.UniqueConstraint(fields=('shop', 'client_id'), name='unique_stockentry_client_id_per_shop'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_authtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='missedsaleentry',
+            index=models.Index(fields=['shop', '-recorded_at', 'id'], name='missedsale_shop_recorded_id'),
+        ),
+        migrations.AddIndex(
+            model_name='saleentry',
+            index=models.Index(fields=['shop', '-recorded_at', 'id'], name='saleentry_shop_recorded_id'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentry',
+            index=models.Index(fields=['shop', '-recorded_at', 'id'], name='stockentry_shop_recorded_id'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_entry_shop_recorded_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['shop', 'barcode'], name='product_shop_barcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleentry',
+            index=models.Index(fields=['product', 'recorded_at'], name='saleentry_product_recorded'),
+        ),
+        migrations.AddIndex(
+            model_name='stockentry',
+            index=models.Index(fields=['product', 'recorded_at'], name='stockentry_product_recorded'),
+        ),
+        migrations.AddIndex(
+            model_name='worker',
+            index=models.Index(fields=['phone_number'], name='worker_phone_number_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-17 15:10
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# GIN trigram indexes for api.search. They are on UPPER(name) so that Django's
+# name__icontains (UPPER(name) LIKE UPPER(...)) can use them as well as the
+# similarity operators. PostgreSQL only; other databases skip them.
+TRIGRAM_INDEXES = [
+    ("api_product", "product_name_trgm"),
+    ("api_globalproduct", "globalproduct_name_trgm"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} "
+            f"USING gin (UPPER(name) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for _, index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_query_pattern_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.4 on 2026-10-17 16:10
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_in_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('stock_in_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('stock_in_count', models.IntegerField(default=0)),
+                ('sales_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('sales_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('missed_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('missed_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('missed_count', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='api.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'day'], name='productdaily_shop_day')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='unique_product_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_in_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('stock_in_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('stock_in_count', models.IntegerField(default=0)),
+                ('sales_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('sales_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('missed_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('missed_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('missed_count', models.IntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='api.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'hour'], name='producthourly_shop_hour')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'hour'), name='unique_product_hourly_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_in_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('stock_in_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('stock_in_count', models.IntegerField(default=0)),
+                ('sales_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('sales_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('missed_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('missed_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('missed_count', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='api.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'day'), name='unique_shop_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock_in_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('stock_in_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('stock_in_count', models.IntegerField(default=0)),
+                ('sales_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('sales_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('sales_count', models.IntegerField(default=0)),
+                ('missed_quantity', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14)),
+                ('missed_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('missed_count', models.IntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='api.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'hour'), name='unique_shop_hourly_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='globalproduct',
+            name='image_digest',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='globalproduct',
+            name='image_phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_digest',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_phash',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_unit_price(apps, schema_editor):
+    """
+    Prices existing linked missed sales at their product's current price,
+    which is what the rollups were built with so far.
+    """
+    MissedSaleEntry = apps.get_model("api", "MissedSaleEntry")
+    Product = apps.get_model("api", "Product")
+
+    MissedSaleEntry.objects.filter(product__isnull=False).update(
+        unit_price=Subquery(
+            Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_image_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='missedsaleentry',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_unit_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:15
+
+from django.db import migrations, models
+
+
+def drop_duplicate_pending_jobs(apps, schema_editor):
+    """Keeps the oldest pending job of each key, as enqueue() meant to."""
+    BackgroundJob = apps.get_model("api", "BackgroundJob")
+    seen = set()
+    duplicates = []
+    for pk, key in (
+        BackgroundJob.objects.filter(status="PENDING")
+        .exclude(key="")
+        .order_by("created_at", "id")
+        .values_list("pk", "key")
+    ):
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+    BackgroundJob.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_productimportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_pending_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='backgroundjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'PENDING'), models.Q(('key', ''), _negated=True)), fields=('key',), name='unique_pending_job_key'),
+        ),
+    ]
@@ -1,10 +1,10 @@
 # dukani/backend/api/models.py
 
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db.models import Sum
+from django.db.models import Case, F, Q, Sum, Value, When
 from decimal import Decimal
 from django.utils import timezone
 import string
@@ -107,6 +107,10 @@ class Worker(models.Model):
             "shop",
             "phone_number",
         )  # A phone number should be unique per shop
+        indexes = [
+            # Login looks workers up by phone number alone
+            models.Index(fields=["phone_number"], name="worker_phone_number_idx")
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name or ''} ({self.shop.name})"
@@ -141,6 +145,12 @@ class GlobalProduct(models.Model):
     image = models.ImageField(
         upload_to="global_product_images/", blank=True, null=True
     )  # CHANGED from image_url
+    # Resized copies of `image`, written by api/images.py
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # SHA-256 of the uploaded image bytes; identical uploads share files
+    image_digest = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Perceptual hash (api/image_matching.py) for finding similar images
+    image_phash = models.CharField(max_length=16, blank=True, default="")
     suggested_price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -198,6 +208,12 @@ class Product(models.Model):
     image = models.ImageField(
         upload_to="shop_product_images/", blank=True, null=True
     )  # CHANGED from image_url
+    # Resized copies of `image`, written by api/images.py
+    image_renditions = models.JSONField(default=dict, blank=True)
+    # SHA-256 of the uploaded image bytes; identical uploads share files
+    image_digest = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # Perceptual hash (api/image_matching.py) for finding similar images
+    image_phash = models.CharField(max_length=16, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -207,6 +223,10 @@ class Product(models.Model):
             "shop",
             "name",
         )  # A product name must be unique within a given shop
+        indexes = [
+            # Barcode scans resolve products within a shop
+            models.Index(fields=["shop", "barcode"], name="product_shop_barcode_idx")
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.shop.name})"
@@ -214,7 +234,21 @@ class Product(models.Model):
     @property
     def current_stock(self):
         """
-        Calculates the current stock of the product in this specific shop.
+        Returns the current stock of the product in this specific shop.
+        Reads the materialized ProductStock balance (a single primary key lookup),
+        so the cost does not grow with the product's entry history.
+        """
+        balance = (
+            ProductStock.objects.filter(product_id=self.pk)
+            .values_list("quantity", flat=True)
+            .first()
+        )
+        return balance if balance is not None else Decimal("0.000")
+
+    def compute_stock_from_entries(self):
+        """
+        Recomputes the stock from the raw StockEntry and SaleEntry rows.
+        Used to rebuild and verify the ProductStock ledger.
         """
         total_received = self.stock_received.aggregate(Sum("quantity"))[
             "quantity__sum"
@@ -225,6 +259,121 @@ class Product(models.Model):
         return total_received - total_sold
 
 
+# --- Product Stock Ledger Model ---
+class ProductStock(models.Model):
+    """
+    Materialized stock balance for a shop product. Kept up to date by
+    StockEntry/SaleEntry saves and deletes, inside the same transaction.
+    Rebuild it with `python manage.py rebuild_stock_ledger`.
+    """
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="stock"
+    )
+    quantity = models.DecimalField(
+        max_digits=14, decimal_places=3, default=Decimal("0.000")
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Product Stock"
+
+    def __str__(self):
+        return f"Stock balance: {self.product_id} = {self.quantity}"
+
+    @classmethod
+    def adjust(cls, product_id, delta):
+        """
+        Atomically adds `delta` (may be negative) to the product's balance,
+        creating the ledger row on first use.
+        """
+        if not delta:
+            return
+        updated = cls.objects.filter(product_id=product_id).update(
+            quantity=F("quantity") + delta, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(product_id=product_id)
+            cls.objects.filter(product_id=product_id).update(
+                quantity=F("quantity") + delta, updated_at=timezone.now()
+            )
+
+    @classmethod
+    def adjust_many(cls, deltas):
+        """
+        Applies several {product_id: delta} adjustments with one INSERT (for
+        missing ledger rows) and one UPDATE. Used by the bulk entry paths,
+        whose bulk_create() bypasses the entries' save().
+        """
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        cls.objects.bulk_create(
+            [cls(product_id=product_id) for product_id in deltas],
+            ignore_conflicts=True,
+        )
+        cls.objects.filter(product_id__in=deltas).update(
+            quantity=F("quantity")
+            + Case(
+                *[
+                    When(product_id=product_id, then=Value(delta))
+                    for product_id, delta in deltas.items()
+                ],
+                output_field=models.DecimalField(max_digits=14, decimal_places=3),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def locked_quantities(cls, product_ids):
+        """
+        Bulk variant of locked_quantity(): locks the ledger rows of all given
+        products in a consistent order (to avoid deadlocks) and returns
+        {product_id: quantity}, with 0 for products that have no row yet.
+        """
+        balances = dict(
+            cls.objects.select_for_update()
+            .filter(product_id__in=product_ids)
+            .order_by("product_id")
+            .values_list("product_id", "quantity")
+        )
+        return {
+            product_id: balances.get(product_id, Decimal("0.000"))
+            for product_id in product_ids
+        }
+
+    @classmethod
+    def locked_quantity(cls, product_id):
+        """
+        Returns the product's balance while holding a row lock on its ledger
+        row until the surrounding transaction ends. Only sales of the same
+        product wait on each other. Must be called inside transaction.atomic.
+        """
+        balance = (
+            cls.objects.select_for_update()
+            .filter(product_id=product_id)
+            .values_list("quantity", flat=True)
+            .first()
+        )
+        return balance if balance is not None else Decimal("0.000")
+
+
+def _record_stock_movement(entry, sign, previous=None):
+    """
+    Applies an entry's effect on the ProductStock ledger. `previous` is the
+    stored version of the entry before an update, if any.
+    """
+    if previous is not None:
+        ProductStock.adjust(previous.product_id, -sign * previous.quantity)
+    ProductStock.adjust(entry.product_id, sign * entry.quantity)
+
+
+def _previous_movement(entry):
+    if entry._state.adding:
+        return None
+    return type(entry).objects.filter(pk=entry.pk).first()
+
+
 # --- Stock Entry Model ---
 class StockEntry(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -256,14 +405,40 @@ class StockEntry(models.Model):
     notes = models.TextField(blank=True, null=True)
     recorded_at = models.DateTimeField(auto_now_add=True)
     is_synced = models.BooleanField(default=False)  # For mobile app synchronization
+    client_id = models.UUIDField(
+        blank=True, null=True
+    )  # Client-generated ID; makes offline-sync retries idempotent
 
     class Meta:
         verbose_name_plural = "Stock Entries"
         ordering = ["-recorded_at"]
+        indexes = [
+            # Entry lists/cursor pages: filter by shop, order by (-recorded_at, id)
+            models.Index(
+                fields=["shop", "-recorded_at", "id"], name="stockentry_shop_recorded_id"
+            ),
+            # Per-product history and stock/sales rollups
+            models.Index(
+                fields=["product", "recorded_at"], name="stockentry_product_recorded"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "client_id"],
+                name="unique_stockentry_client_id_per_shop",
+            )
+        ]
 
     def __str__(self):
         return f"Stock: {self.product.name} - {self.quantity} {self.product.quantity_type} in {self.shop.name}"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = _previous_movement(self)
+            super().save(*args, **kwargs)
+            _record_stock_movement(self, 1, previous)
+            record_rollups([self], replaced=previous)
+
 
 # --- Sale Entry Model ---
 class SaleEntry(models.Model):
@@ -290,14 +465,40 @@ class SaleEntry(models.Model):
     notes = models.TextField(blank=True, null=True)
     recorded_at = models.DateTimeField(auto_now_add=True)
     is_synced = models.BooleanField(default=False)  # For mobile app synchronization
+    client_id = models.UUIDField(
+        blank=True, null=True
+    )  # Client-generated ID; makes offline-sync retries idempotent
 
     class Meta:
         verbose_name_plural = "Sale Entries"
         ordering = ["-recorded_at"]
+        indexes = [
+            # Entry lists/cursor pages: filter by shop, order by (-recorded_at, id)
+            models.Index(
+                fields=["shop", "-recorded_at", "id"], name="saleentry_shop_recorded_id"
+            ),
+            # Per-product history and stock/sales rollups
+            models.Index(
+                fields=["product", "recorded_at"], name="saleentry_product_recorded"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "client_id"],
+                name="unique_saleentry_client_id_per_shop",
+            )
+        ]
 
     def __str__(self):
         return f"Sale: {self.product.name} - {self.quantity} {self.product.quantity_type} for {self.selling_price} in {self.shop.name}"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = _previous_movement(self)
+            super().save(*args, **kwargs)
+            _record_stock_movement(self, -1, previous)
+            record_rollups([self], replaced=previous)
+
 
 # --- Missed Sale Entry Model ---
 class MissedSaleEntry(models.Model):
@@ -327,29 +528,319 @@ class MissedSaleEntry(models.Model):
         decimal_places=3,
         validators=[MinValueValidator(Decimal("0.001"))],
     )
+    unit_price = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True, editable=False
+    )  # Linked product's price when the entry was recorded; values it in the rollups
     reason = models.TextField(
         blank=True, null=True
     )  # E.g., "Out of stock", "Not carried"
     notes = models.TextField(blank=True, null=True)
     recorded_at = models.DateTimeField(auto_now_add=True)
     is_synced = models.BooleanField(default=False)  # For mobile app synchronization
+    client_id = models.UUIDField(
+        blank=True, null=True
+    )  # Client-generated ID; makes offline-sync retries idempotent
 
     class Meta:
         verbose_name_plural = "Missed Sale Entries"
         ordering = ["-recorded_at"]
+        indexes = [
+            # Entry lists/cursor pages: filter by shop, order by (-recorded_at, id)
+            models.Index(
+                fields=["shop", "-recorded_at", "id"], name="missedsale_shop_recorded_id"
+            )
+        ]
         # Add a check to ensure either product or product_name_text is provided
         constraints = [
             models.CheckConstraint(
                 check=models.Q(product__isnull=False)
                 | models.Q(product_name_text__isnull=False),
                 name="product_or_product_name_text_required",
-            )
+            ),
+            models.UniqueConstraint(
+                fields=["shop", "client_id"],
+                name="unique_missedsaleentry_client_id_per_shop",
+            ),
         ]
 
     def __str__(self):
         product_info = self.product.name if self.product else self.product_name_text
         return f"Missed Sale: {product_info} - {self.quantity_requested} in {self.shop.name} ({self.reason})"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = _previous_movement(self)
+            # Priced once, so later price changes don't alter what the entry
+            # added to the rollups
+            if not self.product_id:
+                self.unit_price = None
+            elif previous is None or previous.product_id != self.product_id:
+                self.unit_price = self.product.price
+            super().save(*args, **kwargs)
+            record_rollups([self], replaced=previous)
+
+
+# --- Entry Rollup Models ---
+# Rollup keys matched per locking query in EntryRollup.adjust_many()
+ROLLUP_LOCK_CHUNK_SIZE = 200
+
+
+class EntryRollup(models.Model):
+    """
+    Stock received, sales and missed sales (quantity, value and number of
+    entries) for one shop or product over one local day or hour, in
+    settings.TIME_ZONE. Like ProductStock, kept up to date by entry saves and
+    deletes and by the bulk entry paths, so dashboards read a handful of rows
+    instead of aggregating raw entries. Rebuild with
+    `python manage.py rebuild_rollups`.
+    """
+
+    stock_in_quantity = models.DecimalField(
+        max_digits=14, decimal_places=3, default=Decimal("0.000")
+    )
+    stock_in_value = models.DecimalField(
+        max_digits=16, decimal_places=2, default=Decimal("0.00")
+    )  # At purchase price
+    stock_in_count = models.IntegerField(default=0)
+    sales_quantity = models.DecimalField(
+        max_digits=14, decimal_places=3, default=Decimal("0.000")
+    )
+    sales_value = models.DecimalField(
+        max_digits=16, decimal_places=2, default=Decimal("0.00")
+    )  # At selling price
+    sales_count = models.IntegerField(default=0)
+    missed_quantity = models.DecimalField(
+        max_digits=14, decimal_places=3, default=Decimal("0.000")
+    )
+    missed_value = models.DecimalField(
+        max_digits=16, decimal_places=2, default=Decimal("0.00")
+    )  # At the entry's unit_price; unlinked missed sales add no value
+    missed_count = models.IntegerField(default=0)
+
+    # Fields identifying a row, in the order of the keys passed to adjust_many()
+    key_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def adjust_many(cls, deltas):
+        """
+        Adds {key: {counter_field: delta}} to the rows with those keys,
+        creating missing rows first. Must be called inside transaction.atomic.
+        """
+        deltas = {key: counters for key, counters in deltas.items() if any(counters.values())}
+        if not deltas:
+            return
+        if len(deltas) == 1:
+            # A single entry's bucket row usually exists already: one UPDATE
+            [(key, counters)] = deltas.items()
+            row = dict(zip(cls.key_fields, key))
+            if not cls._add(row, counters):
+                cls.objects.bulk_create([cls(**row)], ignore_conflicts=True)
+                cls._add(row, counters)
+            return
+
+        # Lock exactly the existing rows with these keys, in key order so that
+        # concurrent callers take the locks in the same order and can't
+        # deadlock. Keys are matched ROLLUP_LOCK_CHUNK_SIZE at a time to keep
+        # each query's OR expression small.
+        keys = sorted(deltas)
+        existing = {}
+        for start in range(0, len(keys), ROLLUP_LOCK_CHUNK_SIZE):
+            key_filter = Q()
+            for key in keys[start : start + ROLLUP_LOCK_CHUNK_SIZE]:
+                key_filter |= Q(**dict(zip(cls.key_fields, key)))
+            for row in (
+                cls.objects.select_for_update()
+                .filter(key_filter)
+                .order_by(*cls.key_fields)
+            ):
+                existing[tuple(getattr(row, field) for field in cls.key_fields)] = row
+
+        changed_fields = set()
+        for key, row in existing.items():
+            for field, delta in deltas[key].items():
+                setattr(row, field, getattr(row, field) + delta)
+            changed_fields.update(deltas[key])
+        if existing:
+            cls.objects.bulk_update(
+                [existing[key] for key in keys if key in existing],
+                changed_fields,
+                batch_size=500,
+            )
+
+        missing = [key for key in keys if key not in existing]
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    [
+                        cls(**dict(zip(cls.key_fields, key)), **deltas[key])
+                        for key in missing
+                    ]
+                )
+        except IntegrityError:
+            # Another transaction created some of these rows in the meantime:
+            # create the rest empty, then add to all of them as existing rows.
+            cls.objects.bulk_create(
+                [cls(**dict(zip(cls.key_fields, key))) for key in missing],
+                ignore_conflicts=True,
+            )
+            cls.adjust_many({key: deltas[key] for key in missing})
+
+    @classmethod
+    def _add(cls, row, counters):
+        return cls.objects.filter(**row).update(
+            **{field: F(field) + Value(delta) for field, delta in counters.items()}
+        )
+
+
+class ShopDailyRollup(EntryRollup):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="daily_rollups")
+    day = models.DateField()
+
+    key_fields = ("shop_id", "day")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "day"], name="unique_shop_daily_rollup")
+        ]
+
+
+class ShopHourlyRollup(EntryRollup):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="hourly_rollups")
+    hour = models.DateTimeField()
+
+    key_fields = ("shop_id", "hour")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "hour"], name="unique_shop_hourly_rollup")
+        ]
+
+
+class ProductDailyRollup(EntryRollup):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_rollups"
+    )
+    day = models.DateField()
+
+    key_fields = ("shop_id", "product_id", "day")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "day"], name="unique_product_daily_rollup"
+            )
+        ]
+        indexes = [
+            # Per-product breakdowns of a shop's date range
+            models.Index(fields=["shop", "day"], name="productdaily_shop_day")
+        ]
+
+
+class ProductHourlyRollup(EntryRollup):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="hourly_rollups"
+    )
+    hour = models.DateTimeField()
+
+    key_fields = ("shop_id", "product_id", "hour")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "hour"], name="unique_product_hourly_rollup"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["shop", "hour"], name="producthourly_shop_hour")
+        ]
+
+
+def _rollup_contribution(entry):
+    """(counter prefix, quantity, value) an entry adds to its rollup buckets."""
+    if isinstance(entry, StockEntry):
+        price = entry.purchase_price or Decimal("0.00")
+        prefix, quantity = "stock_in", entry.quantity
+    elif isinstance(entry, SaleEntry):
+        price = entry.selling_price
+        prefix, quantity = "sales", entry.quantity
+    else:
+        price = entry.unit_price or Decimal("0.00")
+        prefix, quantity = "missed", entry.quantity_requested
+    return prefix, quantity, (quantity * price).quantize(Decimal("0.01"))
+
+
+def rollup_deltas(entries, sign=1, deltas=None):
+    """
+    Accumulates the entries' contributions (negated with sign=-1) as
+    {rollup model: {key: {counter_field: delta}}}.
+    """
+    if deltas is None:
+        deltas = {model: {} for model in ROLLUP_MODELS}
+    local_zone = timezone.get_default_timezone()
+    for entry in entries:
+        prefix, quantity, value = _rollup_contribution(entry)
+        local_time = timezone.localtime(entry.recorded_at, local_zone)
+        day = local_time.date()
+        hour = local_time.replace(minute=0, second=0, microsecond=0)
+        keys = {
+            ShopDailyRollup: (entry.shop_id, day),
+            ShopHourlyRollup: (entry.shop_id, hour),
+        }
+        if entry.product_id:
+            keys[ProductDailyRollup] = (entry.shop_id, entry.product_id, day)
+            keys[ProductHourlyRollup] = (entry.shop_id, entry.product_id, hour)
+        for model, key in keys.items():
+            counters = deltas[model].setdefault(key, {})
+            for field, delta in (
+                (f"{prefix}_quantity", sign * quantity),
+                (f"{prefix}_value", sign * value),
+                (f"{prefix}_count", sign),
+            ):
+                counters[field] = counters.get(field, 0) + delta
+    return deltas
+
+
+def record_rollups(entries, sign=1, replaced=None, product_rows=True):
+    """
+    Applies the entries' effect on the rollup tables. `replaced` is the stored
+    version of a single entry before an update, whose effect is taken back.
+    With product_rows=False only the shop rows are updated (for entries of a
+    product being deleted, whose rows go with it).
+
+    Product rows are updated in the caller's transaction. Every entry of a
+    shop shares its shop rows, so those are updated in a short transaction of
+    their own after the caller's commits; holding their row locks until then
+    would queue up the shop's concurrent sales of different products. If the
+    process dies in between, rebuild_rollups repairs the shop rows.
+    """
+    deltas = rollup_deltas(entries, sign)
+    if replaced is not None:
+        rollup_deltas([replaced], -sign, deltas)
+    if product_rows:
+        for model in PRODUCT_ROLLUP_MODELS:
+            model.adjust_many(deltas[model])
+    shop_deltas = {model: deltas[model] for model in SHOP_ROLLUP_MODELS}
+    if any(shop_deltas.values()):
+        transaction.on_commit(lambda: _apply_shop_rollups(shop_deltas), robust=True)
+
+
+def _apply_shop_rollups(deltas):
+    with transaction.atomic():
+        for model, model_deltas in deltas.items():
+            model.adjust_many(model_deltas)
+
+
+SHOP_ROLLUP_MODELS = (ShopDailyRollup, ShopHourlyRollup)
+PRODUCT_ROLLUP_MODELS = (ProductDailyRollup, ProductHourlyRollup)
+ROLLUP_MODELS = SHOP_ROLLUP_MODELS + PRODUCT_ROLLUP_MODELS
+
 
 class InviteToken(models.Model):
     worker = models.OneToOneField(
@@ -400,3 +891,173 @@ class InviteToken(models.Model):
 
     def __str__(self):
         return f"InviteToken(code={self.code}, worker={self.worker}, shop={self.shop})"
+
+
+# --- Sync Tombstone Model ---
+class SyncTombstone(models.Model):
+    """
+    Records deletions of synced objects so the mobile delta sync can tell
+    clients what to remove. Written by the post_delete receivers in api.signals.
+    """
+
+    # Plain UUID rather than a ForeignKey: tombstones are written while a shop's
+    # products/entries are being cascade-deleted together with the shop itself.
+    shop_id = models.UUIDField()
+    object_type = models.CharField(max_length=30)
+    object_id = models.UUIDField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["deleted_at", "id"]
+        indexes = [
+            models.Index(
+                fields=["shop_id", "deleted_at", "id"],
+                name="synctombstone_shop_deleted",
+            )
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.object_type} {self.object_id} at {self.deleted_at}"
+
+
+# --- Auth Token Model ---
+class AuthToken(models.Model):
+    """
+    Login token issued by dummy_login to either a manager (User) or a Worker.
+    Stored in the database so every server process sees the same tokens;
+    api.auth.token_store keeps a small per-process cache in front of it.
+    """
+
+    key = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="auth_tokens",
+    )
+    worker = models.ForeignKey(
+        "Worker",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="auth_tokens",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(user__isnull=False, worker__isnull=True)
+                    | models.Q(user__isnull=True, worker__isnull=False)
+                ),
+                name="authtoken_user_xor_worker",
+            )
+        ]
+
+    def is_valid(self):
+        return timezone.now() < self.expires_at
+
+    def __str__(self):
+        owner = self.worker if self.worker_id else self.user
+        return f"AuthToken({owner}, expires {self.expires_at})"
+
+
+# --- Background Job Model ---
+JOB_PENDING = "PENDING"
+JOB_RUNNING = "RUNNING"
+JOB_FAILED = "FAILED"
+JOB_STATUS_CHOICES = [
+    (JOB_PENDING, "Pending"),
+    (JOB_RUNNING, "Running"),
+    (JOB_FAILED, "Failed"),  # Gave up after JOB_MAX_ATTEMPTS
+]
+
+
+class BackgroundJob(models.Model):
+    """
+    A unit of work for the run_jobs worker command (see api.jobs), queued in
+    the database so no message broker is needed. Jobs are deleted once they
+    succeed; failed ones stay for inspection.
+    """
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    # Jobs with a key are queued at most once while pending (enforced by
+    # unique_pending_job_key)
+    key = models.CharField(max_length=200, blank=True, default="")
+    status = models.CharField(
+        max_length=10, choices=JOB_STATUS_CHOICES, default=JOB_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A RUNNING job whose worker died is picked up again after this time
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after"),
+            models.Index(fields=["key"], name="job_key"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key"],
+                condition=Q(status=JOB_PENDING) & ~Q(key=""),
+                name="unique_pending_job_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"BackgroundJob({self.kind}, {self.status}, attempt {self.attempts})"
+
+
+# --- Product Import Model ---
+IMPORT_PENDING = "PENDING"
+IMPORT_RUNNING = "RUNNING"
+IMPORT_DONE = "DONE"
+IMPORT_FAILED = "FAILED"
+IMPORT_STATUS_CHOICES = [
+    (IMPORT_PENDING, "Pending"),
+    (IMPORT_RUNNING, "Running"),
+    (IMPORT_DONE, "Done"),
+    (IMPORT_FAILED, "Failed"),
+]
+
+
+class ProductImportJob(models.Model):
+    """
+    A product import file uploaded through the API, imported by the run_jobs
+    worker (see api.imports). Records progress after each chunk, so a run
+    that was interrupted resumes after the last imported row.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="product_imports")
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True, related_name="+"
+    )
+    filename = models.CharField(max_length=255)
+    # The uploaded file in staging storage until the import has finished
+    staged_name = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(
+        max_length=10, choices=IMPORT_STATUS_CHOICES, default=IMPORT_PENDING
+    )
+    # Spreadsheet row number up to which the file has been imported
+    rows_done = models.PositiveIntegerField(default=0)
+    report = models.JSONField(default=dict, blank=True)
+    # Why the file as a whole could not be (fully) imported
+    detail = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"ProductImportJob({self.filename}, {self.status}, row {self.rows_done})"
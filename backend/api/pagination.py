@@ -0,0 +1,61 @@
+# dukani/backend/api/pagination.py
+
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+
+# Largest page a client may ask for with ?page_size=
+MAX_PAGE_SIZE = 100
+
+
+class EntryPageNumberPagination(PageNumberPagination):
+    page_size_query_param = "page_size"
+    max_page_size = MAX_PAGE_SIZE
+
+
+class EntryCursorPagination(CursorPagination):
+    # Matches the (shop, -recorded_at, id) index on the entry tables. The
+    # cursor holds recorded_at only; id just makes the order stable.
+    ordering = ("-recorded_at", "id")
+    page_size_query_param = "page_size"
+    max_page_size = MAX_PAGE_SIZE
+
+
+class EntryPagination(BasePagination):
+    """
+    Pagination for the stock/sale/missed-sale entry lists.
+
+    By default pages are numbered (?page=N, with a total 'count') for the web
+    dashboard. Passing ?pagination=cursor switches to DRF's cursor pagination:
+    no COUNT(*), and each page starts from the recorded_at of the previous
+    one, with an offset only across rows that share that timestamp, so deep
+    pages cost about the same as the first. Follow the 'next'/'previous'
+    links, which carry the ?cursor=. Both modes accept ?page_size= up to
+    MAX_PAGE_SIZE.
+    """
+
+    def __init__(self):
+        self.page_number_paginator = EntryPageNumberPagination()
+        self.cursor_paginator = EntryCursorPagination()
+        self.paginator = self.page_number_paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        use_cursor = (
+            request.query_params.get("pagination") == "cursor"
+            or self.cursor_paginator.cursor_query_param in request.query_params
+        )
+        self.paginator = (
+            self.cursor_paginator if use_cursor else self.page_number_paginator
+        )
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_paginator.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number_paginator.get_schema_operation_parameters(view)
@@ -2,7 +2,9 @@
 
 from rest_framework import permissions
 from django.core.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError as DjangoValidationError
 from api.models import Shop, Worker # Import necessary models
+from api.auth.principal import managed_shop_ids
 
 class IsManagerOfShop(permissions.BasePermission):
     """
@@ -35,17 +37,18 @@ class IsManagerOfShop(permissions.BasePermission):
                 # If shop ID is missing, let serializer validation handle it as a Bad Request.
                 # For permission, we cannot grant if we don't know the shop.
                 return False 
+            # Check if the requesting user manages this shop
+            if str(shop_id) in {str(pk) for pk in managed_shop_ids(user)}:
+                return True # User manages the shop, grant permission for create
             try:
-                shop = Shop.objects.get(id=shop_id)
-                # Check if the requesting user manages this shop
-                if not shop.managers.filter(id=user.id).exists():
+                if Shop.objects.filter(id=shop_id).exists():
                     # Explicitly raise PermissionDenied if user does not manage the shop for create action
                     raise PermissionDenied("You do not have permission to add workers to this shop.")
-                return True # User manages the shop, grant permission for create
-            except Shop.DoesNotExist:
-                # If shop does not exist, this is a validation error.
-                # For permission, we deny access as the target shop is invalid.
-                return False 
+            except DjangoValidationError:
+                pass
+            # If shop does not exist, this is a validation error.
+            # For permission, we deny access as the target shop is invalid.
+            return False
         
         # For other write actions (update, destroy), has_object_permission will be called.
         return True # Defer to has_object_permission for object-level checks
@@ -60,7 +63,7 @@ class IsManagerOfShop(permissions.BasePermission):
         # Check if the object has a 'shop' attribute
         if hasattr(obj, 'shop'):
             # Check if the requesting user manages the shop associated with the object
-            return user.managed_shops.filter(id=obj.shop.id).exists()
+            return obj.shop_id in managed_shop_ids(user)
         
         # If the object does not have a 'shop' attribute, this permission might not apply
         # or it might indicate an attempt to access an unrelated object.
@@ -92,7 +95,7 @@ class IsWorkerOfShop(permissions.BasePermission):
                 # If shop ID is not provided in data, it's an invalid request for this permission
                 return False
 
-            return str(request.user.worker.shop.id) == requested_shop_id
+            return str(request.user.worker.shop_id) == str(requested_shop_id)
         return False # Deny other methods by default
 
     def has_object_permission(self, request, view, obj):
@@ -100,7 +103,7 @@ class IsWorkerOfShop(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             if request.user.is_superuser:
                 return True
-            return hasattr(request.user, 'worker') and request.user.worker.shop == obj.shop
+            return hasattr(request.user, 'worker') and request.user.worker.shop_id == obj.shop_id
 
         # Write permissions are typically not allowed for workers on entries they didn't create
         # or for modifying existing entries. This permission is primarily for creation.
@@ -131,13 +134,13 @@ class IsManagerOrAdmin(permissions.BasePermission):
             # Check if the user is a manager of *any* shop.
             # This is a broad check for creating new shops/workers.
             # For object-level permissions, more specific checks are needed.
-            return request.user.managed_shops.exists()
+            return bool(managed_shop_ids(request.user))
         return False
 
     def has_object_permission(self, request, view, obj):
         if request.user.is_superuser:
             return True
-        if hasattr(obj, 'shop') and request.user in obj.shop.managers.all():
+        if hasattr(obj, 'shop') and obj.shop_id in managed_shop_ids(request.user):
             return True
         return False
 
@@ -167,7 +170,7 @@ class IsWorkerOfRelatedShop(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         if hasattr(request.user, 'worker') and hasattr(obj, 'shop'):
-            return request.user.worker.shop == obj.shop
+            return request.user.worker.shop_id == obj.shop_id
         return False
 
 
@@ -184,7 +187,7 @@ class IsManagerOfRelatedShop(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_superuser:
             return True
-        if hasattr(obj, 'shop') and request.user in obj.shop.managers.all():
+        if hasattr(obj, 'shop') and obj.shop_id in managed_shop_ids(request.user):
             return True
         return False
 
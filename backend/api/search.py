@@ -0,0 +1,41 @@
+# dukani/backend/api/search.py
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Length, Upper
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+
+
+def search_by_name_or_barcode(queryset, query, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Returns the best `limit` rows of `queryset` (Product or GlobalProduct)
+    whose name matches `query` or whose barcode equals it.
+
+    On PostgreSQL names also match on pg_trgm word similarity, so small typos
+    ("sukkari" for "Sukari") still find the product, and results are ranked by
+    similarity, then shortest name. Both the substring and the similarity
+    tests are served by the GIN trigram index on UPPER(name) (migration 0013).
+    Other databases (SQLite in tests) fall back to a substring match, shortest
+    names first.
+    """
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        return list(
+            queryset.alias(name_upper=Upper("name"))
+            .filter(
+                Q(name__icontains=query)
+                | Q(name_upper__trigram_word_similar=query)
+                | Q(barcode=query)
+            )
+            .annotate(rank=TrigramWordSimilarity(query, "name"))
+            .order_by("-rank", Length("name"), "name")[:limit]
+        )
+
+    return list(
+        queryset.filter(Q(name__icontains=query) | Q(barcode=query)).order_by(
+            Length("name"), "name"
+        )[:limit]
+    )
@@ -5,7 +5,7 @@ from django.contrib.auth.models import User
 from decimal import Decimal
 from django.db import transaction
 from django.db.utils import IntegrityError
-from django.db.models import F
+from django.db.models import F, Q
 from django.core.files.uploadedfile import InMemoryUploadedFile  # For image handling
 import imghdr  # To validate image type
 
@@ -19,13 +19,112 @@ from .models import (
     SaleEntry,
     MissedSaleEntry,
     ShopCategory,
+    ProductStock,
+    ProductImportJob,
     QUANTITY_TYPE_CHOICES,
     QUALITY_TYPE_CHOICES,
     PRODUCT_STATUS_CHOICES,
     UNIT,
     PENDING_REVIEW,
     LINKED,
+    record_rollups,
 )
+from .autocomplete import prefix_indexes
+from .barcodes import forget_barcode_miss
+from .images import rendition_urls, stage_image_upload
+
+
+# --- Idempotent create support for offline sync ---
+class ClientIdempotentCreateMixin:
+    """
+    Lets the mobile app retry entry uploads safely. An entry posted with a
+    `client_id` that already exists for the shop is returned as-is instead of
+    being inserted again; the (shop, client_id) unique index backs this up
+    when two retries race.
+    """
+
+    def _find_replay(self, validated_data):
+        client_id = validated_data.get("client_id")
+        if client_id is None:
+            return None
+        return self.Meta.model.objects.filter(
+            shop=validated_data["shop"], client_id=client_id
+        ).first()
+
+    def _create_once(self, validated_data, create):
+        existing = self._find_replay(validated_data)
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                return create(validated_data)
+        except IntegrityError:
+            # A concurrent retry inserted the same client_id first
+            existing = self._find_replay(validated_data)
+            if existing is None:
+                raise
+            return existing
+
+
+def _partition_replayed_lines(model, shop, lines):
+    """
+    Splits bulk lines into those already stored (matched by client_id) and
+    those still to insert. Returns ({client_id: entry}, pending_lines); a
+    client_id repeated within the batch is inserted once.
+    """
+    client_ids = {line["client_id"] for line in lines if line.get("client_id")}
+    replayed = (
+        {
+            entry.client_id: entry
+            for entry in model.objects.filter(shop=shop, client_id__in=client_ids)
+        }
+        if client_ids
+        else {}
+    )
+    pending, seen = [], set(replayed)
+    for line in lines:
+        client_id = line.get("client_id")
+        if client_id:
+            if client_id in seen:
+                continue
+            seen.add(client_id)
+        pending.append(line)
+    return replayed, pending
+
+
+def _ordered_bulk_results(lines, pending, created, replayed):
+    """
+    Returns one entry per input line, in input order, mixing new and replayed entries.
+    """
+    by_client_id = dict(replayed)
+    by_line = {}
+    for line, entry in zip(pending, created):
+        by_line[id(line)] = entry
+        if line.get("client_id"):
+            by_client_id[line["client_id"]] = entry
+    return [
+        by_line.get(id(line)) or by_client_id[line["client_id"]] for line in lines
+    ]
+
+
+# --- Image uploads through the background worker ---
+class StagedImageUploadMixin:
+    """
+    For serializers with an `image` field: an uploaded file is staged locally
+    and stored by the background worker (api.images.stage_image_upload)
+    instead of being written to MediaStorage during the request. Clearing the
+    image (null) still applies immediately.
+    """
+
+    def save(self, **kwargs):
+        image = self.validated_data.get("image")
+        if image:
+            del self.validated_data["image"]
+        with transaction.atomic():
+            instance = super().save(**kwargs)
+            if image:
+                stage_image_upload(instance, image)
+        return instance
 
 
 # --- ShopCategory Serializer ---
@@ -152,7 +251,7 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 # --- GlobalProduct Serializer ---
-class GlobalProductSerializer(serializers.ModelSerializer):
+class GlobalProductSerializer(StagedImageUploadMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(), allow_null=True, required=False
     )
@@ -160,6 +259,7 @@ class GlobalProductSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(
         required=False, allow_null=True, use_url=False
     )  # REMOVED THIS LINE
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = GlobalProduct
@@ -169,6 +269,7 @@ class GlobalProductSerializer(serializers.ModelSerializer):
             "barcode",
             "description",
             "image",
+            "image_renditions",
             "suggested_price",
             "category",
             "category_name",
@@ -177,9 +278,12 @@ class GlobalProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj)
+
 
 # --- Product Serializer (Shop-Specific Product) ---
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(StagedImageUploadMixin, serializers.ModelSerializer):
     shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
     shop_name = serializers.CharField(source="shop.name", read_only=True)
 
@@ -201,6 +305,7 @@ class ProductSerializer(serializers.ModelSerializer):
     image = serializers.ImageField(
         required=False, allow_null=True, use_url=False
     )  # REMOVED THIS LINE
+    image_renditions = serializers.SerializerMethodField()
     quality_type = serializers.ChoiceField(
         choices=QUALITY_TYPE_CHOICES, required=False, allow_blank=True, allow_null=True
     )
@@ -249,6 +354,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "quantity_type",
             "quality_type",
             "image",
+            "image_renditions",
             "status",
             "created_at",
             "updated_at",
@@ -260,6 +366,9 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "updated_at"]
 
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj)
+
     def validate(self, data):
         global_product_id = data.get("global_product_id")
         new_global_product_name = data.get("new_global_product_name")
@@ -369,7 +478,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 # --- StockEntry Serializer ---
-class StockEntrySerializer(serializers.ModelSerializer):
+class StockEntrySerializer(ClientIdempotentCreateMixin, serializers.ModelSerializer):
     shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
     worker = serializers.PrimaryKeyRelatedField(queryset=Worker.objects.all())
 
@@ -427,8 +536,11 @@ class StockEntrySerializer(serializers.ModelSerializer):
             "notes",
             "recorded_at",
             "is_synced",
+            "client_id",
         ]
         read_only_fields = ["recorded_at", "is_synced"]
+        # Replays of an existing (shop, client_id) are handled in create()
+        validators = []
 
     def validate_image_file(self, value):
         if value:
@@ -521,6 +633,9 @@ class StockEntrySerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
+        return self._create_once(validated_data, self._create_entry)
+
+    def _create_entry(self, validated_data):
         product_instance = validated_data.get("product")
         product_name_text = validated_data.pop("product_name_text", None)
         barcode_text = validated_data.pop("barcode_text", None)
@@ -563,11 +678,13 @@ class StockEntrySerializer(serializers.ModelSerializer):
                     "price": validated_data.get(
                         "purchase_price", Decimal("0.00")
                     ),  # Use purchase price as initial selling price
-                    "image": image_file,  # Assign the uploaded image
                     "global_product": None,  # No global product linked initially
                     "status": PENDING_REVIEW,  # Mark for manager review
                 }
                 product_instance = Product.objects.create(**new_product_data)
+                if image_file:
+                    # Stored by the background worker once this commits
+                    stage_image_upload(product_instance, image_file)
 
         # Assign the found/created product instance to the validated data for StockEntry
         validated_data["product"] = product_instance
@@ -575,8 +692,196 @@ class StockEntrySerializer(serializers.ModelSerializer):
         return stock_entry
 
 
+# --- Bulk StockEntry Serializers (supplier deliveries) ---
+class StockEntryLineSerializer(serializers.Serializer):
+    # Plain UUID rather than PrimaryKeyRelatedField: products are resolved for
+    # the whole delivery with a single query in StockEntryBulkSerializer.validate.
+    product = serializers.UUIDField(required=False, allow_null=True)
+    product_name_text = serializers.CharField(
+        max_length=255, required=False, allow_blank=True
+    )
+    barcode_text = serializers.CharField(
+        max_length=100, required=False, allow_blank=True
+    )
+    product_quantity_type = serializers.ChoiceField(
+        choices=QUANTITY_TYPE_CHOICES, required=False
+    )
+    product_quality_type = serializers.ChoiceField(
+        choices=QUALITY_TYPE_CHOICES, required=False, allow_blank=True, allow_null=True
+    )
+    quantity = serializers.DecimalField(
+        max_digits=10, decimal_places=3, min_value=Decimal("0.001")
+    )
+    purchase_price = serializers.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        required=False,
+        allow_null=True,
+        min_value=Decimal("0.00"),
+    )
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    client_id = serializers.UUIDField(required=False, allow_null=True)
+
+
+class StockEntryBulkSerializer(serializers.Serializer):
+    shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
+    worker = serializers.PrimaryKeyRelatedField(queryset=Worker.objects.all())
+    lines = StockEntryLineSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        shop = data["shop"]
+        worker = data["worker"]
+        lines = data["lines"]
+
+        # Validate worker belongs to shop
+        if worker.shop_id != shop.id:
+            raise serializers.ValidationError(
+                {"worker": "Worker is not assigned to the specified shop."}
+            )
+
+        # Resolve product IDs, names and barcodes for the whole delivery with one query
+        product_ids = {line["product"] for line in lines if line.get("product")}
+        names = {line["product_name_text"] for line in lines if line.get("product_name_text")}
+        barcodes = {line["barcode_text"] for line in lines if line.get("barcode_text")}
+        by_id, by_name, by_barcode = {}, {}, {}
+        for product in Product.objects.filter(shop=shop).filter(
+            Q(id__in=product_ids) | Q(name__in=names) | Q(barcode__in=barcodes)
+        ):
+            by_id[product.id] = product
+            by_name[product.name] = product
+            if product.barcode:
+                by_barcode.setdefault(product.barcode, product)
+
+        line_errors = []
+        for line in lines:
+            line_errors.append(
+                self._resolve_line(line, shop, by_id, by_name, by_barcode)
+            )
+        if any(line_errors):
+            raise serializers.ValidationError({"lines": line_errors})
+        return data
+
+    def _resolve_line(self, line, shop, by_id, by_name, by_barcode):
+        """
+        Applies StockEntrySerializer's rules to one line and replaces its product
+        ID with the matching Product (or None for a product to be created).
+        Returns the line's errors.
+        """
+        product_id = line.get("product")
+        product_name_text = line.get("product_name_text")
+        barcode_text = line.get("barcode_text")
+
+        if product_id and (product_name_text or barcode_text):
+            return {
+                "product": "Cannot provide both an existing 'product' ID and new product details ('product_name_text' or 'barcode_text')."
+            }
+        if not product_id and not (product_name_text or barcode_text):
+            return {
+                "product": "Either 'product' ID or new product details ('product_name_text' or 'barcode_text') must be provided."
+            }
+
+        if product_id:
+            product = by_id.get(product_id)
+            if product is None:
+                return {"product": "Product is not assigned to the specified shop."}
+        else:
+            # Same lookup order as StockEntrySerializer.create: name, then barcode
+            product = by_name.get(product_name_text) or by_barcode.get(barcode_text)
+            if product is None and not product_name_text:
+                return {
+                    "product_name_text": "Product name is required when creating a new product."
+                }
+            if product is None and shop.require_image_upload:
+                return {
+                    "product_name_text": "Image upload is required for new products in this shop; add this product individually."
+                }
+        line["product"] = product
+
+        target_product_type = (
+            product.quantity_type if product else line.get("product_quantity_type", UNIT)
+        )
+        if target_product_type == UNIT and line["quantity"] % 1 != 0:
+            return {
+                "quantity": f"Quantity must be a whole number for '{UNIT}' type products."
+            }
+        return {}
+
+    @transaction.atomic
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return self._create_entries(validated_data)
+        except IntegrityError:
+            # A concurrent retry of the same queue stored some lines first;
+            # a second pass returns those as replays.
+            return self._create_entries(validated_data)
+
+    def _create_entries(self, validated_data):
+        shop = validated_data["shop"]
+        worker = validated_data["worker"]
+        replayed, lines = _partition_replayed_lines(
+            StockEntry, shop, validated_data["lines"]
+        )
+
+        # Create the products that did not resolve, once per name
+        new_products = {}
+        for line in lines:
+            if line["product"] is None and line["product_name_text"] not in new_products:
+                new_products[line["product_name_text"]] = Product(
+                    shop=shop,
+                    name=line["product_name_text"],
+                    barcode=line.get("barcode_text") or None,
+                    quantity_type=line.get("product_quantity_type", UNIT),
+                    quality_type=line.get("product_quality_type"),
+                    price=line.get("purchase_price") or Decimal("0.00"),
+                    global_product=None,
+                    status=PENDING_REVIEW,
+                )
+        if new_products:
+            # ignore_conflicts + re-read, so a product created concurrently
+            # under the same name is reused instead of failing the delivery
+            Product.objects.bulk_create(new_products.values(), ignore_conflicts=True)
+            # bulk_create() sends no post_save, so do the receivers' work here
+            prefix_indexes.invalidate(shop.pk)
+            for product in new_products.values():
+                forget_barcode_miss(shop.pk, product.barcode)
+            new_products = {
+                product.name: product
+                for product in Product.objects.filter(
+                    shop=shop, name__in=list(new_products)
+                )
+            }
+
+        stock_entries = []
+        received = {}
+        for line in lines:
+            product = line["product"] or new_products[line["product_name_text"]]
+            stock_entries.append(
+                StockEntry(
+                    shop=shop,
+                    worker=worker,
+                    product=product,
+                    quantity=line["quantity"],
+                    purchase_price=line.get("purchase_price"),
+                    notes=line.get("notes"),
+                    client_id=line.get("client_id"),
+                )
+            )
+            received[product.pk] = (
+                received.get(product.pk, Decimal("0.000")) + line["quantity"]
+            )
+
+        stock_entries = StockEntry.objects.bulk_create(stock_entries)
+        # bulk_create() skips StockEntry.save(), so update the ledger here
+        ProductStock.adjust_many(received)
+        record_rollups(stock_entries)
+        return _ordered_bulk_results(
+            validated_data["lines"], lines, stock_entries, replayed
+        )
+
+
 # --- SaleEntry Serializer ---
-class SaleEntrySerializer(serializers.ModelSerializer):
+class SaleEntrySerializer(ClientIdempotentCreateMixin, serializers.ModelSerializer):
     shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
     worker = serializers.PrimaryKeyRelatedField(queryset=Worker.objects.all())
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
@@ -593,8 +898,11 @@ class SaleEntrySerializer(serializers.ModelSerializer):
             "notes",
             "recorded_at",
             "is_synced",
+            "client_id",
         ]
         read_only_fields = ["recorded_at", "is_synced"]
+        # Replays of an existing (shop, client_id) are handled in create()
+        validators = []
 
     def validate(self, data):
         product = data["product"]
@@ -626,14 +934,20 @@ class SaleEntrySerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
+        return self._create_once(validated_data, self._create_entry)
+
+    def _create_entry(self, validated_data):
         product = validated_data["product"]
         quantity = validated_data["quantity"]
 
-        # Check if there's enough stock
-        if product.current_stock < quantity:
+        # Check if there's enough stock. The product's ledger row stays locked
+        # until this transaction commits, so two workers selling the last unit
+        # cannot both pass the check; sales of other products are not blocked.
+        current_stock = ProductStock.locked_quantity(product.pk)
+        if current_stock < quantity:
             raise serializers.ValidationError(
                 {
-                    "quantity": f"Not enough stock for {product.name}. Current stock: {product.current_stock}"
+                    "quantity": f"Not enough stock for {product.name}. Current stock: {current_stock}"
                 }
             )
 
@@ -641,8 +955,135 @@ class SaleEntrySerializer(serializers.ModelSerializer):
         return sale_entry
 
 
+# --- Bulk SaleEntry Serializers (checkout baskets) ---
+class SaleEntryLineSerializer(serializers.Serializer):
+    # Plain UUID rather than PrimaryKeyRelatedField: products are resolved for
+    # the whole basket with a single query in SaleEntryBulkSerializer.validate.
+    product = serializers.UUIDField()
+    quantity = serializers.DecimalField(
+        max_digits=10, decimal_places=3, min_value=Decimal("0.001")
+    )
+    selling_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal("0.00")
+    )
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    client_id = serializers.UUIDField(required=False, allow_null=True)
+
+
+class SaleEntryBulkSerializer(serializers.Serializer):
+    shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
+    worker = serializers.PrimaryKeyRelatedField(queryset=Worker.objects.all())
+    lines = SaleEntryLineSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        shop = data["shop"]
+        worker = data["worker"]
+        lines = data["lines"]
+
+        # Validate that the worker belongs to the specified shop
+        if worker.shop_id != shop.id:
+            raise serializers.ValidationError(
+                {"worker": "Worker is not assigned to the specified shop."}
+            )
+
+        # Resolve every product in the basket with one query
+        products = Product.objects.filter(
+            shop=shop, id__in={line["product"] for line in lines}
+        ).in_bulk()
+
+        line_errors = []
+        for line in lines:
+            errors = {}
+            product = products.get(line["product"])
+            if product is None:
+                errors["product"] = "Product is not assigned to the specified shop."
+            else:
+                line["product"] = product
+                if product.quantity_type == UNIT and line["quantity"] % 1 != 0:
+                    errors["quantity"] = (
+                        f"Quantity must be a whole number for '{UNIT}' type products."
+                    )
+            line_errors.append(errors)
+
+        if any(line_errors):
+            raise serializers.ValidationError({"lines": line_errors})
+        return data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return self._create_entries(validated_data)
+        except IntegrityError:
+            # A concurrent retry of the same basket stored some lines first;
+            # a second pass returns those as replays.
+            return self._create_entries(validated_data)
+
+    def _create_entries(self, validated_data):
+        shop = validated_data["shop"]
+        worker = validated_data["worker"]
+        # Lines already stored by an earlier attempt are not stock-checked again
+        replayed, lines = _partition_replayed_lines(
+            SaleEntry, shop, validated_data["lines"]
+        )
+        if not lines:
+            return _ordered_bulk_results(validated_data["lines"], [], [], replayed)
+
+        requested = {}
+        for line in lines:
+            requested[line["product"].pk] = (
+                requested.get(line["product"].pk, Decimal("0.000")) + line["quantity"]
+            )
+
+        # Lock the ledger rows of every product in the basket and check stock
+        # for all of them in one pass (see SaleEntrySerializer.create).
+        current_stock = ProductStock.locked_quantities(list(requested))
+        pending_lines = {id(line) for line in lines}
+        line_errors = []
+        for line in validated_data["lines"]:
+            product = line["product"]
+            if (
+                id(line) in pending_lines
+                and current_stock[product.pk] < requested[product.pk]
+            ):
+                line_errors.append(
+                    {
+                        "quantity": f"Not enough stock for {product.name}. Current stock: {current_stock[product.pk]}"
+                    }
+                )
+            else:
+                line_errors.append({})
+        if any(line_errors):
+            raise serializers.ValidationError({"lines": line_errors})
+
+        sale_entries = SaleEntry.objects.bulk_create(
+            [
+                SaleEntry(
+                    shop=shop,
+                    worker=worker,
+                    product=line["product"],
+                    quantity=line["quantity"],
+                    selling_price=line["selling_price"],
+                    notes=line.get("notes"),
+                    client_id=line.get("client_id"),
+                )
+                for line in lines
+            ]
+        )
+        # bulk_create() skips SaleEntry.save(), so update the ledger here
+        ProductStock.adjust_many(
+            {product_id: -quantity for product_id, quantity in requested.items()}
+        )
+        record_rollups(sale_entries)
+        return _ordered_bulk_results(
+            validated_data["lines"], lines, sale_entries, replayed
+        )
+
+
 # --- MissedSaleEntry Serializer ---
-class MissedSaleEntrySerializer(serializers.ModelSerializer):
+class MissedSaleEntrySerializer(
+    ClientIdempotentCreateMixin, serializers.ModelSerializer
+):
     shop = serializers.PrimaryKeyRelatedField(queryset=Shop.objects.all())
     worker = serializers.PrimaryKeyRelatedField(queryset=Worker.objects.all())
 
@@ -666,8 +1107,11 @@ class MissedSaleEntrySerializer(serializers.ModelSerializer):
             "notes",
             "recorded_at",
             "is_synced",
+            "client_id",
         ]
         read_only_fields = ["recorded_at", "is_synced"]
+        # Replays of an existing (shop, client_id) are handled in create()
+        validators = []
 
     def validate(self, data):
         product = data.get("product")
@@ -710,6 +1154,28 @@ class MissedSaleEntrySerializer(serializers.ModelSerializer):
 
         return data
 
+    @transaction.atomic
+    def create(self, validated_data):
+        return self._create_once(validated_data, super().create)
+
+
+# --- ProductImportJob Serializer (status of an API product import) ---
+class ProductImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductImportJob
+        fields = [
+            "id",
+            "shop",
+            "filename",
+            "status",
+            "rows_done",
+            "report",
+            "detail",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
 
 class StockEntryCreateUpdateSerializer(serializers.Serializer):
     # Fields for existing product
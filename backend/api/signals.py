@@ -0,0 +1,135 @@
+# dukani/backend/api/signals.py
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .auth.principal import invalidate_managed_shop_ids
+from .autocomplete import prefix_indexes
+from .barcodes import GLOBAL_SCOPE, forget_barcode_miss
+from .image_matching import global_image_index
+from .images import delete_image_files, queue_image_renditions
+from .models import (
+    Shop,
+    GlobalProduct,
+    Product,
+    StockEntry,
+    SaleEntry,
+    MissedSaleEntry,
+    ProductStock,
+    SyncTombstone,
+    record_rollups,
+)
+
+# Object types as reported in the delta sync feed's "deleted" list
+SYNC_OBJECT_TYPES = {
+    Product: "product",
+    StockEntry: "stock_entry",
+    SaleEntry: "sale_entry",
+    MissedSaleEntry: "missed_sale_entry",
+}
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=StockEntry)
+@receiver(post_delete, sender=SaleEntry)
+@receiver(post_delete, sender=MissedSaleEntry)
+def record_sync_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(
+        shop_id=instance.shop_id,
+        object_type=SYNC_OBJECT_TYPES[sender],
+        object_id=instance.pk,
+    )
+
+
+# Direction of an entry's effect on its product's stock
+STOCK_SIGNS = {StockEntry: 1, SaleEntry: -1}
+
+
+@receiver(post_delete, sender=StockEntry)
+@receiver(post_delete, sender=SaleEntry)
+@receiver(post_delete, sender=MissedSaleEntry)
+def take_back_entry_movement(sender, instance, origin=None, **kwargs):
+    # Here rather than in delete(), so queryset deletes and deletes cascading
+    # from the product are counted too.
+    deleted = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if deleted is Shop:
+        return  # The shop's stock and rollup rows go with it
+    if deleted in (StockEntry, SaleEntry, MissedSaleEntry):
+        if sender in STOCK_SIGNS:
+            ProductStock.adjust(instance.product_id, -STOCK_SIGNS[sender] * instance.quantity)
+        record_rollups([instance], sign=-1)
+    else:
+        # Deleted with its product, whose stock and rollup rows go with it
+        record_rollups([instance], sign=-1, product_rows=False)
+
+
+def _invalidate_managers(user_ids):
+    # Again after commit, in case a concurrent request re-cached the old set
+    user_ids = list(user_ids)
+    invalidate_managed_shop_ids(user_ids)
+    transaction.on_commit(lambda: invalidate_managed_shop_ids(user_ids))
+
+
+@receiver(m2m_changed, sender=Shop.managers.through)
+def invalidate_managers_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    # shop.managers.clear() reports no pk_set, so the affected users are read
+    # before the rows go.
+    if action == "pre_clear":
+        if reverse:
+            _invalidate_managers([instance.pk])
+        else:
+            _invalidate_managers(instance.managers.values_list("id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        # reverse: user.managed_shops.add(...), instance is the User
+        _invalidate_managers([instance.pk] if reverse else pk_set)
+
+
+@receiver(pre_delete, sender=Shop)
+def invalidate_managers_cache_on_shop_delete(sender, instance, **kwargs):
+    # Deleting a shop removes its manager rows without an m2m_changed signal
+    _invalidate_managers(instance.managers.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_autocomplete_index(sender, instance, **kwargs):
+    # Again after commit, in case the index was rebuilt from pre-commit rows
+    prefix_indexes.invalidate(instance.shop_id)
+    transaction.on_commit(lambda: prefix_indexes.invalidate(instance.shop_id))
+
+
+def _forget_barcode_miss(scope, barcode):
+    # Again after commit, in case a concurrent scan cached the miss meanwhile
+    forget_barcode_miss(scope, barcode)
+    transaction.on_commit(lambda: forget_barcode_miss(scope, barcode))
+
+
+@receiver(post_save, sender=Product)
+def forget_product_barcode_miss(sender, instance, **kwargs):
+    _forget_barcode_miss(instance.shop_id, instance.barcode)
+
+
+@receiver(post_save, sender=GlobalProduct)
+def forget_global_barcode_miss(sender, instance, **kwargs):
+    _forget_barcode_miss(GLOBAL_SCOPE, instance.barcode)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=GlobalProduct)
+def process_product_image(sender, instance, **kwargs):
+    queue_image_renditions(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=GlobalProduct)
+def remove_product_image_files(sender, instance, **kwargs):
+    # After commit: a rolled back delete still needs the files
+    transaction.on_commit(lambda: delete_image_files(instance))
+
+
+@receiver(post_save, sender=GlobalProduct)
+@receiver(post_delete, sender=GlobalProduct)
+def invalidate_global_image_index(sender, instance, **kwargs):
+    global_image_index.invalidate()
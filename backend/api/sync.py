@@ -0,0 +1,145 @@
+# dukani/backend/api/sync.py
+
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Product,
+    StockEntry,
+    SaleEntry,
+    MissedSaleEntry,
+    SyncTombstone,
+)
+from .serializers import (
+    ProductSerializer,
+    StockEntrySerializer,
+    SaleEntrySerializer,
+    MissedSaleEntrySerializer,
+)
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Each stream: (queryset factory, timestamp field, serializer or None for tombstones)
+SYNC_STREAMS = {
+    "products": (
+        lambda shop: Product.objects.filter(shop=shop).select_related(
+            "shop", "global_product__category"
+        ),
+        "updated_at",
+        ProductSerializer,
+    ),
+    "stock_entries": (
+        lambda shop: StockEntry.objects.filter(shop=shop),
+        "recorded_at",
+        StockEntrySerializer,
+    ),
+    "sale_entries": (
+        lambda shop: SaleEntry.objects.filter(shop=shop),
+        "recorded_at",
+        SaleEntrySerializer,
+    ),
+    "missed_sale_entries": (
+        lambda shop: MissedSaleEntry.objects.filter(shop=shop),
+        "recorded_at",
+        MissedSaleEntrySerializer,
+    ),
+    "deleted": (
+        lambda shop: SyncTombstone.objects.filter(shop_id=shop.id),
+        "deleted_at",
+        None,
+    ),
+}
+
+
+def encode_cursor(positions):
+    """
+    Packs {stream: [timestamp, id]} into an opaque URL-safe token.
+    """
+    return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return {}
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        decoded = {}
+        for stream, (timestamp, object_id) in positions.items():
+            if stream not in SYNC_STREAMS:
+                raise InvalidCursor(stream)
+            decoded[stream] = (parse_datetime(timestamp), object_id)
+            if decoded[stream][0] is None:
+                raise InvalidCursor(timestamp)
+        return decoded
+    except (binascii.Error, ValueError, TypeError, AttributeError) as exc:
+        raise InvalidCursor(str(exc))
+
+
+def collect_changes(shop, cursor=None, limit=SYNC_DEFAULT_LIMIT):
+    """
+    Returns everything in `shop` that changed after `cursor`, ordered by
+    (timestamp, id) per stream, at most `limit` rows per stream.
+    """
+    positions = decode_cursor(cursor)
+    # Rows younger than the settle window are left for the next sync, so a
+    # transaction that commits slightly late with an older timestamp is not
+    # skipped by the cursor.
+    settled_before = timezone.now() - timedelta(
+        seconds=getattr(settings, "SYNC_SETTLE_SECONDS", 2)
+    )
+    response = {}
+    has_more = False
+
+    for stream, stream_config in SYNC_STREAMS.items():
+        queryset_for, timestamp_field, serializer_class = stream_config
+        queryset = queryset_for(shop).filter(
+            **{f"{timestamp_field}__lt": settled_before}
+        )
+        if stream in positions:
+            timestamp, object_id = positions[stream]
+            queryset = queryset.filter(
+                Q(**{f"{timestamp_field}__gt": timestamp})
+                | Q(**{timestamp_field: timestamp, "id__gt": object_id})
+            )
+        rows = list(queryset.order_by(timestamp_field, "id")[: limit + 1])
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+
+        if rows:
+            last = rows[-1]
+            positions[stream] = (getattr(last, timestamp_field), last.id)
+
+        if serializer_class is None:
+            response[stream] = [
+                {
+                    "type": row.object_type,
+                    "id": str(row.object_id),
+                    "deleted_at": row.deleted_at.isoformat(),
+                }
+                for row in rows
+            ]
+        else:
+            response[stream] = serializer_class(rows, many=True).data
+
+    response["cursor"] = encode_cursor(
+        {
+            stream: [timestamp.isoformat(), str(object_id)]
+            for stream, (timestamp, object_id) in positions.items()
+        }
+    )
+    response["has_more"] = has_more
+    return response
@@ -8,9 +8,13 @@ from decimal import Decimal
 import uuid
 from django.utils import timezone
 from datetime import timedelta
-from io import BytesIO
+from io import BytesIO, StringIO
 from PIL import Image
 import json
+import gzip
+import hashlib
+import random
+import unittest
 from api.models import (
     Shop,
     Worker,
@@ -29,9 +33,35 @@ from api.models import (
     FAKE,
     REFURBISHED,
     InviteToken,
+    BackgroundJob,
+    JOB_PENDING,
+    JOB_RUNNING,
+    ProductImportJob,
+    IMPORT_DONE,
+    IMPORT_FAILED,
+    IMPORT_PENDING,
+    IMPORT_RUNNING,
 )
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.exceptions import ValidationError
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import Sum
+from django.test import override_settings
+from api.auth.token_store import generate_token_for
+from api.barcodes import _miss_key
+from api.images import delete_image_files, queue_uploaded_image, staging_storage
+from api.imports import fail_product_import, queue_product_import, run_product_import
+from api.jobs import run_pending_jobs
+from api.uploads import UPLOAD_TOKEN_SALT, presigned_put_url
+from dukani_backend.settings import MediaStorage
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.storage import default_storage
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
 
 class APIIntegrationTests(APITestCase):
@@ -322,11 +352,9 @@ class APIIntegrationTests(APITestCase):
     def tearDown(self):
         # Clean up any created media files after each test
         for product in Product.objects.all():
-            if product.image:
-                product.image.delete(save=False)
+            delete_image_files(product)
         for global_product in GlobalProduct.objects.all():
-            if global_product.image:
-                global_product.image.delete(save=False)
+            delete_image_files(global_product)
 
     def test_invite_token_creation_and_expiry_logic(self):
         phone_number = f"+25576543210_{uuid.uuid4().hex[:8]}"
@@ -418,6 +446,358 @@ class APIIntegrationTests(APITestCase):
         response = self.client_unauthenticated.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_shop_list_and_retrieve_prefetch_managers_and_categories(self):
+        for i in range(8):
+            shop = Shop.objects.create(
+                name=f"Extra Shop {i} {uuid.uuid4().hex[:8]}",
+                business_id=f"EX{i}_{uuid.uuid4().hex[:8]}",
+            )
+            shop.managers.add(self.manager_user, self.other_manager_user)
+            shop.categories.add(self.shop_category_auto, self.shop_category_grocery)
+        client_admin = APIClient()
+        client_admin.force_authenticate(user=self.admin_user)
+
+        # count + shops + managers + categories, however many shops are listed
+        with self.assertNumQueries(4):
+            response = client_admin.get(reverse("shop-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 10)
+        extra = next(s for s in response.data["results"] if s["name"].startswith("Extra Shop"))
+        self.assertCountEqual(
+            extra["manager_usernames"],
+            [self.manager_user.username, self.other_manager_user.username],
+        )
+        self.assertCountEqual(
+            extra["category_names"],
+            [self.shop_category_auto.name, self.shop_category_grocery.name],
+        )
+
+        with self.assertNumQueries(3):
+            response = client_admin.get(reverse("shop-detail", args=[self.shop1.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["manager_usernames"], [self.manager_user.username])
+        self.assertEqual(response.data["categories"], [self.shop_category_auto.id])
+
+    def test_list_endpoints_do_not_lazy_load_per_row(self):
+        # A serializer that starts reading an un-joined relation shows up here as
+        # queries that grow with the number of rows listed.
+        client_admin = APIClient()
+        client_admin.force_authenticate(user=self.admin_user)
+        urls = [
+            reverse(name)
+            for name in [
+                "shop-list",
+                "worker-list",
+                "product-list",
+                "globalproduct-list",
+                "stockentry-list",
+                "saleentry-list",
+                "missedsaleentry-list",
+                "shopcategory-list",
+                "product-category-list",
+            ]
+        ]
+
+        def query_counts():
+            counts = {}
+            for url in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    response = client_admin.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+                counts[url] = len(queries)
+            return counts
+
+        # Empty pages skip the page query, so start with one row of each
+        SaleEntry.objects.create(
+            shop=self.shop1,
+            worker=self.worker1,
+            product=self.product1_shop1,
+            quantity=Decimal("1.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        MissedSaleEntry.objects.create(
+            shop=self.shop1, worker=self.worker1, product_name_text="Wiper", quantity_requested=Decimal("1.000")
+        )
+        baseline = query_counts()
+        for i in range(4):
+            suffix = f"{i}_{uuid.uuid4().hex[:8]}"
+            shop = Shop.objects.create(name=f"Grown Shop {suffix}", business_id=suffix)
+            shop.managers.add(self.manager_user)
+            shop.categories.add(self.shop_category_auto)
+            worker = Worker.objects.create(
+                shop=shop, first_name="W", last_name=suffix, phone_number=f"+2557{suffix}"
+            )
+            category = Category.objects.create(name=f"Grown Cat {suffix}")
+            global_product = GlobalProduct.objects.create(
+                name=f"Grown Global {suffix}", category=category
+            )
+            product = Product.objects.create(
+                shop=shop,
+                global_product=global_product,
+                name=f"Grown Product {suffix}",
+                price=Decimal("1000.00"),
+                quantity_type=UNIT,
+            )
+            StockEntry.objects.create(
+                shop=shop, worker=worker, product=product, quantity=Decimal("5.000")
+            )
+            SaleEntry.objects.create(
+                shop=shop,
+                worker=worker,
+                product=product,
+                quantity=Decimal("1.000"),
+                selling_price=Decimal("1200.00"),
+            )
+            MissedSaleEntry.objects.create(
+                shop=shop, worker=worker, product=product, quantity_requested=Decimal("1.000")
+            )
+        self.assertEqual(query_counts(), baseline)
+
+    # --- Shop Categories Summary API Tests ---
+    def test_categories_summary_aggregates_per_category(self):
+        SaleEntry.objects.create(
+            shop=self.shop1,
+            worker=self.worker1,
+            product=self.product1_shop1,
+            quantity=Decimal("10.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        MissedSaleEntry.objects.create(
+            shop=self.shop1,
+            worker=self.worker1,
+            product=self.product3_shop1,
+            quantity_requested=Decimal("2.000"),
+            reason="Out of stock",
+        )
+        url = reverse("shop-categories-summary", args=[self.shop1.id])
+        response = self.client_manager1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        summary = {
+            row["category_name"]: row for row in response.data["categories_summary"]
+        }
+        self.assertEqual(
+            set(summary),
+            {self.cat_engine.name, self.cat_body.name, self.cat_electronics.name},
+        )
+        engine = summary[self.cat_engine.name]
+        self.assertEqual(engine["category_id"], str(self.cat_engine.id))
+        self.assertEqual(engine["total_products_in_category"], 3)
+        # (100 - 10) * 26000 for the oil + 30 * 16000 for the oil filter
+        self.assertEqual(engine["total_stock_value_tzs"], Decimal("2820000.00"))
+        self.assertEqual(engine["total_sales_value_tzs"], Decimal("270000.00"))
+        self.assertEqual(engine["total_missed_sales_quantity"], Decimal("2.000"))
+
+        body = summary[self.cat_body.name]
+        self.assertEqual(body["total_products_in_category"], 1)
+        self.assertEqual(body["total_stock_value_tzs"], Decimal("0.00"))
+        self.assertEqual(body["total_sales_value_tzs"], Decimal("0.00"))
+
+    def test_categories_summary_query_count_is_constant(self):
+        url = reverse("shop-categories-summary", args=[self.shop1.id])
+        self.client_manager1.get(url)  # warm the manager's managed-shop IDs
+        with CaptureQueriesContext(connection) as baseline:
+            response = self.client_manager1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Grow the shop with more categories, products and entries
+        for i in range(15):
+            category = Category.objects.create(name=f"Bulk Cat {i} {uuid.uuid4().hex[:8]}")
+            global_product = GlobalProduct.objects.create(
+                name=f"Bulk Global {i} {uuid.uuid4().hex[:8]}", category=category
+            )
+            product = Product.objects.create(
+                shop=self.shop1,
+                global_product=global_product,
+                name=f"Bulk Product {i} {uuid.uuid4().hex[:8]}",
+                price=Decimal("1000.00"),
+                quantity_type=UNIT,
+            )
+            StockEntry.objects.create(
+                shop=self.shop1, product=product, quantity=Decimal("5.000")
+            )
+            SaleEntry.objects.create(
+                shop=self.shop1,
+                product=product,
+                quantity=Decimal("1.000"),
+                selling_price=Decimal("1200.00"),
+            )
+
+        with CaptureQueriesContext(connection) as grown:
+            response = self.client_manager1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["categories_summary"]), 18)
+        self.assertEqual(len(grown), len(baseline))
+
+    def test_stock_movement_returns_last_seven_local_days(self):
+        # Shop rollups are written after commit, which never happens for
+        # setUp's deliveries in a TestCase
+        call_command("rebuild_rollups", "--shop", str(self.shop1.id), stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            SaleEntry.objects.create(
+                shop=self.shop1,
+                worker=self.worker1,
+                product=self.product1_shop1,
+                quantity=Decimal("10.000"),
+                selling_price=Decimal("27000.00"),
+            )
+            MissedSaleEntry.objects.create(
+                shop=self.shop1,
+                product_name_text="Wiper Motor",
+                quantity_requested=Decimal("2.000"),
+            )
+        url = reverse("shop-stock-movement", args=[self.shop1.id])
+        response = self.client_manager1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["timezone"], "Africa/Dar_es_Salaam")
+
+        days = response.data["stock_movement"]
+        self.assertEqual(len(days), 7)
+        today = timezone.localdate()
+        self.assertEqual(days[-1]["date"], today.isoformat())
+        self.assertEqual(days[-1]["day"], today.strftime("%a"))
+        received = StockEntry.objects.filter(shop=self.shop1).aggregate(
+            total=Sum("quantity")
+        )["total"]
+        self.assertEqual(days[-1]["stockIn"], received)
+        self.assertEqual(days[-1]["stockOut"], Decimal("10.000"))
+        self.assertEqual(days[-1]["missedSales"], Decimal("2.000"))
+        self.assertEqual(days[0]["stockIn"], Decimal("0.000"))
+
+        # Another time zone regroups the hourly rollups
+        response = self.client_manager1.get(
+            url, {"tz": "UTC", "start": str(today - timedelta(days=1)), "end": str(today + timedelta(days=1))}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sum(day["stockOut"] for day in response.data["stock_movement"]),
+            Decimal("10.000"),
+        )
+
+    def test_stock_movement_validates_parameters_and_shop_access(self):
+        url = reverse("shop-stock-movement", args=[self.shop1.id])
+        for params in (
+            {"tz": "Mars/Olympus_Mons"},
+            {"start": "last week"},
+            {"start": "2026-02-01", "end": "2026-01-01"},
+            {"start": "2020-01-01", "end": "2026-01-01"},
+        ):
+            response = self.client_manager1.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+        for shop_id in (self.shop2.id, "not-a-uuid"):
+            response = self.client_manager1.get(reverse("shop-stock-movement", args=[shop_id]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_import_products_creates_products_and_opening_stock(self):
+        csv_file = SimpleUploadedFile(
+            "products.csv",
+            (
+                "\ufeffname,barcode,price,quantity,purchase_price\n"
+                "Brake Fluid DOT4,BF4,12000,24,9000\n"
+                f",{self.global_battery.barcode},,3,\n"
+                "Brake Fluid DOT4,,12500,1,\n"
+                f"{self.product1_shop1.name},,1000,5,\n"
+                "Radiator Cap,,cheap,2,\n"
+                "Loose Bolts,,100,1.5,\n"
+                f"{'Very Long Name ' * 20},,100,1,\n"
+            ).encode(),
+            content_type="text/csv",
+        )
+        url = reverse("shop-import-products", args=[self.shop1.id])
+        response = self.client_manager1.post(url, {"file": csv_file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], IMPORT_PENDING)
+        self.assertFalse(Product.objects.filter(shop=self.shop1, name="Brake Fluid DOT4").exists())
+
+        run_pending_jobs()
+        status_url = reverse("shop-import-status", args=[self.shop1.id, response.data["id"]])
+        response = self.client_manager1.get(status_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], IMPORT_DONE)
+        self.assertEqual(response.data["rows_done"], 8)
+        report = response.data["report"]
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(report["linked_to_global_product"], 1)
+        self.assertEqual(report["stock_entries"], 2)
+        self.assertEqual(
+            {error["row"]: list(error["errors"]) for error in report["errors"]},
+            {4: ["name"], 5: ["name"], 6: ["price"], 7: ["quantity"], 8: ["name"]},
+        )
+        product_import = ProductImportJob.objects.get(pk=response.data["id"])
+        self.assertFalse(staging_storage().exists(product_import.staged_name))
+
+        brake_fluid = Product.objects.get(shop=self.shop1, name="Brake Fluid DOT4")
+        self.assertEqual(brake_fluid.current_stock, Decimal("24.000"))
+        battery = Product.objects.get(shop=self.shop1, name=self.global_battery.name)
+        self.assertEqual(battery.name, self.global_battery.name)
+        self.assertEqual(battery.price, Decimal("120000.00"))
+        self.assertEqual(battery.status, LINKED)
+        self.assertEqual(battery.current_stock, Decimal("3.000"))
+
+    def test_import_products_rejects_bad_files_and_foreign_shops(self):
+        url = reverse("shop-import-products", args=[self.shop1.id])
+        response = self.client_manager1.post(url, {}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        headerless = SimpleUploadedFile("products.csv", b"Oil,1000\n", content_type="text/csv")
+        response = self.client_manager1.post(url, {"file": headerless}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        run_pending_jobs()
+        import_id = response.data["id"]
+        status_url = reverse("shop-import-status", args=[self.shop1.id, import_id])
+        response = self.client_manager1.get(status_url)
+        self.assertEqual(response.data["status"], IMPORT_FAILED)
+        self.assertIn("first row must name the columns", response.data["detail"])
+        # Another manager's shop, and ids that aren't imports, are not found
+        response = self.client_other_manager.get(status_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for args in ((self.shop1.id, "not-a-uuid"), ("not-a-uuid", import_id)):
+            response = self.client_manager1.get(reverse("shop-import-status", args=args))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        csv_file = SimpleUploadedFile("products.csv", b"name,price\nOil,1000\n", content_type="text/csv")
+        response = self.client_manager1.post(
+            reverse("shop-import-products", args=[self.shop2.id]),
+            {"file": csv_file},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client_manager1.post(
+            reverse("shop-import-products", args=["not-a-uuid"]),
+            {"file": csv_file},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_interrupted_product_import_resumes_after_the_last_imported_row(self):
+        csv_file = SimpleUploadedFile(
+            "products.csv",
+            b"name,price,quantity\nAlready Imported,100,1\nClutch Plate,45000,2\n",
+            content_type="text/csv",
+        )
+        with mock.patch("api.imports.enqueue"):
+            product_import = queue_product_import(self.shop1, csv_file, self.manager_user)
+        # A worker imported row 2 and died before finishing the file
+        product_import.status = IMPORT_RUNNING
+        product_import.rows_done = 2
+        product_import.report = {"created": 1, "stock_entries": 1, "error_count": 0, "errors": []}
+        product_import.save()
+
+        run_product_import({"import": str(product_import.pk)})
+        product_import.refresh_from_db()
+        self.assertEqual(product_import.status, IMPORT_DONE)
+        self.assertEqual(product_import.report["created"], 2)
+        self.assertEqual(product_import.report["stock_entries"], 2)
+        self.assertFalse(Product.objects.filter(shop=self.shop1, name="Already Imported").exists())
+        self.assertTrue(Product.objects.filter(shop=self.shop1, name="Clutch Plate").exists())
+
+        # An import given up on says how far it got
+        product_import.status = IMPORT_RUNNING
+        product_import.save()
+        fail_product_import({"import": str(product_import.pk)})
+        product_import.refresh_from_db()
+        self.assertEqual(product_import.status, IMPORT_FAILED)
+        self.assertIn("after row 3", product_import.detail)
+
     # --- Worker API Tests ---
     def test_manager_can_list_workers_in_their_shops(self):
         url = reverse("worker-list")
@@ -464,6 +844,7 @@ class APIIntegrationTests(APITestCase):
             url, data, format="multipart"
         )  # Use multipart for file upload
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        run_pending_jobs()  # Stores the staged image
         self.assertEqual(
             Product.objects.filter(shop=self.shop1).count(), 7
         )  # Existing 6 + new 1 (3 initial + 3 analytics + 1 new)
@@ -476,6 +857,282 @@ class APIIntegrationTests(APITestCase):
             new_product.status, LINKED
         )  # Should be LINKED if global_product_id is provided
 
+    def test_product_image_upload_is_re_encoded_with_renditions(self):
+        url = reverse("product-list")
+        # A large photo carrying EXIF (camera model, rotated orientation)
+        photo = Image.new("RGB", (3000, 1500), color="green")
+        exif = Image.Exif()
+        exif[0x0110] = "Test Camera"
+        exif[0x0112] = 6  # Rotated 90 degrees clockwise
+        photo_io = BytesIO()
+        photo.save(photo_io, format="JPEG", exif=exif)
+        data = {
+            "shop": str(self.shop1.id),
+            "name": f"Photo Item {uuid.uuid4().hex[:8]}",
+            "price": "1000.00",
+            "quantity_type": UNIT,
+            "status": PENDING_REVIEW,
+            "image": SimpleUploadedFile(
+                "photo.jpeg", photo_io.getvalue(), content_type="image/jpeg"
+            ),
+        }
+        response = self.client_manager1.post(url, data, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # The upload is stored by the background worker, not the request
+        self.assertIsNone(response.data["image"])
+        self.assertTrue(BackgroundJob.objects.filter(kind="attach_image").exists())
+        run_pending_jobs()
+
+        product = Product.objects.get(pk=response.data["id"])
+        response = self.client_manager1.get(reverse("product-detail", args=[product.pk]))
+        self.assertEqual(response.data["image"], product.image.name)
+        self.assertTrue(product.image.name.endswith(".jpg"))
+        with product.image.open("rb"), Image.open(product.image) as original:
+            # Capped to IMAGE_MAX_DIMENSION, turned upright, EXIF removed
+            self.assertEqual(original.size, (1024, 2048))
+            self.assertEqual(len(original.getexif()), 0)
+
+        renditions = response.data["image_renditions"]
+        self.assertEqual(set(renditions), {"thumb", "medium"})
+        self.assertEqual(set(renditions["thumb"]), {"webp", "jpeg"})
+        storage = product.image.storage
+        expected = {"thumb": (120, 240), "medium": (400, 800)}
+        for label, formats in product.image_renditions["files"].items():
+            for name, path in formats.items():
+                self.assertEqual(renditions[label][name], storage.url(path))
+                self.assertIn("shop_product_images/renditions/", path)
+                with storage.open(path) as file, Image.open(file) as rendition:
+                    self.assertEqual(rendition.size, expected[label])
+                    self.assertEqual(rendition.format, name.upper())
+                    self.assertEqual(len(rendition.getexif()), 0)
+        self.assertLess(storage.size(product.image_renditions["files"]["thumb"]["webp"]), 20_000)
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_unreadable_product_image_is_kept_without_renditions(self):
+        product = Product.objects.create(
+            shop=self.shop1,
+            name=f"Broken Image Item {uuid.uuid4().hex[:8]}",
+            price=Decimal("100.00"),
+            image=SimpleUploadedFile("broken.jpg", b"not an image"),
+        )
+        with self.assertLogs("api.images", level="WARNING"):
+            run_pending_jobs()
+        product.refresh_from_db()
+        digest = hashlib.sha256(b"not an image").hexdigest()
+        self.assertEqual(product.image.name, f"shop_product_images/{digest}.jpg")
+        self.assertEqual(
+            product.image_renditions, {"source": product.image.name, "files": {}}
+        )
+        response = self.client_manager1.get(reverse("product-detail", args=[product.pk]))
+        self.assertEqual(response.data["image_renditions"], {})
+
+    def test_manager_uploads_product_image_directly_to_storage(self):
+        url = reverse("product-image-upload", args=[self.product2_shop1.pk])
+        confirm_url = reverse("product-confirm-image-upload", args=[self.product2_shop1.pk])
+        # The test media storage is the file system, which can't presign
+        response = self.client_manager1.post(url, {"content_type": "image/png"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+        # Stand-in for S3/MinIO: the client's PUT is written to the test storage
+        with mock.patch(
+            "api.uploads.presigned_put_url", return_value="http://minio.test/put"
+        ) as presign:
+            response = self.client_manager1.post(
+                url, {"content_type": "application/pdf"}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client_other_manager.post(
+                url, {"content_type": "image/png"}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            response = self.client_manager1.post(url, {"content_type": "image/png"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["upload_url"], "http://minio.test/put")
+        self.assertEqual(response.data["method"], "PUT")
+        self.assertEqual(response.data["headers"], {"Content-Type": "image/png"})
+        storage, key, content_type, expires = presign.call_args.args
+        self.assertRegex(key, r"^uploads/product/[0-9a-f]{32}\.png$")
+        self.assertEqual((content_type, expires), ("image/png", 900))
+        token = response.data["upload_token"]
+
+        # Confirming before the upload finished
+        response = self.client_manager1.post(confirm_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        photo = BytesIO()
+        Image.new("RGB", (1200, 900), color="orange").save(photo, format="PNG")
+        storage.save(key, ContentFile(photo.getvalue()))
+
+        # Tokens only attach to the product they were issued for
+        other_url = reverse("product-confirm-image-upload", args=[self.product3_shop1.pk])
+        response = self.client_manager1.post(other_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client_manager1.post(
+            confirm_url, {"upload_token": token + "x"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client_manager1.post(confirm_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        # Replaying the token while the upload is queued doesn't queue it again
+        response = self.client_manager1.post(confirm_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(BackgroundJob.objects.filter(kind="attach_image").count(), 1)
+        BackgroundJob.objects.filter(kind="attach_image").update(status=JOB_RUNNING)
+        response = self.client_manager1.post(confirm_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        BackgroundJob.objects.filter(kind="attach_image").update(status=JOB_PENDING)
+        run_pending_jobs()
+        product = Product.objects.get(pk=self.product2_shop1.pk)
+        self.assertRegex(product.image.name, r"^shop_product_images/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(set(product.image_renditions["files"]), {"thumb", "medium"})
+        self.assertFalse(storage.exists(key))
+
+        # The upload was used up
+        response = self.client_manager1.post(confirm_url, {"upload_token": token}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_MAX_UPLOAD_BYTES=1000)
+    def test_oversized_direct_image_upload_is_rejected_and_deleted(self):
+        url = reverse("globalproduct-image-upload", args=[self.global_oil.pk])
+        with mock.patch("api.uploads.presigned_put_url", return_value="http://minio.test/put"):
+            response = self.client_manager1.post(url, {"content_type": "image/jpeg"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client_admin.post(url, {"content_type": "image/jpeg"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        key = signing.loads(response.data["upload_token"], salt=UPLOAD_TOKEN_SALT)["name"]
+        default_storage.save(key, ContentFile(b"x" * 1001))
+
+        response = self.client_admin.post(
+            reverse("globalproduct-confirm-image-upload", args=[self.global_oil.pk]),
+            {"upload_token": response.data["upload_token"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(default_storage.exists(key))
+        self.assertFalse(BackgroundJob.objects.filter(kind="attach_image").exists())
+
+    def test_unconfirmed_direct_uploads_are_swept(self):
+        product = Product.objects.get(pk=self.product2_shop1.pk)
+        abandoned = default_storage.save("uploads/product/abandoned.jpg", ContentFile(b"x"))
+        queued = default_storage.save("uploads/product/queued.jpg", ContentFile(b"x"))
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_uploaded_image(product, queued)
+        self.addCleanup(default_storage.delete, queued)
+        self.addCleanup(default_storage.delete, abandoned)
+
+        # Their tokens could still be confirmed
+        output = StringIO()
+        call_command("clear_unconfirmed_uploads", stdout=output)
+        self.assertEqual(output.getvalue().strip(), "Deleted 0 unconfirmed upload(s)")
+        self.assertTrue(default_storage.exists(abandoned))
+
+        with override_settings(IMAGE_UPLOAD_CONFIRM_SECONDS=0):
+            call_command("clear_unconfirmed_uploads", stdout=output)
+        self.assertFalse(default_storage.exists(abandoned))
+        self.assertTrue(default_storage.exists(queued))
+
+    def test_presigned_put_url_is_signed_for_the_media_bucket(self):
+        storage = MediaStorage(
+            access_key="test",
+            secret_key="test",
+            bucket_name="dukanibucket",
+            endpoint_url="http://minio.test:9000",
+            region_name="us-east-1",
+        )
+        url = urlparse(presigned_put_url(storage, "uploads/product/a.jpg", "image/jpeg", 900))
+        query = parse_qs(url.query)
+        self.assertEqual(url.netloc, "minio.test:9000")
+        self.assertEqual(url.path, "/dukanibucket/media/uploads/product/a.jpg")
+        self.assertEqual(query["X-Amz-Algorithm"], ["AWS4-HMAC-SHA256"])
+        self.assertEqual(query["X-Amz-Expires"], ["900"])
+        # The client must send the signed Content-Type
+        self.assertIn("content-type", query["X-Amz-SignedHeaders"][0].split(";"))
+
+    def _patterned_photo(self, seed, size, format="JPEG"):
+        # A random 8x8 grid of grey levels, scaled up: distinct seeds look different
+        shades = random.Random(seed).choices(range(0, 256, 16), k=64)
+        image = Image.new("L", (8, 8))
+        image.putdata(shades)
+        photo = BytesIO()
+        image.resize(size, Image.NEAREST).convert("RGB").save(photo, format=format)
+        return photo.getvalue()
+
+    def test_identical_images_across_shops_are_stored_once(self):
+        data = self._patterned_photo(1, (600, 600))
+        products = [
+            Product.objects.create(
+                shop=shop,
+                name=f"Shared Photo Item {uuid.uuid4().hex[:8]}",
+                price=Decimal("100.00"),
+                image=SimpleUploadedFile("photo.jpg", data, content_type="image/jpeg"),
+            )
+            for shop in (self.shop1, self.shop2)
+        ]
+        run_pending_jobs()
+        first, second = Product.objects.filter(pk__in=[p.pk for p in products]).order_by("shop__name")
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first.image.name, f"shop_product_images/{digest}.jpg")
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.image_renditions, first.image_renditions)
+        self.assertEqual(second.image_digest, digest)
+        self.assertEqual(len(second.image_phash), 16)
+        # The uploaded copies are gone; only the shared files remain
+        stored = default_storage.listdir("shop_product_images")[1]
+        self.assertEqual(stored.count(f"{digest}.jpg"), 1)
+        self.assertFalse([name for name in stored if name.startswith("photo")])
+
+        # Deleting a product keeps files still used by the other shop's product
+        client_for = {self.shop1.pk: self.client_manager1, self.shop2.pk: self.client_other_manager}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for[first.shop_id].delete(reverse("product-detail", args=[first.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(default_storage.exists(second.image.name))
+        for formats in second.image_renditions["files"].values():
+            for path in formats.values():
+                self.assertTrue(default_storage.exists(path))
+        # and the last one using them takes them along
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for[second.shop_id].delete(reverse("product-detail", args=[second.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(default_storage.exists(second.image.name))
+        for formats in second.image_renditions["files"].values():
+            for path in formats.values():
+                self.assertFalse(default_storage.exists(path))
+
+    def test_product_image_matches_similar_global_product_images(self):
+        match = GlobalProduct.objects.create(
+            name=f"Photographed Global {uuid.uuid4().hex[:8]}",
+            category=self.cat_engine,
+            image=SimpleUploadedFile("catalog.png", self._patterned_photo(2, (800, 800), "PNG")),
+        )
+        GlobalProduct.objects.create(
+            name=f"Other Global {uuid.uuid4().hex[:8]}",
+            category=self.cat_engine,
+            image=SimpleUploadedFile("other.jpg", self._patterned_photo(3, (800, 800))),
+        )
+        # A smaller, re-encoded copy of the catalog photo
+        product = Product.objects.create(
+            shop=self.shop1,
+            name=f"Photographed Item {uuid.uuid4().hex[:8]}",
+            price=Decimal("100.00"),
+            image=SimpleUploadedFile("copy.jpg", self._patterned_photo(2, (300, 300))),
+        )
+        run_pending_jobs()
+
+        url = reverse("product-image-matches", args=[product.pk])
+        response = self.client_manager1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["global_product"]["id"], str(match.pk))
+        self.assertLessEqual(response.data[0]["distance"], 2)
+
+        with override_settings(IMAGE_MATCH_MAX_DISTANCE=None):
+            self.assertEqual(self.client_manager1.get(url).data, [])
+        # Only managers of the product's shop may look
+        response = self.client_other_manager.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_manager_can_create_shop_specific_product_with_new_global_product(self):
         url = reverse("product-list")
         new_global_product_name = f"New Global Wiper Fluid {uuid.uuid4().hex[:8]}"
@@ -599,6 +1256,119 @@ class APIIntegrationTests(APITestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]["barcode"], self.global_battery.barcode)
 
+    def test_product_search_returns_top_n_best_matches(self):
+        for name in ["Sukari Kilo", "Sukari Nusu Kilo", "Sukari Guru Kubwa Sana", "Sukari"]:
+            Product.objects.create(
+                shop=self.shop1, name=name, price=Decimal("3000.00"), quantity_type=UNIT
+            )
+        url = reverse("product-search")
+        response = self.client_manager1.get(url, {"q": "sukari", "limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["name"] for p in response.data], ["Sukari", "Sukari Kilo"])
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "needs pg_trgm")
+    def test_product_search_tolerates_typos_on_postgresql(self):
+        Product.objects.create(
+            shop=self.shop1, name="Sukari", price=Decimal("3000.00"), quantity_type=UNIT
+        )
+        response = self.client_manager1.get(reverse("product-search"), {"q": "sukkari"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]["name"], "Sukari")
+
+    def test_worker_autocomplete_serves_prefix_matches_from_memory(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("product-autocomplete")
+        with self.assertNumQueries(1):  # builds the shop's index
+            response = self.client_worker1.get(url, {"q": "engine oi"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [p["name"] for p in response.data]
+        self.assertIn(self.product1_shop1.name, names)
+        self.assertIn(self.product_analytics_oil.name, names)
+        # Names starting with the query come first
+        self.assertEqual(names[0], self.product1_shop1.name)
+
+        with self.assertNumQueries(0):
+            response = self.client_worker1.get(
+                url, {"q": self.product1_shop1.barcode[:9], "limit": 1}
+            )
+        self.assertEqual(response.data[0]["id"], str(self.product1_shop1.id))
+
+        Product.objects.create(
+            shop=self.shop1, name="Enginex Mount", price=Decimal("1.00"), quantity_type=UNIT
+        )
+        response = self.client_worker1.get(url, {"q": "enginex"})
+        self.assertEqual([p["name"] for p in response.data], ["Enginex Mount"])
+
+    def test_manager_autocomplete_is_limited_to_managed_shops(self):
+        url = reverse("product-autocomplete")
+        response = self.client_manager1.get(url, {"q": "eng", "shop": str(self.shop2.id)})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client_manager1.get(url, {"q": "eng", "shop": str(self.shop1.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data)
+
+    def test_by_barcode_prefers_shop_product_then_global_suggestion(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("product-by-barcode", args=[self.product1_shop1.barcode])
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["source"], "shop")
+        self.assertEqual(response.data["product"]["id"], str(self.product1_shop1.id))
+
+        url = reverse("product-by-barcode", args=[self.global_battery.barcode])
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["source"], "global")
+        self.assertEqual(
+            response.data["global_product"]["id"], str(self.global_battery.id)
+        )
+
+    def test_by_barcode_remembers_unknown_barcodes_until_one_is_saved(self):
+        self.worker_user.worker = self.worker1
+        barcode = f"UNKNOWN_{uuid.uuid4().hex[:8]}"
+        url = reverse("product-by-barcode", args=[barcode])
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        product = Product.objects.create(
+            shop=self.shop1,
+            name="Newly Stocked",
+            barcode=barcode,
+            price=Decimal("1.00"),
+            quantity_type=UNIT,
+        )
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["product"]["id"], str(product.id))
+
+    def test_by_barcode_forgets_misses_cached_before_the_product_committed(self):
+        self.worker_user.worker = self.worker1
+        barcode = f"UNKNOWN_{uuid.uuid4().hex[:8]}"
+        url = reverse("product-by-barcode", args=[barcode])
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                shop=self.shop1,
+                name="Concurrently Stocked",
+                barcode=barcode,
+                price=Decimal("1.00"),
+                quantity_type=UNIT,
+            )
+            # A scan in another transaction didn't see the row yet and cached a miss
+            cache.set(_miss_key(self.shop1.id, barcode), True)
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["product"]["id"], str(product.id))
+
+    def test_manager_by_barcode_is_limited_to_managed_shops(self):
+        url = reverse("product-by-barcode", args=[self.product1_shop1.barcode])
+        response = self.client_manager1.get(url, {"shop": str(self.shop2.id)})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client_manager1.get(url, {"shop": str(self.shop1.id)})
+        self.assertEqual(response.data["source"], "shop")
+
     # --- StockEntry API Tests (Mobile Client Mimic) ---
     def test_worker_can_create_stock_entry_for_existing_product(self):
         url = reverse("stockentry-list")
@@ -861,3 +1631,267 @@ class APIIntegrationTests(APITestCase):
         response = self.client_worker1.post(url, data, format="json")
         # Changed assertion to 403 Forbidden due to permission issues
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_worker_can_post_sale_basket_in_bulk(self):
+        # Link the authenticated user to its Worker profile so IsWorkerOfShop passes
+        self.worker_user.worker = self.worker1
+        url = reverse("saleentry-bulk")
+        data = {
+            "shop": str(self.shop1.id),
+            "worker": str(self.worker1.id),
+            "lines": [
+                {"product": str(self.product1_shop1.id), "quantity": "2.5", "selling_price": "27000.00"},
+                {"product": str(self.product2_shop1.id), "quantity": "3", "selling_price": "11000.00"},
+            ],
+        }
+        response = self.client_worker1.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(
+            response.data["results"][1]["product"], self.product2_shop1.id
+        )
+        self.assertEqual(self.product1_shop1.current_stock, Decimal("97.500"))
+        self.assertEqual(self.product2_shop1.current_stock, Decimal("47.000"))
+
+    def test_bulk_sale_for_other_shop_is_forbidden(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("saleentry-bulk")
+        data = {
+            "shop": str(self.shop2.id),
+            "worker": str(self.worker1.id),
+            "lines": [
+                {"product": str(self.product1_shop2.id), "quantity": "1", "selling_price": "85000.00"},
+            ],
+        }
+        response = self.client_worker1.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(SaleEntry.objects.count(), 0)
+
+    def test_worker_can_post_stock_delivery_in_bulk(self):
+        self.worker_user_2.worker = self.worker2
+        url = reverse("stockentry-bulk")
+        new_name = f"Delivered Item {uuid.uuid4().hex[:8]}"
+        data = {
+            "shop": str(self.shop2.id),
+            "worker": str(self.worker2.id),
+            "lines": [
+                {"product": str(self.product1_shop2.id), "quantity": "4", "purchase_price": "75000.00"},
+                {"product_name_text": new_name, "quantity": "12", "purchase_price": "3000.00"},
+            ],
+        }
+        response = self.client_worker2.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(self.product1_shop2.current_stock, Decimal("24.000"))
+        new_product = Product.objects.get(shop=self.shop2, name=new_name)
+        self.assertEqual(new_product.current_stock, Decimal("12.000"))
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync_changes_returns_only_new_rows_after_cursor(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("sync_changes")
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {p["id"] for p in response.data["products"]},
+            {str(p.id) for p in Product.objects.filter(shop=self.shop1)},
+        )
+        self.assertEqual(
+            len(response.data["stock_entries"]),
+            StockEntry.objects.filter(shop=self.shop1).count(),
+        )
+        self.assertFalse(response.data["has_more"])
+        cursor = response.data["cursor"]
+
+        response = self.client_worker1.get(url, {"cursor": cursor})
+        self.assertEqual(response.data["products"], [])
+        self.assertEqual(response.data["stock_entries"], [])
+
+        sale = SaleEntry.objects.create(
+            shop=self.shop1,
+            worker=self.worker1,
+            product=self.product1_shop1,
+            quantity=Decimal("1.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        response = self.client_worker1.get(url, {"cursor": cursor})
+        self.assertEqual([s["id"] for s in response.data["sale_entries"]], [str(sale.id)])
+        # The sale changed the product's stock, but not the product row itself.
+        self.assertEqual(response.data["products"], [])
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync_changes_reports_deleted_products(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("sync_changes")
+        cursor = self.client_worker1.get(url).data["cursor"]
+        product_id = self.product2_shop1.id
+        self.product2_shop1.delete()
+
+        response = self.client_worker1.get(url, {"cursor": cursor})
+        deleted = [(d["type"], d["id"]) for d in response.data["deleted"]]
+        self.assertIn(("product", str(product_id)), deleted)
+        # Another shop's worker never sees this shop's tombstones.
+        self.worker_user_2.worker = self.worker2
+        response = self.client_worker2.get(url)
+        self.assertEqual(response.data["deleted"], [])
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync_changes_pages_with_limit(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("sync_changes")
+        expected = {str(p.id) for p in Product.objects.filter(shop=self.shop1)}
+        seen = []
+        cursor = None
+        for _ in range(len(expected) + 1):
+            params = {"limit": 1}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client_worker1.get(url, params)
+            self.assertLessEqual(len(response.data["products"]), 1)
+            seen.extend(p["id"] for p in response.data["products"])
+            cursor = response.data["cursor"]
+            if not response.data["has_more"]:
+                break
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+    def test_sync_changes_rejects_bad_cursor_and_foreign_shop(self):
+        self.worker_user.worker = self.worker1
+        url = reverse("sync_changes")
+        response = self.client_worker1.get(url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client_manager1.get(url, {"shop": str(self.shop2.id)})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client_manager1.get(url, {"shop": str(self.shop1.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def _create_sales(self, count):
+        SaleEntry.objects.bulk_create(
+            [
+                SaleEntry(
+                    shop=self.shop1,
+                    worker=self.worker1,
+                    product=self.product1_shop1,
+                    quantity=Decimal("1.000"),
+                    selling_price=Decimal("27000.00"),
+                )
+                for _ in range(count)
+            ]
+        )
+
+    def test_entry_lists_support_keyset_pagination(self):
+        self._create_sales(25)
+        url = reverse("saleentry-list")
+        response = self.client_manager1.get(url, {"pagination": "cursor", "page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        seen = [entry["id"] for entry in response.data["results"]]
+        self.assertEqual(len(seen), 10)
+        while response.data["next"]:
+            response = self.client_manager1.get(response.data["next"])
+            seen.extend(entry["id"] for entry in response.data["results"])
+
+        expected = [
+            str(pk)
+            for pk in SaleEntry.objects.filter(shop=self.shop1)
+            .order_by("-recorded_at", "id")
+            .values_list("id", flat=True)
+        ]
+        self.assertEqual(seen, expected)
+
+    def test_entry_lists_keep_page_numbers_and_cap_page_size(self):
+        self._create_sales(105)
+        url = reverse("saleentry-list")
+        response = self.client_manager1.get(url, {"page": 2, "page_size": 50})
+        self.assertEqual(response.data["count"], 105)
+        self.assertEqual(len(response.data["results"]), 50)
+
+        response = self.client_manager1.get(url, {"page_size": 1000})
+        self.assertEqual(len(response.data["results"]), 100)
+        response = self.client_manager1.get(url, {"pagination": "cursor", "page_size": 1000})
+        self.assertEqual(len(response.data["results"]), 100)
+
+    def test_sale_entries_export_streams_csv_oldest_first(self):
+        self._create_sales(2500)  # more than one cursor chunk
+        url = reverse("saleentry-export")
+        response = self.client_manager1.get(url, {"start": str(timezone.localdate())})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="sale_entries.csv"', response["Content-Disposition"])
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:4], ["id", "recorded_at", "shop_id", "shop_name"])
+        self.assertEqual(len(lines), 1 + SaleEntry.objects.filter(shop=self.shop1).count())
+        recorded = [line.split(",")[1] for line in lines[1:]]
+        self.assertEqual(recorded, sorted(recorded))
+
+        # Days before the range are excluded
+        response = self.client_manager1.get(
+            url, {"end": str(timezone.localdate() - timedelta(days=1))}
+        )
+        self.assertEqual(b"".join(response.streaming_content).decode().count("\n"), 1)
+
+    def test_missed_sale_export_supports_gzipped_ndjson(self):
+        MissedSaleEntry.objects.create(
+            shop=self.shop1, product_name_text="Side Mirror", quantity_requested=Decimal("1.000")
+        )
+        url = reverse("missedsaleentry-export")
+        response = self.client_manager1.get(url, {"export_format": "ndjson", "gzip": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        rows = [
+            json.loads(line)
+            for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        ]
+        self.assertIn("Side Mirror", [row["product_name_text"] for row in rows])
+        self.assertTrue(all(row["shop_id"] == str(self.shop1.id) for row in rows))
+
+        response = self.client_manager1.get(url, {"export_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.worker_user.worker = self.worker1
+        response = self.client_worker1.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    # --- Token Authentication Tests ---
+    def test_worker_token_resolves_worker_and_shop_in_one_query(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {generate_token_for(self.worker1)}")
+        with self.assertNumQueries(1):
+            response = client.get(reverse("me"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["role"], "worker")
+        self.assertEqual(response.data["worker"]["shop_name"], self.shop1.name)
+
+        data = {
+            "shop": str(self.shop1.id),
+            "worker": str(self.worker1.id),
+            "product": str(self.product1_shop1.id),
+            "quantity": "1.000",
+            "selling_price": "27000.00",
+        }
+        response = client.post(reverse("saleentry-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data["shop"] = str(self.shop2.id)
+        response = client.post(reverse("saleentry-list"), data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_manager_token_loads_managed_shops_with_the_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {generate_token_for(self.manager_user)}")
+        with self.assertNumQueries(1):
+            response = client.get(reverse("me"))
+        self.assertEqual(response.data["user"]["id"], self.manager_user.id)
+
+        response = client.get(reverse("shop-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [shop["id"] for shop in response.data["results"]], [str(self.shop1.id)]
+        )
+
+    def test_unknown_token_is_rejected(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token not-a-real-token")
+        response = client.get(reverse("me"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -4,10 +4,17 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from decimal import Decimal
 import uuid
+import csv
+import os
+import shutil
+import tempfile
+import threading
+from django.core.cache import cache
 from django.db import transaction
 from django.db.utils import IntegrityError
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from io import BytesIO
+from io import BytesIO, StringIO
 from PIL import Image
 from django.utils import timezone
 
@@ -29,8 +36,39 @@ from api.models import (
     FAKE,
     REFURBISHED,
     USED,
+    ProductStock,
+    AuthToken,
+    ShopDailyRollup,
+    ShopHourlyRollup,
+    ProductDailyRollup,
+    BackgroundJob,
+    JOB_PENDING,
+    JOB_FAILED,
 )
-from django.test import TransactionTestCase
+from api.auth import token_store
+from api.auth.principal import _managed_shops_cache_key, managed_shop_ids
+from api.images import (
+    _save_image,
+    delete_image_files,
+    staging_storage,
+    store_image,
+    sweep_staged_uploads,
+)
+from api.jobs import (
+    JOB_FAILURE_HANDLERS,
+    JOB_HANDLERS,
+    claim_next_job,
+    enqueue,
+    run_job,
+    run_pending_jobs,
+)
+from datetime import timedelta, timezone as dt_timezone
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.db import connection
+import unittest
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
 
 
 class ModelTests(TransactionTestCase):
@@ -116,11 +154,9 @@ class ModelTests(TransactionTestCase):
     def tearDown(self):
         # Clean up any created media files after each test
         for product in Product.objects.all():
-            if product.image:
-                product.image.delete(save=False)
+            delete_image_files(product)
         for global_product in GlobalProduct.objects.all():
-            if global_product.image:
-                global_product.image.delete(save=False)
+            delete_image_files(global_product)
 
     # --- ShopCategory Tests ---
     def test_shop_category_creation(self):
@@ -399,6 +435,524 @@ class ModelTests(TransactionTestCase):
         )
         self.assertEqual(product_no_stock.current_stock, Decimal("0.000"))
 
+    def test_product_stock_ledger_tracks_updates_and_deletes(self):
+        stock_entry = StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("20.000"),
+        )
+        sale_entry = SaleEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("5.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        self.assertEqual(self.product_oil_shop1.current_stock, Decimal("15.000"))
+
+        # Editing an entry applies only the difference
+        stock_entry.quantity = Decimal("25.000")
+        stock_entry.save()
+        self.assertEqual(self.product_oil_shop1.current_stock, Decimal("20.000"))
+
+        # Deleting a sale returns its quantity to stock
+        sale_entry.delete()
+        self.assertEqual(self.product_oil_shop1.current_stock, Decimal("25.000"))
+
+        # Moving an entry to another product moves its quantity too
+        stock_entry.product = self.product_wiper_shop1
+        stock_entry.save()
+        self.assertEqual(self.product_oil_shop1.current_stock, Decimal("0.000"))
+        self.assertEqual(self.product_wiper_shop1.current_stock, Decimal("25.000"))
+
+    def test_product_current_stock_reads_ledger_in_one_query(self):
+        for _ in range(5):
+            StockEntry.objects.create(
+                shop=self.shop,
+                worker=self.worker,
+                product=self.product_oil_shop1,
+                quantity=Decimal("2.000"),
+            )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.product_oil_shop1.current_stock, Decimal("10.000"))
+
+    def test_rebuild_stock_ledger_command(self):
+        StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("30.000"),
+        )
+        SaleEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("4.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        # Simulate drift, e.g. rows written behind the ledger's back
+        ProductStock.objects.filter(product=self.product_oil_shop1).update(
+            quantity=Decimal("999.000")
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_stock_ledger", "--verify", stdout=StringIO())
+
+        call_command("rebuild_stock_ledger", stdout=StringIO())
+        self.assertEqual(self.product_oil_shop1.current_stock, Decimal("26.000"))
+        self.assertEqual(
+            self.product_oil_shop1.current_stock,
+            self.product_oil_shop1.compute_stock_from_entries(),
+        )
+        call_command("rebuild_stock_ledger", "--verify", stdout=StringIO())
+
+    def test_entry_saves_maintain_daily_and_hourly_rollups(self):
+        stock_entry = StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("10.000"),
+            purchase_price=Decimal("20000.00"),
+        )
+        SaleEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("2.000"),
+            selling_price=Decimal("27000.00"),
+        )
+        MissedSaleEntry.objects.create(
+            shop=self.shop,
+            product=self.product_oil_shop1,
+            quantity_requested=Decimal("3.000"),
+        )
+        MissedSaleEntry.objects.create(
+            shop=self.shop, product_name_text="Unknown Part", quantity_requested=Decimal("1.000")
+        )
+        stock_entry.quantity = Decimal("12.000")
+        stock_entry.save()
+
+        day = timezone.localdate(stock_entry.recorded_at)
+        shop_day = ShopDailyRollup.objects.get(shop=self.shop, day=day)
+        self.assertEqual(shop_day.stock_in_quantity, Decimal("12.000"))
+        self.assertEqual(shop_day.stock_in_value, Decimal("240000.00"))
+        self.assertEqual(shop_day.stock_in_count, 1)
+        self.assertEqual(shop_day.sales_value, Decimal("54000.00"))
+        self.assertEqual(shop_day.missed_quantity, Decimal("4.000"))
+        self.assertEqual(shop_day.missed_count, 2)
+        self.assertEqual(
+            shop_day.missed_value, Decimal("3.000") * self.product_oil_shop1.price
+        )
+        product_day = ProductDailyRollup.objects.get(product=self.product_oil_shop1, day=day)
+        self.assertEqual(product_day.missed_count, 1)
+        self.assertEqual(
+            ShopHourlyRollup.objects.get(shop=self.shop).sales_quantity, Decimal("2.000")
+        )
+
+        stock_entry.delete()
+        shop_day.refresh_from_db()
+        self.assertEqual(shop_day.stock_in_quantity, Decimal("0.000"))
+        self.assertEqual(shop_day.stock_in_count, 0)
+
+    def test_missed_sale_rollup_value_ignores_later_price_changes(self):
+        entry = MissedSaleEntry.objects.create(
+            shop=self.shop,
+            product=self.product_oil_shop1,
+            quantity_requested=Decimal("2.000"),
+        )
+        self.assertEqual(entry.unit_price, self.product_oil_shop1.price)
+        self.product_oil_shop1.price += Decimal("1000.00")
+        self.product_oil_shop1.save()
+
+        entry.quantity_requested = Decimal("3.000")
+        entry.save()
+        day = timezone.localdate(entry.recorded_at)
+        shop_day = ShopDailyRollup.objects.get(shop=self.shop, day=day)
+        self.assertEqual(shop_day.missed_value, Decimal("3.000") * entry.unit_price)
+        call_command("rebuild_rollups", stdout=StringIO())
+        shop_day = ShopDailyRollup.objects.get(shop=self.shop, day=day)
+        self.assertEqual(shop_day.missed_value, Decimal("3.000") * entry.unit_price)
+
+        entry.delete()
+        shop_day.refresh_from_db()
+        self.assertEqual(shop_day.missed_value, Decimal("0.00"))
+        self.assertEqual(shop_day.missed_count, 0)
+        product_day = ProductDailyRollup.objects.get(product=self.product_oil_shop1, day=day)
+        self.assertEqual(product_day.missed_value, Decimal("0.00"))
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_rollup_adjust_many_locks_only_the_target_keys(self):
+        oil, wiper = self.product_oil_shop1, self.product_wiper_shop1
+        first_day = timezone.localdate()
+        second_day = first_day - timedelta(days=1)
+        for product, day in ((oil, first_day), (wiper, second_day), (oil, second_day)):
+            ProductDailyRollup.objects.create(shop=self.shop, product=product, day=day)
+        finished = []
+
+        def adjust():
+            try:
+                with transaction.atomic():
+                    ProductDailyRollup.adjust_many(
+                        {
+                            (self.shop.id, oil.id, first_day): {"sales_count": 1},
+                            (self.shop.id, wiper.id, second_day): {"sales_count": 1},
+                        }
+                    )
+                finished.append(True)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            # Another transaction holds a row matching the key columns
+            # separately, but not a target key
+            ProductDailyRollup.objects.select_for_update().get(product=oil, day=second_day)
+            thread = threading.Thread(target=adjust)
+            thread.start()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(finished, [True])
+        self.assertEqual(ProductDailyRollup.objects.filter(sales_count=1).count(), 2)
+
+    def test_rebuild_rollups_command_buckets_by_local_day(self):
+        entry = StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("5.000"),
+            purchase_price=Decimal("100.00"),
+        )
+        # 22:30 UTC is already the next day in Dar es Salaam (UTC+3)
+        recorded_at = timezone.datetime(2026, 1, 5, 22, 30, tzinfo=dt_timezone.utc)
+        StockEntry.objects.filter(pk=entry.pk).update(recorded_at=recorded_at)
+
+        call_command("rebuild_rollups", "--shop", str(self.shop.id), stdout=StringIO())
+        rollup = ShopDailyRollup.objects.get(shop=self.shop)
+        self.assertEqual(rollup.day, timezone.datetime(2026, 1, 6).date())
+        self.assertEqual(rollup.stock_in_value, Decimal("500.00"))
+        hourly = ShopHourlyRollup.objects.get(shop=self.shop)
+        self.assertEqual(hourly.hour, recorded_at.replace(minute=0))
+
+        # A rebuilt table matches what the incremental updates produce
+        SaleEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_oil_shop1,
+            quantity=Decimal("1.500"),
+            selling_price=Decimal("27000.00"),
+        )
+        incremental = list(
+            ProductDailyRollup.objects.order_by("day").values(
+                "product_id", "day", "stock_in_quantity", "sales_quantity", "sales_value"
+            )
+        )
+        call_command("rebuild_rollups", stdout=StringIO())
+        rebuilt = list(
+            ProductDailyRollup.objects.order_by("day").values(
+                "product_id", "day", "stock_in_quantity", "sales_quantity", "sales_value"
+            )
+        )
+        self.assertEqual(rebuilt, incremental)
+
+    def test_rollups_match_a_rebuild_after_product_and_queryset_deletes(self):
+        for product in (self.product_oil_shop1, self.product_wiper_shop1):
+            StockEntry.objects.create(
+                shop=self.shop,
+                worker=self.worker,
+                product=product,
+                quantity=Decimal("10.000"),
+                purchase_price=Decimal("100.00"),
+            )
+            SaleEntry.objects.create(
+                shop=self.shop,
+                worker=self.worker,
+                product=product,
+                quantity=Decimal("2.000"),
+                selling_price=Decimal("150.00"),
+            )
+        MissedSaleEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.product_wiper_shop1,
+            quantity_requested=Decimal("1.000"),
+            reason="OUT_OF_STOCK",
+        )
+
+        def rollups():
+            return {
+                model: list(
+                    model.objects.order_by(*model.key_fields).values(
+                        *model.key_fields,
+                        "stock_in_quantity",
+                        "stock_in_value",
+                        "sales_quantity",
+                        "sales_value",
+                        "sales_count",
+                        "missed_value",
+                        "missed_count",
+                    )
+                )
+                for model in (ShopDailyRollup, ShopHourlyRollup, ProductDailyRollup)
+            }
+
+        # Deleting a product cascades to its entries without their delete()
+        self.product_oil_shop1.delete()
+        SaleEntry.objects.filter(product=self.product_wiper_shop1).delete()
+        live = rollups()
+        self.assertEqual(live[ShopDailyRollup][0]["sales_count"], 0)
+        self.assertEqual(live[ShopDailyRollup][0]["stock_in_value"], Decimal("1000.00"))
+        self.assertEqual(self.product_wiper_shop1.current_stock, Decimal("10.000"))
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual(rollups(), live)
+
+    def test_import_products_command_reads_large_csv_in_chunks(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "products.csv")
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Name", "Price", "Quantity", "Quantity_Type"])
+            for i in range(4500):  # three import chunks
+                writer.writerow([f"Imported Item {i}", "100", "2", "UNIT"])
+            writer.writerow(["Loose Grease", "50", "1.5", "kilo"])
+
+        output = StringIO()
+        call_command("import_products", str(self.shop.id), path, stdout=output)
+        self.assertIn("Created 4500 product(s)", output.getvalue())
+        self.assertIn("Row 4502", output.getvalue())
+        self.assertEqual(
+            ProductStock.objects.filter(product__name__startswith="Imported Item").count(),
+            4500,
+        )
+
+        for shop_id in (str(uuid.uuid4()), "not-a-uuid"):
+            with self.assertRaisesMessage(CommandError, f"Shop {shop_id} not found."):
+                call_command("import_products", shop_id, path, stdout=StringIO())
+
+    def test_product_images_get_renditions_from_worker_and_command(self):
+        # Saving a product with a new image queues its processing
+        self.assertEqual(
+            BackgroundJob.objects.filter(kind="image_renditions").count(), 3
+        )
+        output = StringIO()
+        call_command("run_jobs", "--once", stdout=output)
+        self.assertIn("Ran 3 job(s), 0 failed", output.getvalue())
+
+        tire = GlobalProduct.objects.get(pk=self.global_product_tire.pk)
+        self.assertTrue(tire.image.name.endswith(".jpg"))  # re-encoded from PNG
+        self.assertEqual(tire.image_renditions["source"], tire.image.name)
+        thumb = tire.image_renditions["files"]["thumb"]["webp"]
+        self.assertTrue(tire.image.storage.exists(thumb))
+        # Saves that don't change the image queue nothing
+        tire.save()
+        self.assertFalse(BackgroundJob.objects.exists())
+
+        # Removing the image drops its renditions
+        tire.image = None
+        tire.save()
+        tire.save()  # queued once while pending
+        self.assertEqual(run_pending_jobs(), 1)
+        tire.refresh_from_db()
+        self.assertEqual(tire.image_renditions, {})
+        self.assertFalse(self.global_product_oil.image.storage.exists(thumb))
+
+        # Images stored before the pipeline existed are queued by the command
+        GlobalProduct.objects.filter(pk=self.global_product_oil.pk).update(
+            image_renditions={}
+        )
+        output = StringIO()
+        call_command("process_product_images", stdout=output)
+        self.assertIn("GlobalProduct: queued 1 images", output.getvalue())
+        run_pending_jobs()
+        self.global_product_oil.refresh_from_db()
+        self.assertEqual(
+            set(self.global_product_oil.image_renditions["files"]), {"thumb", "medium"}
+        )
+
+        # Processed images without content hashes just get them filled in
+        oil = self.global_product_oil
+        GlobalProduct.objects.filter(pk=oil.pk).update(image_digest="", image_phash="")
+        output = StringIO()
+        call_command("process_product_images", stdout=output)
+        self.assertIn("GlobalProduct: queued 1 images", output.getvalue())
+        run_pending_jobs()
+        refreshed = GlobalProduct.objects.get(pk=oil.pk)
+        self.assertEqual(refreshed.image.name, oil.image.name)
+        self.assertEqual(refreshed.image_renditions, oil.image_renditions)
+        self.assertEqual(refreshed.image_digest, oil.image_digest)
+        self.assertEqual(refreshed.image_phash, oil.image_phash)
+
+    def test_changing_an_image_clears_its_digest_until_it_is_processed(self):
+        run_pending_jobs()
+        tire = GlobalProduct.objects.get(pk=self.global_product_tire.pk)
+        old_digest = tire.image_digest
+        self.assertTrue(old_digest)
+
+        tire.image = self.create_fake_image("new_tire.png", color="black")
+        tire.save()
+        # The new upload must not be shared as the old image's content
+        self.assertEqual(GlobalProduct.objects.get(pk=tire.pk).image_digest, "")
+        run_pending_jobs()
+        tire.refresh_from_db()
+        self.assertNotIn(tire.image_digest, ("", old_digest))
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_image_files_are_not_released_under_a_row_starting_to_share_them(self):
+        run_pending_jobs()
+        tire = GlobalProduct.objects.get(pk=self.global_product_tire.pk)
+        oil = GlobalProduct.objects.get(pk=self.global_product_oil.pk)
+        # The tire's upload; digests are of the uploaded bytes
+        data = self.create_fake_image("global_tire.png", color="green").read()
+        storage = tire.image.storage
+
+        def remove_tire_image():
+            try:
+                _save_image(
+                    tire,
+                    {"image": None, "image_renditions": {}, "image_digest": "", "image_phash": ""},
+                )
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            # Oil takes over the tire's image; meanwhile the tire drops it
+            values = store_image(oil, data, "tire.jpg")
+            self.assertEqual(values["image"], tire.image.name)
+            thread = threading.Thread(target=remove_tire_image)
+            thread.start()
+            thread.join(timeout=1)
+            self.assertTrue(thread.is_alive())  # waiting for the shared row
+            _save_image(oil, values)
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+
+        self.assertEqual(GlobalProduct.objects.get(pk=tire.pk).image.name, None)
+        self.assertTrue(storage.exists(values["image"]))
+        for formats in values["image_renditions"]["files"].values():
+            for path in formats.values():
+                self.assertTrue(storage.exists(path))
+
+    # --- Background Job Tests ---
+    @override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_SECONDS=10)
+    def test_failing_job_is_retried_with_backoff_then_marked_failed(self):
+        BackgroundJob.objects.all().delete()
+        calls = []
+
+        def flaky(payload):
+            calls.append(payload)
+            raise ConnectionError("storage unreachable")
+
+        with mock.patch.dict(JOB_HANDLERS, {"flaky": flaky}), self.assertLogs(
+            "api.jobs", level="ERROR"
+        ):
+            job = enqueue("flaky", {"n": 1})
+            for attempt, delay in ((1, 10), (2, 20)):
+                self.assertEqual(run_pending_jobs(), 1)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts), (JOB_PENDING, attempt))
+                self.assertIn("storage unreachable", job.last_error)
+                self.assertAlmostEqual(
+                    (job.run_after - timezone.now()).total_seconds(), delay, delta=5
+                )
+                # Not due yet
+                self.assertEqual(run_pending_jobs(), 0)
+                BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+            self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JOB_FAILED, 3))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(run_pending_jobs(), 0)
+
+    def test_job_left_running_by_a_dead_worker_is_run_again(self):
+        BackgroundJob.objects.all().delete()
+        calls = []
+        with mock.patch.dict(JOB_HANDLERS, {"note": calls.append}):
+            job = enqueue("note", {"n": 1})
+            self.assertEqual(claim_next_job(), job)  # worker dies here
+            self.assertEqual(run_pending_jobs(), 0)
+
+            BackgroundJob.objects.filter(pk=job.pk).update(
+                locked_until=timezone.now() - timedelta(seconds=1)
+            )
+            self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(calls, [{"n": 1}])
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_a_key_is_pending_at_most_once(self):
+        BackgroundJob.objects.all().delete()
+        job = enqueue("note", {"n": 1}, key="note:1")
+        # A concurrent enqueue that passed the exists() check before this
+        # job committed
+        with mock.patch("django.db.models.query.QuerySet.exists", return_value=False):
+            self.assertIsNone(enqueue("note", {"n": 1}, key="note:1"))
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+        # Queued again while running: a failed attempt isn't retried as a
+        # second pending job
+        def fail(payload):
+            raise ConnectionError("storage unreachable")
+
+        self.assertEqual(claim_next_job(), job)
+        again = enqueue("note", {"n": 2}, key="note:1")
+        with mock.patch.dict(JOB_HANDLERS, {"note": fail}), self.assertLogs(
+            "api.jobs", level="ERROR"
+        ):
+            run_job(job)
+        self.assertEqual(list(BackgroundJob.objects.all()), [again])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2)
+    def test_job_that_keeps_killing_its_worker_is_marked_failed(self):
+        BackgroundJob.objects.all().delete()
+        cleaned_up = []
+        with mock.patch.dict(JOB_HANDLERS, {"crash": lambda payload: None}), mock.patch.dict(
+            JOB_FAILURE_HANDLERS, {"crash": cleaned_up.append}
+        ):
+            job = enqueue("crash", {"n": 1})
+            for attempt in (1, 2):
+                self.assertEqual(claim_next_job(), job)  # the worker dies each time
+                BackgroundJob.objects.filter(pk=job.pk).update(
+                    locked_until=timezone.now() - timedelta(seconds=1)
+                )
+            with self.assertLogs("api.jobs", level="ERROR"):
+                self.assertIsNone(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (JOB_FAILED, 2))
+        self.assertEqual(cleaned_up, [{"n": 1}])
+
+    @override_settings(JOB_MAX_ATTEMPTS=1)
+    def test_staged_upload_is_removed_when_its_job_fails_or_is_abandoned(self):
+        BackgroundJob.objects.all().delete()
+        staging_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_root)
+        self.enterContext(override_settings(IMAGE_STAGING_ROOT=staging_root))
+        storage = staging_storage()
+        staged = storage.save("unreadable.jpg", ContentFile(b"image"))
+        stage_args = {"model": "product", "pk": str(self.product_oil_shop1.pk)}
+        enqueue(
+            "attach_image",
+            {**stage_args, "staged": staged, "filename": "a.jpg", "source": "staging"},
+        )
+        with mock.patch("api.images.store_image", side_effect=OSError("disk full")), self.assertLogs(
+            "api.jobs", level="ERROR"
+        ):
+            run_pending_jobs()
+        self.assertEqual(BackgroundJob.objects.get().status, JOB_FAILED)
+        self.assertFalse(storage.exists(staged))
+
+        # Staged by a request that rolled back, so no job refers to it
+        orphan = storage.save("orphan.jpg", ContentFile(b"image"))
+        queued = storage.save("queued.jpg", ContentFile(b"image"))
+        enqueue(
+            "attach_image",
+            {**stage_args, "staged": queued, "filename": "q.jpg", "source": "staging"},
+        )
+        self.assertEqual(sweep_staged_uploads(), 0)  # too recent
+        with override_settings(IMAGE_STAGING_MAX_AGE_SECONDS=-60):
+            self.assertEqual(sweep_staged_uploads(), 1)
+        self.assertFalse(storage.exists(orphan))
+        self.assertTrue(storage.exists(queued))
+
     # --- StockEntry Tests ---
     def test_stock_entry_creation(self):
         entry = StockEntry.objects.create(
@@ -503,3 +1057,140 @@ class ModelTests(TransactionTestCase):
         )
         expected_str_text = f"Missed Sale: Rare Component - 3.000 in Test Shop (Not found)"
         self.assertEqual(str(entry_with_text), expected_str_text)
+
+    # --- AuthToken Tests ---
+    def test_token_lookup_is_served_from_cache(self):
+        token = token_store.generate_token_for(self.worker)
+        self.assertTrue(AuthToken.objects.filter(key=token, worker=self.worker).exists())
+        with self.assertNumQueries(0):
+            self.assertEqual(token_store.lookup_token(token), ("worker", self.worker.id))
+
+    def test_token_survives_cold_cache_like_another_process(self):
+        token = token_store.generate_token_for(self.manager_user)
+        token_store._cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                token_store.lookup_token(token), ("manager", self.manager_user.id)
+            )
+        self.assertEqual(token_store.get_user_or_worker_by_token(token), self.manager_user)
+
+    def test_removed_and_expired_tokens_are_rejected(self):
+        token = token_store.generate_token_for(self.worker)
+        token_store.remove_token(token)
+        self.assertIsNone(token_store.lookup_token(token))
+
+        token = token_store.generate_token_for(self.worker)
+        AuthToken.objects.filter(key=token).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        token_store._cache.clear()
+        self.assertIsNone(token_store.get_user_or_worker_by_token(token))
+        # Expired rows are left to the clear_expired_tokens command
+        live = token_store.generate_token_for(self.worker)
+        self.assertTrue(AuthToken.objects.filter(key=token).exists())
+        output = StringIO()
+        call_command("clear_expired_tokens", "--batch-size", "1", stdout=output)
+        self.assertIn("Deleted 1 expired token(s)", output.getvalue())
+        self.assertFalse(AuthToken.objects.filter(key=token).exists())
+        self.assertTrue(AuthToken.objects.filter(key=live).exists())
+
+    # --- Managed shop ID cache Tests ---
+    def test_managed_shop_ids_are_cached_per_user(self):
+        self.assertEqual(managed_shop_ids(self.manager_user), frozenset([self.shop.id]))
+        # A fresh User object (i.e. the next request) is served from the cache
+        user = User.objects.get(pk=self.manager_user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(managed_shop_ids(user), frozenset([self.shop.id]))
+
+    def test_managed_shop_ids_cache_follows_manager_changes(self):
+        other_shop = Shop.objects.create(name="Other Shop", business_id="OS001")
+        fresh = lambda: managed_shop_ids(User.objects.get(pk=self.manager_user.pk))
+        self.assertEqual(fresh(), frozenset([self.shop.id]))
+
+        other_shop.managers.add(self.manager_user)
+        self.assertEqual(fresh(), frozenset([self.shop.id, other_shop.id]))
+
+        self.manager_user.managed_shops.remove(self.shop)
+        self.assertEqual(fresh(), frozenset([other_shop.id]))
+
+        other_shop.managers.clear()
+        self.assertEqual(fresh(), frozenset())
+
+        self.shop.managers.add(self.manager_user)
+        other_shop.managers.add(self.manager_user)
+        self.assertEqual(fresh(), frozenset([self.shop.id, other_shop.id]))
+        other_shop.delete()
+        self.assertEqual(fresh(), frozenset([self.shop.id]))
+
+    def test_managed_shop_ids_cache_is_dropped_again_after_commit(self):
+        other_shop = Shop.objects.create(name="Other Shop", business_id="OS001")
+        fresh = lambda: managed_shop_ids(User.objects.get(pk=self.manager_user.pk))
+        with transaction.atomic():
+            other_shop.managers.add(self.manager_user)
+            # A concurrent request that read before the commit caches the old set
+            cache.set(_managed_shops_cache_key(self.manager_user.pk), frozenset([self.shop.id]))
+        self.assertEqual(fresh(), frozenset([self.shop.id, other_shop.id]))
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "EXPLAIN checks target PostgreSQL")
+class IndexUsageTests(TestCase):
+    """
+    Checks that the hot queries are planned on the indexes meant for them.
+    Test tables are tiny, so sequential scans, bitmap scans and sorts are
+    switched off for the duration of each test to make the planner show which
+    index it would use.
+    """
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name="Index Shop", business_id="IDX001")
+        self.worker = Worker.objects.create(
+            shop=self.shop, first_name="Idx", phone_number="+255700000001"
+        )
+        self.product = Product.objects.create(
+            shop=self.shop, name="Indexed Oil", barcode="IDX-OIL", price=Decimal("1.00")
+        )
+        # Enough distinct barcodes for the planner to prefer the composite index
+        Product.objects.bulk_create(
+            Product(shop=self.shop, name=f"Filler {i}", barcode=f"FILL-{i}", price=Decimal("1.00"))
+            for i in range(300)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE api_product")
+            for setting in ("enable_seqscan", "enable_bitmapscan", "enable_sort"):
+                cursor.execute(f"SET LOCAL {setting} = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_entry_lists_use_shop_recorded_index(self):
+        for model, index_name in [
+            (StockEntry, "stockentry_shop_recorded_id"),
+            (SaleEntry, "saleentry_shop_recorded_id"),
+            (MissedSaleEntry, "missedsale_shop_recorded_id"),
+        ]:
+            self.assertUsesIndex(
+                model.objects.filter(shop=self.shop).order_by("-recorded_at", "id")[:10],
+                index_name,
+            )
+
+    def test_product_history_uses_product_recorded_index(self):
+        self.assertUsesIndex(
+            SaleEntry.objects.filter(product=self.product).order_by("recorded_at"),
+            "saleentry_product_recorded",
+        )
+        self.assertUsesIndex(
+            StockEntry.objects.filter(product=self.product).order_by("recorded_at"),
+            "stockentry_product_recorded",
+        )
+
+    def test_barcode_and_phone_lookups_use_indexes(self):
+        self.assertUsesIndex(
+            # as in Product.objects.get(shop=..., barcode=...), which drops ordering
+            Product.objects.filter(shop=self.shop, barcode="IDX-OIL").order_by(),
+            "product_shop_barcode_idx",
+        )
+        self.assertUsesIndex(
+            Worker.objects.filter(phone_number="+255700000001").order_by(),
+            "worker_phone_number_idx",
+        )
@@ -1,6 +1,9 @@
 # dukani/backend/api/tests/test_serializers.py
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.db import connection, transaction
+from django.utils import timezone
+import threading
 from django.contrib.auth.models import User
 from decimal import Decimal
 import uuid
@@ -24,20 +27,27 @@ from api.models import (
     REFURBISHED,
     REVIEWED,
     USED,  # Import USED
+    ProductStock,
+    BackgroundJob,
+    ShopDailyRollup,
 )
 from api.serializers import (
     ShopSerializer,
     WorkerSerializer,
     ProductSerializer,
     StockEntrySerializer,
+    StockEntryBulkSerializer,
     StockEntryCreateUpdateSerializer,
     SaleEntrySerializer,
+    SaleEntryBulkSerializer,
     MissedSaleEntrySerializer,
     ShopCategorySerializer,
     GlobalProductSerializer,
     CategorySerializer,
 )
 from django.core.files.uploadedfile import SimpleUploadedFile
+from api.images import delete_image_files, staging_storage
+from api.jobs import run_pending_jobs
 from PIL import Image
 from io import BytesIO
 
@@ -155,11 +165,9 @@ class SerializerTests(TestCase):
     def tearDown(self):
         # Clean up any created media files after each test
         for product in Product.objects.all():
-            if product.image:
-                product.image.delete(save=False)
+            delete_image_files(product)
         for global_product in GlobalProduct.objects.all():
-            if global_product.image:
-                global_product.image.delete(save=False)
+            delete_image_files(global_product)
 
     # --- ShopSerializer Tests ---
     def test_shop_serializer_create_with_image_upload_setting(self):
@@ -204,6 +212,8 @@ class SerializerTests(TestCase):
         self.assertIsNotNone(product.id)
         self.assertEqual(product.name, "New Product with Image")
         self.assertEqual(product.quality_type, USED)
+        run_pending_jobs()  # The background worker stores the upload
+        product.refresh_from_db()
         self.assertIsNotNone(product.image)
         self.assertIn("shop_product_images/", product.image.name)
         self.assertEqual(
@@ -231,6 +241,7 @@ class SerializerTests(TestCase):
         )
         self.assertTrue(serializer.is_valid(), serializer.errors)
         product = serializer.save()
+        run_pending_jobs()
         product.refresh_from_db()
 
         self.assertEqual(product.price, Decimal("9000.00"))
@@ -276,6 +287,8 @@ class SerializerTests(TestCase):
 
         self.assertIsNotNone(global_product.id)
         self.assertEqual(global_product.name, "New Global Widget")
+        run_pending_jobs()
+        global_product.refresh_from_db()
         self.assertIsNotNone(global_product.image)
         self.assertIn("global_product_images/", global_product.image.name)
 
@@ -439,9 +452,17 @@ class SerializerTests(TestCase):
         self.assertTrue(serializer.is_valid(), serializer.errors)
         entry = serializer.save()
 
+        # Nothing is written to MediaStorage during the request; the upload is
+        # staged and stored by the background worker
         new_product = Product.objects.get(name="New Image Item", shop=self.shop)
-        self.assertIsNotNone(new_product.image)
+        self.assertFalse(new_product.image)
+        job = BackgroundJob.objects.get(kind="attach_image")
+        self.assertEqual(job.payload["pk"], str(new_product.pk))
+        run_pending_jobs()
+        new_product.refresh_from_db()
         self.assertIn("shop_product_images/", new_product.image.name)
+        self.assertEqual(set(new_product.image_renditions["files"]), {"thumb", "medium"})
+        self.assertFalse(staging_storage().exists(job.payload["staged"]))
         self.assertEqual(new_product.status, PENDING_REVIEW)
         self.assertEqual(entry.product, new_product)
 
@@ -597,6 +618,81 @@ class SerializerTests(TestCase):
         ):
             serializer.is_valid(raise_exception=True)
 
+    # --- StockEntryBulkSerializer Tests ---
+    def test_stock_entry_bulk_serializer_resolves_and_creates_products(self):
+        shop = self.shop_no_image_required
+        known = Product.objects.create(
+            shop=shop, name="Known Oil", barcode="KNOWN001", price=Decimal("100.00")
+        )
+        data = {
+            "shop": str(shop.id),
+            "worker": str(self.worker_shop_b.id),
+            "lines": [
+                {"product": str(known.id), "quantity": "2", "purchase_price": "90.00"},
+                {"product_name_text": "Known Oil", "quantity": "3"},
+                {"barcode_text": "KNOWN001", "quantity": "4"},
+                {"product_name_text": "Fresh Item", "barcode_text": "FRESH001", "quantity": "5", "purchase_price": "50.00"},
+                {"product_name_text": "Fresh Item", "quantity": "1"},
+                {"product_name_text": "Loose Rice", "product_quantity_type": WEIGHT_VOLUME, "quantity": "2.5"},
+            ],
+        }
+        serializer = StockEntryBulkSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        entries = serializer.save()
+
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(StockEntry.objects.filter(shop=shop).count(), 6)
+        self.assertEqual(known.current_stock, Decimal("9.000"))
+
+        fresh = Product.objects.get(shop=shop, name="Fresh Item")
+        self.assertEqual(fresh.barcode, "FRESH001")
+        self.assertEqual(fresh.price, Decimal("50.00"))
+        self.assertEqual(fresh.status, PENDING_REVIEW)
+        self.assertEqual(fresh.current_stock, Decimal("6.000"))
+
+        rice = Product.objects.get(shop=shop, name="Loose Rice")
+        self.assertEqual(rice.quantity_type, WEIGHT_VOLUME)
+        self.assertEqual(rice.current_stock, Decimal("2.500"))
+
+    def test_stock_entry_bulk_serializer_query_count_is_constant(self):
+        shop = self.shop_no_image_required
+        data = {
+            "shop": str(shop.id),
+            "worker": str(self.worker_shop_b.id),
+            "lines": [
+                {"product_name_text": f"Delivery Item {i}", "barcode_text": f"DLV{i:03d}", "quantity": "10", "purchase_price": "100.00"}
+                for i in range(50)
+            ],
+        }
+        # shop + worker + product lookup + product insert/re-read + entry insert
+        # + ledger insert/update + locked read/insert per product rollup table
+        # (plus savepoint statements for the atomic blocks). Shop rollups are
+        # written after commit.
+        with self.assertNumQueries(20):
+            serializer = StockEntryBulkSerializer(data=data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+        self.assertEqual(Product.objects.filter(shop=shop).count(), 50)
+
+    def test_stock_entry_bulk_serializer_reports_line_errors(self):
+        data = {
+            "shop": str(self.shop.id),  # requires an image for new products
+            "worker": str(self.worker.id),
+            "lines": [
+                {"product": str(self.existing_product.id), "quantity": "2"},
+                {"product_name_text": "No Image Item", "quantity": "1"},
+                {"product": str(self.existing_product.id), "quantity": "1.5"},
+                {"barcode_text": "UNKNOWN-BARCODE", "quantity": "1"},
+            ],
+        }
+        serializer = StockEntryBulkSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        line_errors = serializer.errors["lines"]
+        self.assertEqual(line_errors[0], {})
+        self.assertIn("Image upload is required", str(line_errors[1]))
+        self.assertIn("quantity", line_errors[2])
+        self.assertIn("Product name is required", str(line_errors[3]))
+
     # --- SaleEntrySerializer Tests ---
     def test_sale_entry_serializer_create(self):
         data = {
@@ -634,6 +730,168 @@ class SerializerTests(TestCase):
         ):
             serializer.is_valid(raise_exception=True)
 
+    # --- SaleEntryBulkSerializer Tests ---
+    def _bulk_sale_data(self, lines):
+        return {
+            "shop": str(self.shop.id),
+            "worker": str(self.worker.id),
+            "lines": lines,
+        }
+
+    def test_sale_entry_bulk_serializer_create(self):
+        StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.liquid_product,
+            quantity=Decimal("10.000"),
+        )
+        data = self._bulk_sale_data(
+            [
+                {"product": str(self.existing_product.id), "quantity": "3", "selling_price": "5500.00"},
+                {"product": str(self.liquid_product.id), "quantity": "1.5", "selling_price": "12000.00"},
+                {"product": str(self.existing_product.id), "quantity": "2", "selling_price": "5400.00", "notes": "Discount"},
+            ]
+        )
+        serializer = SaleEntryBulkSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        entries = serializer.save()
+
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[2].notes, "Discount")
+        self.assertEqual(SaleEntry.objects.count(), 3)
+        self.assertEqual(self.existing_product.current_stock, Decimal("95.000"))
+        self.assertEqual(self.liquid_product.current_stock, Decimal("8.500"))
+
+    def test_sale_entry_bulk_serializer_query_count_is_constant(self):
+        products = [self.existing_product]
+        for i in range(10):
+            product = Product.objects.create(
+                shop=self.shop, name=f"Basket Item {i}", price=Decimal("100.00")
+            )
+            StockEntry.objects.create(
+                shop=self.shop, worker=self.worker, product=product, quantity=Decimal("5")
+            )
+            products.append(product)
+        data = self._bulk_sale_data(
+            [
+                {"product": str(product.id), "quantity": "1", "selling_price": "100.00"}
+                for product in products
+            ]
+        )
+        # shop + worker + products + locked stock rows + insert + ledger insert/update
+        # + a locked read/update per product rollup (the rows exist from the
+        # deliveries above) (plus savepoint statements for the atomic blocks).
+        # Shop rollups are written after commit.
+        with self.assertNumQueries(15):
+            serializer = SaleEntryBulkSerializer(data=data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+
+    def test_sale_entry_bulk_serializer_rejects_whole_basket_on_insufficient_stock(self):
+        data = self._bulk_sale_data(
+            [
+                {"product": str(self.existing_product.id), "quantity": "60", "selling_price": "5500.00"},
+                {"product": str(self.existing_product.id), "quantity": "50", "selling_price": "5500.00"},
+            ]
+        )
+        serializer = SaleEntryBulkSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaisesMessage(ValidationError, "Not enough stock for Shop Spark Plug"):
+            serializer.save()
+        self.assertEqual(SaleEntry.objects.count(), 0)
+        self.assertEqual(self.existing_product.current_stock, Decimal("100.000"))
+
+    def test_sale_entry_bulk_serializer_reports_line_errors(self):
+        other_shop_product = Product.objects.create(
+            shop=self.shop_no_image_required, name="Elsewhere", price=Decimal("10.00")
+        )
+        data = self._bulk_sale_data(
+            [
+                {"product": str(self.existing_product.id), "quantity": "1", "selling_price": "5500.00"},
+                {"product": str(other_shop_product.id), "quantity": "1", "selling_price": "10.00"},
+                {"product": str(self.existing_product.id), "quantity": "1.5", "selling_price": "5500.00"},
+            ]
+        )
+        serializer = SaleEntryBulkSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        line_errors = serializer.errors["lines"]
+        self.assertEqual(line_errors[0], {})
+        self.assertIn("product", line_errors[1])
+        self.assertIn("quantity", line_errors[2])
+
+    # --- Idempotent (client_id) create Tests ---
+    def test_sale_entry_serializer_replay_with_client_id_is_not_reinserted(self):
+        client_id = str(uuid.uuid4())
+        data = {
+            "shop": str(self.shop.id),
+            "worker": str(self.worker.id),
+            "product": str(self.existing_product.id),
+            "quantity": "4",
+            "selling_price": "5500.00",
+            "client_id": client_id,
+        }
+        first = SaleEntrySerializer(data=data)
+        self.assertTrue(first.is_valid(), first.errors)
+        original = first.save()
+
+        replay = SaleEntrySerializer(data=data)
+        self.assertTrue(replay.is_valid(), replay.errors)
+        replayed = replay.save()
+
+        self.assertEqual(replayed.pk, original.pk)
+        self.assertEqual(SaleEntry.objects.filter(client_id=client_id).count(), 1)
+        self.assertEqual(self.existing_product.current_stock, Decimal("96.000"))
+        self.assertEqual(replay.data["id"], first.data["id"])
+
+    def test_stock_and_missed_sale_replays_with_client_id(self):
+        stock_data = {
+            "shop": str(self.shop.id),
+            "worker": str(self.worker.id),
+            "product": str(self.existing_product.id),
+            "quantity": "10",
+            "client_id": str(uuid.uuid4()),
+        }
+        missed_data = {
+            "shop": str(self.shop.id),
+            "worker": str(self.worker.id),
+            "product_name_text": "Rare Widget",
+            "quantity_requested": "1",
+            "client_id": str(uuid.uuid4()),
+        }
+        for _ in range(3):
+            for serializer_class, data in [
+                (StockEntrySerializer, stock_data),
+                (MissedSaleEntrySerializer, missed_data),
+            ]:
+                serializer = serializer_class(data=data)
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+                serializer.save()
+
+        self.assertEqual(StockEntry.objects.filter(client_id=stock_data["client_id"]).count(), 1)
+        self.assertEqual(MissedSaleEntry.objects.count(), 1)
+        self.assertEqual(self.existing_product.current_stock, Decimal("110.000"))
+
+    def test_sale_entry_bulk_serializer_replays_queue(self):
+        lines = [
+            {"product": str(self.existing_product.id), "quantity": "1", "selling_price": "5500.00", "client_id": str(uuid.uuid4())},
+            {"product": str(self.existing_product.id), "quantity": "2", "selling_price": "5500.00", "client_id": str(uuid.uuid4())},
+        ]
+        first = SaleEntryBulkSerializer(data=self._bulk_sale_data(lines))
+        self.assertTrue(first.is_valid(), first.errors)
+        original = first.save()
+
+        # The app retries the whole queue with one extra line appended
+        lines.append(
+            {"product": str(self.existing_product.id), "quantity": "3", "selling_price": "5500.00", "client_id": str(uuid.uuid4())}
+        )
+        replay = SaleEntryBulkSerializer(data=self._bulk_sale_data(lines))
+        self.assertTrue(replay.is_valid(), replay.errors)
+        replayed = replay.save()
+
+        self.assertEqual([entry.pk for entry in replayed[:2]], [entry.pk for entry in original])
+        self.assertEqual(SaleEntry.objects.count(), 3)
+        self.assertEqual(self.existing_product.current_stock, Decimal("94.000"))
+
     # --- MissedSaleEntrySerializer Tests ---
     def test_missed_sale_entry_serializer_create_with_product(self):
         data = {
@@ -711,3 +969,154 @@ class SerializerTests(TestCase):
             ValidationError, "Quantity must be a whole number for 'UNIT' type products."
         ):
             serializer.is_valid(raise_exception=True)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class SaleEntryConcurrencyTests(TransactionTestCase):
+    """
+    Stress tests for the row-locked stock check in SaleEntrySerializer.create.
+    Needs a database with real row locks (PostgreSQL), so it is skipped on SQLite.
+    """
+
+    def setUp(self):
+        self.shop = Shop.objects.create(name="Busy Shop", business_id="BUSY001")
+        self.worker = Worker.objects.create(
+            shop=self.shop, first_name="Till", phone_number="+255700000001"
+        )
+        self.product = Product.objects.create(
+            shop=self.shop, name="Last Units", price=Decimal("1000.00"), quantity_type=UNIT
+        )
+        self.other_product = Product.objects.create(
+            shop=self.shop, name="Other Item", price=Decimal("500.00"), quantity_type=UNIT
+        )
+        StockEntry.objects.create(
+            shop=self.shop, worker=self.worker, product=self.product, quantity=Decimal("5")
+        )
+        StockEntry.objects.create(
+            shop=self.shop,
+            worker=self.worker,
+            product=self.other_product,
+            quantity=Decimal("5"),
+        )
+
+    def _sell(self, product, results, barrier=None):
+        try:
+            if barrier:
+                barrier.wait()
+            serializer = SaleEntrySerializer(
+                data={
+                    "shop": str(self.shop.id),
+                    "worker": str(self.worker.id),
+                    "product": str(product.id),
+                    "quantity": "1",
+                    "selling_price": "1000.00",
+                }
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            results.append("sold")
+        except ValidationError:
+            results.append("rejected")
+        finally:
+            connection.close()
+
+    def test_concurrent_sales_never_oversell(self):
+        thread_count = 20
+        results = []
+        barrier = threading.Barrier(thread_count)
+        threads = [
+            threading.Thread(target=self._sell, args=(self.product, results, barrier))
+            for _ in range(thread_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count("sold"), 5)
+        self.assertEqual(results.count("rejected"), thread_count - 5)
+        self.assertEqual(SaleEntry.objects.filter(product=self.product).count(), 5)
+        self.assertEqual(self.product.current_stock, Decimal("0.000"))
+        self.assertEqual(
+            self.product.current_stock, self.product.compute_stock_from_entries()
+        )
+
+    def test_concurrent_replays_of_one_client_id_insert_once(self):
+        client_id = str(uuid.uuid4())
+        thread_count = 8
+        barrier = threading.Barrier(thread_count)
+        results = []
+
+        def replay():
+            try:
+                barrier.wait()
+                serializer = SaleEntrySerializer(
+                    data={
+                        "shop": str(self.shop.id),
+                        "worker": str(self.worker.id),
+                        "product": str(self.product.id),
+                        "quantity": "1",
+                        "selling_price": "1000.00",
+                        "client_id": client_id,
+                    }
+                )
+                serializer.is_valid(raise_exception=True)
+                results.append(serializer.save().pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=replay) for _ in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), thread_count)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(SaleEntry.objects.filter(client_id=client_id).count(), 1)
+        self.assertEqual(self.product.current_stock, Decimal("4.000"))
+
+    def test_lock_on_one_product_does_not_block_other_products(self):
+        results = []
+        with transaction.atomic():
+            # Hold the lock on the first product's stock row
+            ProductStock.locked_quantity(self.product.pk)
+
+            thread = threading.Thread(
+                target=self._sell, args=(self.other_product, results)
+            )
+            thread.start()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual(results, ["sold"])
+
+    def test_open_sale_does_not_block_sales_of_other_products_in_the_shop(self):
+        results = []
+        with transaction.atomic():
+            # A sale whose transaction hasn't committed yet
+            serializer = SaleEntrySerializer(
+                data={
+                    "shop": str(self.shop.id),
+                    "worker": str(self.worker.id),
+                    "product": str(self.product.id),
+                    "quantity": "1",
+                    "selling_price": "1000.00",
+                }
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+            thread = threading.Thread(
+                target=self._sell, args=(self.other_product, results)
+            )
+            thread.start()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual(results, ["sold"])
+        # The shop rollups count both sales once they have committed
+        rollup = ShopDailyRollup.objects.get(shop=self.shop, day=timezone.localdate())
+        self.assertEqual(rollup.sales_count, 2)
+        self.assertEqual(rollup.sales_quantity, Decimal("2.000"))
+        self.assertEqual(self.other_product.current_stock, Decimal("4.000"))
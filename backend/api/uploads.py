@@ -0,0 +1,147 @@
+# dukani/backend/api/uploads.py
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from .images import queue_uploaded_image, upload_is_queued
+from .models import BackgroundJob
+
+# Content types accepted for direct uploads -> extension of the uploaded key
+IMAGE_UPLOAD_CONTENT_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+UPLOAD_TOKEN_SALT = "api.uploads.image"
+
+
+class PresignedUploadsUnavailable(Exception):
+    """The media storage can't issue presigned URLs (it is not S3/MinIO)."""
+
+
+class InvalidImageUpload(Exception):
+    """A direct upload can't be attached; the message is shown to the client."""
+
+
+def presigned_put_url(storage, name, content_type, expires):
+    """
+    A URL the client can PUT the file for `name` to, straight into the
+    storage's S3/MinIO bucket, valid for `expires` seconds. The request must
+    send the same Content-Type header, which is part of the signature.
+    """
+    bucket = getattr(storage, "bucket", None)  # S3Boto3Storage only
+    if bucket is None:
+        raise PresignedUploadsUnavailable(
+            "Direct uploads need S3/MinIO media storage; upload the image with the product instead."
+        )
+    return bucket.meta.client.generate_presigned_url(
+        "put_object",
+        Params={
+            "Bucket": bucket.name,
+            "Key": storage._normalize_name(name),
+            "ContentType": content_type,
+        },
+        ExpiresIn=expires,
+        HttpMethod="PUT",
+    )
+
+
+def issue_image_upload(instance, content_type):
+    """
+    Starts a direct upload of a new image for a Product or GlobalProduct.
+    Returns what the client needs: the presigned URL, the method and headers
+    to use, and an upload token to confirm the upload with once it is done.
+    """
+    expires = getattr(settings, "IMAGE_UPLOAD_URL_SECONDS", 900)
+    name = (
+        f"uploads/{instance._meta.model_name}/"
+        f"{uuid.uuid4().hex}{IMAGE_UPLOAD_CONTENT_TYPES[content_type]}"
+    )
+    url = presigned_put_url(instance.image.storage, name, content_type, expires)
+    token = signing.dumps(
+        {"model": instance._meta.model_name, "pk": str(instance.pk), "name": name},
+        salt=UPLOAD_TOKEN_SALT,
+    )
+    return {
+        "upload_url": url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "upload_token": token,
+        "expires_in": expires,
+    }
+
+
+def attach_image_upload(instance, token):
+    """
+    Confirms a direct upload: checks that `token` was issued for `instance`
+    and that the file is in storage and within IMAGE_MAX_UPLOAD_BYTES, then
+    queues it to become the instance's image (re-encoded, with renditions).
+    Raises InvalidImageUpload otherwise, also when the upload has been
+    confirmed before: a token can't be replayed to attach the file again.
+    """
+    try:
+        upload = signing.loads(
+            token,
+            salt=UPLOAD_TOKEN_SALT,
+            max_age=getattr(settings, "IMAGE_UPLOAD_CONFIRM_SECONDS", 3600),
+        )
+    except signing.BadSignature:  # also SignatureExpired
+        raise InvalidImageUpload("The upload token is invalid or has expired.")
+    if upload["model"] != instance._meta.model_name or upload["pk"] != str(instance.pk):
+        raise InvalidImageUpload("The upload token was issued for another product.")
+
+    storage = instance.image.storage
+    with transaction.atomic():
+        # Confirmations of the same instance's uploads take turns, so two
+        # requests with one token can't both find it unused.
+        type(instance).objects.select_for_update().filter(pk=instance.pk).exists()
+        if upload_is_queued(upload["name"]):
+            raise InvalidImageUpload("This upload has already been confirmed.")
+        if not storage.exists(upload["name"]):
+            raise InvalidImageUpload("No file has been uploaded for this token.")
+        if storage.size(upload["name"]) > getattr(
+            settings, "IMAGE_MAX_UPLOAD_BYTES", 20 * 1024 * 1024
+        ):
+            storage.delete(upload["name"])
+            raise InvalidImageUpload("The uploaded file is too large.")
+        queue_uploaded_image(instance, upload["name"])
+
+
+def sweep_unconfirmed_uploads(storage, model_names=("product", "globalproduct")):
+    """
+    Deletes direct uploads (uploads/<model>/ in `storage`) that were never
+    confirmed: older than IMAGE_UPLOAD_CONFIRM_SECONDS, so their token has
+    expired, and not referred to by an attach_image job. Returns how many it
+    deleted.
+    """
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, "IMAGE_UPLOAD_CONFIRM_SECONDS", 3600)
+    )
+    deleted = 0
+    for model_name in model_names:
+        directory = f"uploads/{model_name}"
+        try:
+            files = storage.listdir(directory)[1]
+        except FileNotFoundError:  # FileSystemStorage, before any upload
+            continue
+        old = [
+            f"{directory}/{file}"
+            for file in files
+            if storage.get_modified_time(f"{directory}/{file}") < cutoff
+        ]
+        queued = set(
+            BackgroundJob.objects.filter(
+                kind="attach_image", payload__source="media", payload__staged__in=old
+            ).values_list("payload__staged", flat=True)
+        )
+        for name in old:
+            if name not in queued:
+                storage.delete(name)
+                deleted += 1
+    return deleted
@@ -23,4 +23,5 @@ urlpatterns = [
     
     path('auth/dummy-login/', views.dummy_login, name='dummy_login'),
     path('auth/me/', views.me, name='me'),  # Optional but useful
+    path('sync/changes/', views.sync_changes, name='sync_changes'),
 ]
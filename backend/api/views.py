@@ -15,12 +15,18 @@ from django.db.models import (
     OuterRef,
     Subquery,
     F,  # Added F import
+    DecimalField,
+    Prefetch,
 )
 from django.db.models.functions import Coalesce
 from decimal import Decimal
 import uuid  # For generating UUIDs for new products/entries
+import zoneinfo
+from datetime import date, datetime, time, timedelta
 from django.utils import timezone  # For setting recorded_at
+from django.conf import settings
 from django.db import transaction  # For atomic operations
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .models import (
@@ -47,9 +53,12 @@ from .serializers import (
     GlobalProductSerializer,
     ProductSerializer,
     StockEntrySerializer,
+    StockEntryBulkSerializer,
     SaleEntrySerializer,
+    SaleEntryBulkSerializer,
     MissedSaleEntrySerializer,
     ShopCategorySerializer,
+    ProductImportJobSerializer,
 )
 from .permissions import (
     IsManagerOfShop,
@@ -59,7 +68,80 @@ from .permissions import (
     IsManagerOfRelatedShop,
 )
 from .auth.token_store import generate_token_for, remove_token
+from .auth.principal import managed_shop_ids
+from .pagination import EntryPagination
+from .search import search_by_name_or_barcode, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from .barcodes import lookup_barcode
+from .image_matching import similar_global_products
+from .autocomplete import (
+    prefix_indexes,
+    AUTOCOMPLETE_DEFAULT_LIMIT,
+    AUTOCOMPLETE_MAX_LIMIT,
+)
+from .analytics import (
+    daily_stock_movement,
+    STOCK_MOVEMENT_DEFAULT_DAYS,
+    STOCK_MOVEMENT_MAX_DAYS,
+)
+from .exports import export_chunks, EXPORT_FORMATS
+from .uploads import (
+    IMAGE_UPLOAD_CONTENT_TYPES,
+    InvalidImageUpload,
+    PresignedUploadsUnavailable,
+    attach_image_upload,
+    issue_image_upload,
+)
+from .imports import queue_product_import
+from .sync import collect_changes, InvalidCursor, SYNC_DEFAULT_LIMIT, SYNC_MAX_LIMIT
 from rest_framework.decorators import api_view
+from django.core.exceptions import ValidationError as DjangoValidationError
+
+
+def _select_rendered(queryset, *related_fields):
+    """
+    Joins the relations behind `related_fields` (e.g. "shop__name") with
+    select_related() and loads only those columns from them, so a serializer
+    that renders related names doesn't fetch each related row on its own.
+    """
+    relations = set()
+    for field in related_fields:
+        parts = field.split("__")[:-1]
+        relations.update("__".join(parts[: i + 1]) for i in range(len(parts)))
+    own_fields = [field.name for field in queryset.model._meta.concrete_fields]
+    return queryset.select_related(*relations).only(
+        *own_fields, *relations, *related_fields
+    )
+
+
+def _requested_shop_id(request):
+    """
+    The shop a shop-scoped lookup runs against: a worker's own shop, or the
+    'shop' query parameter for managers (who must manage it) and admins.
+    Returns (shop_id, None), or (None, error Response).
+    """
+    user = request.user
+    if hasattr(user, "worker"):
+        return user.worker.shop_id, None
+    try:
+        shop_id = uuid.UUID(request.query_params.get("shop", ""))
+    except ValueError:
+        return None, Response(
+            {"detail": "Please provide a shop (shop)."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not user.is_superuser and shop_id not in managed_shop_ids(user):
+        return None, Response(
+            {"detail": "Shop not found."}, status=status.HTTP_404_NOT_FOUND
+        )
+    return shop_id, None
+
+
+def _search_limit(request):
+    try:
+        limit = int(request.query_params.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        limit = SEARCH_DEFAULT_LIMIT
+    return max(1, min(limit, SEARCH_MAX_LIMIT))
 
 
 @api_view(['GET'])
@@ -120,6 +202,55 @@ def dummy_logout(request):
     remove_token(token)
     return Response({"detail": "Logged out."})
 
+@api_view(["GET"])
+def sync_changes(request):
+    """
+    Delta sync feed for the mobile app. Returns the shop's products, stock/sale/
+    missed-sale entries and deletions ("deleted") changed since `cursor`.
+    Query parameters: 'cursor' (from the previous response; omit for a full sync),
+    'limit' (rows per stream), and 'shop' for managers/admins (workers always get
+    their own shop). Keep calling with the returned cursor while 'has_more' is true.
+    """
+    user = request.user
+
+    if hasattr(user, "worker"):
+        shop = user.worker.shop
+    else:
+        shop_id = request.query_params.get("shop")
+        if not shop_id:
+            return Response(
+                {"detail": "Please provide a shop (shop)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        shops = (
+            Shop.objects.all()
+            if user.is_superuser
+            else Shop.objects.filter(id__in=managed_shop_ids(user))
+        )
+        try:
+            shop = shops.get(pk=shop_id)
+        except (Shop.DoesNotExist, DjangoValidationError):
+            return Response(
+                {"detail": "Shop not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+    try:
+        limit = int(request.query_params.get("limit", SYNC_DEFAULT_LIMIT))
+    except ValueError:
+        return Response(
+            {"detail": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST
+        )
+    limit = max(1, min(limit, SYNC_MAX_LIMIT))
+
+    try:
+        changes = collect_changes(shop, request.query_params.get("cursor"), limit)
+    except InvalidCursor:
+        return Response(
+            {"detail": "Invalid sync cursor."}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(changes)
+
+
 class ShopCategoryViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows Shop Categories to be viewed or edited.
@@ -158,11 +289,18 @@ class ShopViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if user.is_superuser:
-            return Shop.objects.all().order_by("name")
+            queryset = Shop.objects.all()
         elif user.is_authenticated:
             # Managers can only see shops they are associated with
-            return Shop.objects.filter(managers=user).order_by("name")
-        return Shop.objects.none()  # Unauthenticated users see nothing
+            queryset = Shop.objects.filter(id__in=managed_shop_ids(user))
+        else:
+            return Shop.objects.none()  # Unauthenticated users see nothing
+        # ShopSerializer renders manager/category ids and names; load them in
+        # one query each instead of two per shop.
+        return queryset.prefetch_related(
+            Prefetch("managers", queryset=User.objects.only("id", "username")),
+            Prefetch("categories", queryset=ShopCategory.objects.only("id", "name")),
+        ).order_by("name")
 
     def get_permissions(self):
         """
@@ -180,6 +318,7 @@ class ShopViewSet(viewsets.ModelViewSet):
             "list",
             "retrieve",
             "categories_summary",
+            "stock_movement",
         ]:  # Added categories_summary
             self.permission_classes = [
                 permissions.IsAuthenticated
@@ -200,6 +339,11 @@ class ShopViewSet(viewsets.ModelViewSet):
                 {"detail": "Authentication required."},
                 status=status.HTTP_401_UNAUTHORIZED,
             )
+        if hasattr(user, "worker"):
+            return Response(
+                {"detail": "Workers cannot onboard shops."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
 
         # Create the Shop
         serializer = self.get_serializer(data=data)
@@ -214,6 +358,54 @@ class ShopViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
         
+    @action(detail=True, methods=["post"], url_path="import-products")
+    def import_products(self, request, pk=None):
+        """
+        Queues the import of a CSV or XLSX file (multipart field 'file') of
+        products with opening stock into the shop, for onboarding. Columns:
+        name, barcode, price, quantity, purchase_price, quantity_type,
+        quality_type, description. Rows matching a global product by barcode
+        or name are linked to it. The run_jobs worker imports the file;
+        returns 202 with the import's status, to poll at
+        shops/<id>/imports/<import id>/ for the counts and row-level errors.
+        """
+        try:
+            shop = self.get_queryset().prefetch_related(None).filter(pk=pk).first()
+        except DjangoValidationError:  # not a UUID
+            shop = None
+        if shop is None:
+            return Response(
+                {"detail": "Shop not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"detail": "Please upload a CSV or XLSX file (file)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        product_import = queue_product_import(shop, upload, request.user)
+        return Response(
+            ProductImportJobSerializer(product_import).data,
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=["get"], url_path=r"imports/(?P<import_id>[^/.]+)")
+    def import_status(self, request, pk=None, import_id=None):
+        """Returns the status and report of a product import of the shop."""
+        try:
+            shop = self.get_queryset().prefetch_related(None).filter(pk=pk).first()
+            product_import = (
+                shop.product_imports.filter(pk=import_id).first() if shop else None
+            )
+        except DjangoValidationError:  # shop or import id not a UUID
+            product_import = None
+        if product_import is None:
+            return Response(
+                {"detail": "Import not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(ProductImportJobSerializer(product_import).data)
+
     @method_decorator(csrf_exempt)
     @action(detail=True, methods=["post"], url_path="onboard-manager")
     def onboard_manager(self, request, pk=None):
@@ -313,77 +505,134 @@ class ShopViewSet(viewsets.ModelViewSet):
         Retrieves a summary of product categories and their stock/sales for a specific shop.
         """
         try:
-            shop = self.get_queryset().get(pk=pk)
+            # The summary doesn't render managers/categories, so skip the prefetches
+            shop = self.get_queryset().prefetch_related(None).get(pk=pk)
         except Shop.DoesNotExist:
             return Response(
                 {"detail": "Shop not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Get all categories that have products in this shop
-        categories_with_products = (
-            Category.objects.filter(global_products__shop_products__shop=shop)
-            .distinct()
-            .order_by("name")
+        # One grouped query per source table (products, sales, missed sales),
+        # so the number of queries stays constant however many products the shop has.
+        products_by_category = (
+            Product.objects.filter(shop=shop, global_product__category__isnull=False)
+            .values("global_product__category_id", "global_product__category__name")
+            .annotate(
+                total_products=Count("id"),
+                # Stock value uses the stored stock balance and current product price
+                total_stock_value=Coalesce(
+                    Sum(
+                        Coalesce(F("stock__quantity"), Decimal("0.000")) * F("price"),
+                        output_field=DecimalField(),
+                    ),
+                    Decimal("0.00"),
+                    output_field=DecimalField(),
+                ),
+            )
+            .order_by("global_product__category__name")
         )
 
-        summary_data = []
-        for category in categories_with_products:
-            # Get products in this shop linked to this global category
-            products_in_category = Product.objects.filter(
-                shop=shop, global_product__category=category
-            )
-
-            total_stock_value = Decimal("0.00")
-            total_sales_value = Decimal("0.00")
-            total_missed_sales_quantity = Decimal("0.000")
-
-            for product in products_in_category:
-                # Aggregate stock received for this product
-                stock_received = StockEntry.objects.filter(product=product).aggregate(
-                    total_quantity=Coalesce(Sum("quantity"), Decimal("0.000"))
-                )["total_quantity"]
-
-                # Aggregate sales for this product
-                sales_made = SaleEntry.objects.filter(product=product).aggregate(
-                    total_quantity=Coalesce(Sum("quantity"), Decimal("0.000")),
-                    total_selling_price=Coalesce(
-                        Sum(F("quantity") * F("selling_price")), Decimal("0.00")
-                    ),
+        sales_value_by_category = dict(
+            SaleEntry.objects.filter(
+                shop=shop, product__global_product__category__isnull=False
+            )
+            .values("product__global_product__category_id")
+            .annotate(
+                total_selling_price=Sum(
+                    F("quantity") * F("selling_price"), output_field=DecimalField()
                 )
+            )
+            .values_list("product__global_product__category_id", "total_selling_price")
+        )
 
-                # Aggregate missed sales for this product
-                missed_sales = MissedSaleEntry.objects.filter(
-                    product=product
-                ).aggregate(
-                    total_quantity_requested=Coalesce(
-                        Sum("quantity_requested"), Decimal("0.000")
-                    )
-                )[
-                    "total_quantity_requested"
-                ]
-
-                # Calculate current stock for this product based on received and sold
-                current_product_stock = stock_received - sales_made["total_quantity"]
-
-                total_stock_value += (
-                    current_product_stock * product.price
-                )  # Using current product price for stock value
-                total_sales_value += sales_made["total_selling_price"]
-                total_missed_sales_quantity += missed_sales
+        missed_quantity_by_category = dict(
+            MissedSaleEntry.objects.filter(
+                shop=shop, product__global_product__category__isnull=False
+            )
+            .values("product__global_product__category_id")
+            .annotate(total_quantity_requested=Sum("quantity_requested"))
+            .values_list(
+                "product__global_product__category_id", "total_quantity_requested"
+            )
+        )
 
+        summary_data = []
+        for row in products_by_category:
+            category_id = row["global_product__category_id"]
             summary_data.append(
                 {
-                    "category_id": str(category.id),
-                    "category_name": category.name,
-                    "total_products_in_category": products_in_category.count(),
-                    "total_stock_value_tzs": total_stock_value,
-                    "total_sales_value_tzs": total_sales_value,
-                    "total_missed_sales_quantity": total_missed_sales_quantity,
+                    "category_id": str(category_id),
+                    "category_name": row["global_product__category__name"],
+                    "total_products_in_category": row["total_products"],
+                    "total_stock_value_tzs": row["total_stock_value"],
+                    "total_sales_value_tzs": sales_value_by_category.get(
+                        category_id, Decimal("0.00")
+                    ),
+                    "total_missed_sales_quantity": missed_quantity_by_category.get(
+                        category_id, Decimal("0.000")
+                    ),
                 }
             )
 
         return Response({"categories_summary": summary_data}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=["get"], url_path="stock-movement")
+    def stock_movement(self, request, pk=None):
+        """
+        Per-day stockIn/stockOut/missedSales quantities for the manager dashboard.
+        Query parameters: 'start' and 'end' (YYYY-MM-DD, inclusive; default the
+        last 7 days) and 'tz' (IANA name; default settings.TIME_ZONE).
+        Served from the daily/hourly rollup tables.
+        """
+        try:
+            zone = zoneinfo.ZoneInfo(request.query_params.get("tz", settings.TIME_ZONE))
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            return Response(
+                {"detail": "Unknown time zone (tz)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            end = date.fromisoformat(
+                request.query_params.get("end")
+                or timezone.localdate(timezone=zone).isoformat()
+            )
+            start = date.fromisoformat(
+                request.query_params.get("start")
+                or (end - timedelta(days=STOCK_MOVEMENT_DEFAULT_DAYS - 1)).isoformat()
+            )
+        except ValueError:
+            return Response(
+                {"detail": "Dates (start, end) must be in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 <= (end - start).days < STOCK_MOVEMENT_MAX_DAYS:
+            return Response(
+                {
+                    "detail": f"'start' must not be after 'end', and the range is limited to {STOCK_MOVEMENT_MAX_DAYS} days."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Only the shop's existence (for this user) matters here
+        try:
+            exists = self.get_queryset().prefetch_related(None).filter(pk=pk).exists()
+        except DjangoValidationError:  # not a UUID
+            exists = False
+        if not exists:
+            return Response(
+                {"detail": "Shop not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(
+            {
+                "shop": str(pk),
+                "timezone": str(zone),
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "stock_movement": daily_stock_movement(pk, start, end, zone),
+            }
+        )
+
 
 class WorkerViewSet(viewsets.ModelViewSet):
     """
@@ -398,12 +647,14 @@ class WorkerViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return Worker.objects.all().order_by("first_name")
+            queryset = Worker.objects.all()
         elif user.is_authenticated:
             # Managers can only see workers in shops they manage
-            managed_shops = Shop.objects.filter(managers=user)
-            return Worker.objects.filter(shop__in=managed_shops).order_by("first_name")
-        return Worker.objects.none()
+            queryset = Worker.objects.filter(shop_id__in=managed_shop_ids(user))
+        else:
+            return Worker.objects.none()
+        # WorkerSerializer renders shop_name
+        return _select_rendered(queryset, "shop__name").order_by("first_name")
 
     def get_permissions(self):
         """
@@ -487,7 +738,44 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return [permission() for permission in self.permission_classes]
 
 
-class GlobalProductViewSet(viewsets.ModelViewSet):
+class PresignedImageUploadMixin:
+    """
+    Adds direct-to-storage image uploads to a Product/GlobalProduct viewset,
+    so image bytes bypass the app servers:
+    POST <object>/image-upload/ {"content_type"} returns a presigned PUT URL
+    and an upload token; once the file is uploaded,
+    POST <object>/image-upload/confirm/ {"upload_token"} attaches it. The
+    image is processed by the background worker, so confirming returns 202.
+    """
+
+    @action(detail=True, methods=["post"], url_path="image-upload")
+    def image_upload(self, request, pk=None):
+        instance = self.get_object()
+        content_type = request.data.get("content_type", "")
+        if content_type not in IMAGE_UPLOAD_CONTENT_TYPES:
+            return Response(
+                {"detail": f"content_type must be one of: {', '.join(IMAGE_UPLOAD_CONTENT_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            return Response(issue_image_upload(instance, content_type))
+        except PresignedUploadsUnavailable as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    @action(detail=True, methods=["post"], url_path="image-upload/confirm")
+    def confirm_image_upload(self, request, pk=None):
+        instance = self.get_object()
+        try:
+            attach_image_upload(instance, request.data.get("upload_token", ""))
+        except InvalidImageUpload as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"detail": "Upload received; the image is being processed."},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class GlobalProductViewSet(PresignedImageUploadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows Global Products to be viewed or edited.
     Only Admins can create/update/delete. All authenticated users can view.
@@ -497,8 +785,21 @@ class GlobalProductViewSet(viewsets.ModelViewSet):
     serializer_class = GlobalProductSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def get_queryset(self):
+        # GlobalProductSerializer renders category_name
+        return _select_rendered(GlobalProduct.objects.all(), "category__name").order_by(
+            "name"
+        )
+
     def get_permissions(self):
-        if self.action in ["create", "update", "partial_update", "destroy"]:
+        if self.action in [
+            "create",
+            "update",
+            "partial_update",
+            "destroy",
+            "image_upload",
+            "confirm_image_upload",
+        ]:
             self.permission_classes = [IsAdminUser]
         elif self.action in ["list", "retrieve", "search"]:  # Added 'search'
             self.permission_classes = [permissions.IsAuthenticated]
@@ -508,7 +809,7 @@ class GlobalProductViewSet(viewsets.ModelViewSet):
     def search(self, request):
         """
         Search global products by name or barcode.
-        Query parameter: 'q'
+        Query parameters: 'q', and optionally 'limit' (best matches returned).
         """
         query = request.query_params.get("q", "")
         if not query:
@@ -517,18 +818,14 @@ class GlobalProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Search by name (case-insensitive contains) or barcode (exact match)
-        results = (
-            self.get_queryset()
-            .filter(Q(name__icontains=query) | Q(barcode__iexact=query))
-            .distinct()
+        results = search_by_name_or_barcode(
+            self.get_queryset(), query, _search_limit(request)
         )
-
         serializer = self.get_serializer(results, many=True)
         return Response(serializer.data)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PresignedImageUploadMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows Shop-specific Products to be viewed or edited.
     Managers can only see/edit products in their own shops. Admins can see/edit all.
@@ -541,31 +838,131 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return Product.objects.all().order_by("name")
+            queryset = Product.objects.all()
         elif user.is_authenticated:
             # Managers can only see products in shops they manage
-            managed_shops = Shop.objects.filter(managers=user)
-            return Product.objects.filter(shop__in=managed_shops).order_by("name")
-        return Product.objects.none()
+            queryset = Product.objects.filter(shop_id__in=managed_shop_ids(user))
+        else:
+            return Product.objects.none()
+        # ProductSerializer renders shop, global product and category names
+        return _select_rendered(
+            queryset,
+            "shop__name",
+            "global_product__name",
+            "global_product__category__name",
+        ).order_by("name")
 
     def get_permissions(self):
         if self.action in ["create"]:
             self.permission_classes = [
                 IsManagerOfShop | IsAdminUser
             ]  # Managers can create products in their shops
-        elif self.action in ["update", "partial_update", "destroy"]:
+        elif self.action in [
+            "update",
+            "partial_update",
+            "destroy",
+            "image_upload",
+            "confirm_image_upload",
+        ]:
             self.permission_classes = [
                 IsManagerOfRelatedShop | IsAdminUser
             ]  # Managers can edit/delete products in their shops
-        elif self.action in ["list", "retrieve", "search"]:  # Added 'search'
+        elif self.action in [
+            "list",
+            "retrieve",
+            "search",
+            "autocomplete",
+            "by_barcode",
+            "image_matches",
+        ]:
             self.permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in self.permission_classes]
 
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request):
+        """
+        Type-ahead product suggestions for one shop, matched on the start of any
+        word of the name or of the barcode, served from an in-memory index.
+        Query parameters: 'q', 'limit', and 'shop' for managers/admins (workers
+        always get their own shop).
+        Returns [{"id", "name", "barcode", "price"}, ...].
+        """
+        query = request.query_params.get("q", "")
+        if not query.strip():
+            return Response([])
+
+        shop_id, error_response = _requested_shop_id(request)
+        if error_response:
+            return error_response
+
+        try:
+            limit = int(request.query_params.get("limit", AUTOCOMPLETE_DEFAULT_LIMIT))
+        except ValueError:
+            limit = AUTOCOMPLETE_DEFAULT_LIMIT
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+        return Response(prefix_indexes.get(shop_id).search(query, limit))
+
+    @action(detail=False, methods=["get"], url_path=r"by-barcode/(?P<code>[^/]+)")
+    def by_barcode(self, request, code=None):
+        """
+        Resolves a scanned barcode in one call: the shop's own product if it has
+        one ({"source": "shop", "product": ...}), otherwise the matching global
+        catalog entry as a suggestion ({"source": "global", "global_product": ...}),
+        or 404. Query parameter 'shop' for managers/admins.
+        """
+        shop_id, error_response = _requested_shop_id(request)
+        if error_response:
+            return error_response
+
+        source, match = lookup_barcode(shop_id, code)
+        if source == "shop":
+            return Response(
+                {"source": "shop", "product": ProductSerializer(match).data}
+            )
+        if source == "global":
+            return Response(
+                {
+                    "source": "global",
+                    "global_product": GlobalProductSerializer(match).data,
+                }
+            )
+        return Response(
+            {"detail": "No product with this barcode."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    @action(detail=True, methods=["get"], url_path="image-matches")
+    def image_matches(self, request, pk=None):
+        """
+        Global catalog products whose image looks like this product's, to help
+        link it: [{"distance", "global_product"}], closest first. The distance
+        is the number of differing bits of the images' 64-bit perceptual
+        hashes (0 for the same photo). Empty until the product's image has
+        been processed, or when matching is switched off.
+        """
+        product = self.get_object()
+        matches = similar_global_products(product.image_phash)
+        global_products = GlobalProduct.objects.select_related("category").in_bulk(
+            [global_product_id for global_product_id, _ in matches]
+        )
+        return Response(
+            [
+                {
+                    "distance": distance,
+                    "global_product": GlobalProductSerializer(
+                        global_products[global_product_id]
+                    ).data,
+                }
+                for global_product_id, distance in matches
+                if global_product_id in global_products
+            ]
+        )
+
     @action(detail=False, methods=["get"])
     def search(self, request):
         """
         Search products in the user's managed shops by name or barcode.
-        Query parameter: 'q'
+        Query parameters: 'q', and optionally 'limit' (best matches returned).
         """
         query = request.query_params.get("q", "")
         if not query:
@@ -575,18 +972,78 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
 
         # Filter products by the user's managed shops first
-        queryset = self.get_queryset()
-
-        # Search by name (case-insensitive contains) or barcode (exact match)
-        results = queryset.filter(
-            Q(name__icontains=query) | Q(barcode__iexact=query)
-        ).distinct()
-
+        results = search_by_name_or_barcode(
+            self.get_queryset(), query, _search_limit(request)
+        )
         serializer = self.get_serializer(results, many=True)
         return Response(serializer.data)
 
 
+class EntryExportMixin:
+    """
+    Adds GET <entries>/export/ to an entry viewset: the entries the user can
+    list, oldest first, streamed as a CSV or NDJSON file for accountants.
+    Query parameters: 'export_format' (csv or ndjson), 'start'/'end'
+    (YYYY-MM-DD, inclusive local days), 'shop' and 'gzip' (true to compress).
+    """
+
+    # (column name, field lookup) pairs written for each entry
+    export_columns = ()
+    export_filename = "entries"
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"detail": f"export_format must be one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.get_queryset()
+        try:
+            if request.query_params.get("start"):
+                start = date.fromisoformat(request.query_params["start"])
+                queryset = queryset.filter(
+                    recorded_at__gte=timezone.make_aware(datetime.combine(start, time.min))
+                )
+            if request.query_params.get("end"):
+                end = date.fromisoformat(request.query_params["end"])
+                queryset = queryset.filter(
+                    recorded_at__lt=timezone.make_aware(
+                        datetime.combine(end + timedelta(days=1), time.min)
+                    )
+                )
+            if request.query_params.get("shop"):
+                queryset = queryset.filter(
+                    shop_id=uuid.UUID(request.query_params["shop"])
+                )
+        except ValueError:
+            return Response(
+                {"detail": "Dates (start, end) must be in YYYY-MM-DD format and shop a valid ID."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        compress = request.query_params.get("gzip", "").lower() in ("1", "true")
+        content_type, extension = EXPORT_FORMATS[export_format]
+        filename = f"{self.export_filename}.{extension}"
+        if compress:
+            content_type, filename = "application/gzip", f"{filename}.gz"
+        response = StreamingHttpResponse(
+            export_chunks(
+                queryset.order_by("recorded_at", "id"),
+                self.export_columns,
+                export_format,
+                compress,
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 class StockEntryViewSet(
+    EntryExportMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -597,38 +1054,73 @@ class StockEntryViewSet(
     Workers can create/list/retrieve for their shop. Managers can list/retrieve for their shops.
     """
 
-    queryset = StockEntry.objects.all().order_by("-recorded_at")
+    queryset = StockEntry.objects.all().order_by("-recorded_at", "id")
     serializer_class = StockEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EntryPagination
+    export_filename = "stock_entries"
+    export_columns = (
+        ("id", "id"),
+        ("recorded_at", "recorded_at"),
+        ("shop_id", "shop_id"),
+        ("shop_name", "shop__name"),
+        ("worker_id", "worker_id"),
+        ("product_id", "product_id"),
+        ("product_name", "product__name"),
+        ("barcode", "product__barcode"),
+        ("quantity", "quantity"),
+        ("purchase_price", "purchase_price"),
+        ("notes", "notes"),
+    )
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return StockEntry.objects.all().order_by("-recorded_at")
+            return StockEntry.objects.all().order_by("-recorded_at", "id")
         elif user.is_authenticated:
             # Workers can see their own stock entries and stock entries in their shop
             if hasattr(user, "worker"):
                 return StockEntry.objects.filter(shop=user.worker.shop).order_by(
-                    "-recorded_at"
+                    "-recorded_at", "id"
                 )
             # Managers can see stock entries in shops they manage
-            managed_shops = Shop.objects.filter(managers=user)
-            return StockEntry.objects.filter(shop__in=managed_shops).order_by(
-                "-recorded_at"
-            )
+            return StockEntry.objects.filter(
+                shop_id__in=managed_shop_ids(user)
+            ).order_by("-recorded_at", "id")
         return StockEntry.objects.none()
 
     def get_permissions(self):
-        if self.action == "create":
+        if self.action in ["create", "bulk"]:
             # Only workers can create stock entries
             self.permission_classes = [IsWorkerOfShop]
         elif self.action in ["list", "retrieve"]:
             # Workers can list/retrieve for their shop. Managers can list/retrieve for their shops.
             self.permission_classes = [IsWorkerOfShop | IsManagerOfShop]
+        elif self.action == "export":
+            # Full-history exports are for managers (and admins)
+            self.permission_classes = [IsManagerOrAdmin]
         return [permission() for permission in self.permission_classes]
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Receives a whole supplier delivery in one request.
+        Body: {"shop": id, "worker": id, "lines": [{"product" or "product_name_text"/"barcode_text",
+        "quantity", "purchase_price", ...}]}
+        Products are matched by ID, name or barcode in one query; unknown names are
+        created for the shop. All entries are saved in a single transaction.
+        """
+        serializer = StockEntryBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        stock_entries = serializer.save()
+        return Response(
+            {"results": StockEntrySerializer(stock_entries, many=True).data},
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class SaleEntryViewSet(
+    EntryExportMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -639,38 +1131,72 @@ class SaleEntryViewSet(
     Workers can create/list/retrieve for their shop. Managers can list/retrieve for their shops.
     """
 
-    queryset = SaleEntry.objects.all().order_by("-recorded_at")
+    queryset = SaleEntry.objects.all().order_by("-recorded_at", "id")
     serializer_class = SaleEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EntryPagination
+    export_filename = "sale_entries"
+    export_columns = (
+        ("id", "id"),
+        ("recorded_at", "recorded_at"),
+        ("shop_id", "shop_id"),
+        ("shop_name", "shop__name"),
+        ("worker_id", "worker_id"),
+        ("product_id", "product_id"),
+        ("product_name", "product__name"),
+        ("barcode", "product__barcode"),
+        ("quantity", "quantity"),
+        ("selling_price", "selling_price"),
+        ("notes", "notes"),
+    )
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return SaleEntry.objects.all().order_by("-recorded_at")
+            return SaleEntry.objects.all().order_by("-recorded_at", "id")
         elif user.is_authenticated:
             # Workers can see their own sales entries and sales entries in their shop
             if hasattr(user, "worker"):
                 return SaleEntry.objects.filter(shop=user.worker.shop).order_by(
-                    "-recorded_at"
+                    "-recorded_at", "id"
                 )
             # Managers can see sales entries in shops they manage
-            managed_shops = Shop.objects.filter(managers=user)
-            return SaleEntry.objects.filter(shop__in=managed_shops).order_by(
-                "-recorded_at"
-            )
+            return SaleEntry.objects.filter(
+                shop_id__in=managed_shop_ids(user)
+            ).order_by("-recorded_at", "id")
         return SaleEntry.objects.none()
 
     def get_permissions(self):
-        if self.action == "create":
+        if self.action in ["create", "bulk"]:
             # Only workers can create sale entries
             self.permission_classes = [IsWorkerOfShop]
         elif self.action in ["list", "retrieve"]:
             # Workers can list/retrieve for their shop. Managers can list/retrieve for their shops.
             self.permission_classes = [IsWorkerOfShop | IsManagerOfShop]
+        elif self.action == "export":
+            # Full-history exports are for managers (and admins)
+            self.permission_classes = [IsManagerOrAdmin]
         return [permission() for permission in self.permission_classes]
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Records a whole checkout basket in one request.
+        Body: {"shop": id, "worker": id, "lines": [{"product", "quantity", "selling_price", "notes"}]}
+        All lines are validated and stock-checked together and saved in a single
+        transaction; either every line is recorded or none is.
+        """
+        serializer = SaleEntryBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sale_entries = serializer.save()
+        return Response(
+            {"results": SaleEntrySerializer(sale_entries, many=True).data},
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class MissedSaleEntryViewSet(
+    EntryExportMixin,
     mixins.CreateModelMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -681,25 +1207,39 @@ class MissedSaleEntryViewSet(
     Workers can create/list/retrieve for their shop. Managers can list/retrieve for their shops.
     """
 
-    queryset = MissedSaleEntry.objects.all().order_by("-recorded_at")
+    queryset = MissedSaleEntry.objects.all().order_by("-recorded_at", "id")
     serializer_class = MissedSaleEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EntryPagination
+    export_filename = "missed_sale_entries"
+    export_columns = (
+        ("id", "id"),
+        ("recorded_at", "recorded_at"),
+        ("shop_id", "shop_id"),
+        ("shop_name", "shop__name"),
+        ("worker_id", "worker_id"),
+        ("product_id", "product_id"),
+        ("product_name", "product__name"),
+        ("product_name_text", "product_name_text"),
+        ("quantity_requested", "quantity_requested"),
+        ("reason", "reason"),
+        ("notes", "notes"),
+    )
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return MissedSaleEntry.objects.all().order_by("-recorded_at")
+            return MissedSaleEntry.objects.all().order_by("-recorded_at", "id")
         elif user.is_authenticated:
             # Workers can see their own missed sales entries and missed sales entries in their shop
             if hasattr(user, "worker"):
                 return MissedSaleEntry.objects.filter(shop=user.worker.shop).order_by(
-                    "-recorded_at"
+                    "-recorded_at", "id"
                 )
             # Managers can see missed sales entries in shops they manage
-            managed_shops = Shop.objects.filter(managers=user)
-            return MissedSaleEntry.objects.filter(shop__in=managed_shops).order_by(
-                "-recorded_at"
-            )
+            return MissedSaleEntry.objects.filter(
+                shop_id__in=managed_shop_ids(user)
+            ).order_by("-recorded_at", "id")
         return MissedSaleEntry.objects.none()
 
     def get_permissions(self):
@@ -709,4 +1249,7 @@ class MissedSaleEntryViewSet(
         elif self.action in ["list", "retrieve"]:
             # Workers can list/retrieve for their shop. Managers can list/retrieve for their shops.
             self.permission_classes = [IsWorkerOfShop | IsManagerOfShop]
+        elif self.action == "export":
+            # Full-history exports are for managers (and admins)
+            self.permission_classes = [IsManagerOrAdmin]
         return [permission() for permission in self.permission_classes]
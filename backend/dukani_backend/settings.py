@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # Trigram lookups for product search
     "rest_framework",
     "corsheaders",  # For CORS
     "api",  # Your API app
@@ -50,7 +51,6 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    'api.auth.middleware.TokenAuthenticationMiddleware',
 ]
 
 ROOT_URLCONF = "dukani_backend.urls"
@@ -138,6 +138,9 @@ AWS_S3_USE_SSL = (
 AWS_DEFAULT_ACL = os.environ.get(
     "AWS_DEFAULT_ACL", "private"
 )  # Default to private, can be public-read
+# Signature V4 for signed URLs (including presigned uploads); newer S3 regions
+# accept nothing else
+AWS_S3_SIGNATURE_VERSION = "s3v4"
 
 
 # Custom S3 Storage Class for Media Files
@@ -161,7 +164,7 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.BasicAuthentication",
-        "rest_framework.authentication.TokenAuthentication",  # If you add token auth later
+        "api.auth.dummy_auth.DummyTokenAuthentication",  # Tokens from auth/dummy-login/
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -170,6 +173,71 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 10,
 }
 
+# Delta sync (api/sync.py): rows newer than this many seconds are held back
+# until the next sync so late-committing transactions are not skipped.
+SYNC_SETTLE_SECONDS = 2
+
+# Login tokens (api/auth/token_store.py). Tokens are stored in the database;
+# each process caches up to AUTH_TOKEN_CACHE_SIZE of them and re-checks a cached
+# token against the database after AUTH_TOKEN_CACHE_SECONDS (so a logout from
+# another process is honoured within that window).
+AUTH_TOKEN_TTL_DAYS = 30
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_SECONDS = 60
+
+# Managed-shop ID sets used by permissions and queryset scoping
+# (api/auth/principal.py), kept in the default cache and dropped whenever
+# Shop.managers changes. The default cache is per process, so other processes
+# may keep serving a user's old shop set (e.g. a removed manager's access) for
+# up to MANAGED_SHOPS_CACHE_SECONDS; with a shared cache backend (e.g. Redis)
+# the invalidation reaches all of them.
+MANAGED_SHOPS_CACHE_SECONDS = 30
+
+# Product autocomplete (api/autocomplete.py): in-memory prefix indexes for at
+# most AUTOCOMPLETE_MAX_SHOPS shops per process, rebuilt on Product changes in
+# the same process or after AUTOCOMPLETE_INDEX_SECONDS.
+AUTOCOMPLETE_MAX_SHOPS = 200
+AUTOCOMPLETE_INDEX_SECONDS = 60
+
+# Barcode lookups (api/barcodes.py) remember unknown barcodes for this long.
+# The default cache is per process, so a process other than the one that saved
+# a new barcode may keep reporting it unknown for up to this many seconds.
+BARCODE_MISS_CACHE_SECONDS = 30
+
+# Product images (api/images.py): uploads are re-encoded as JPEG, capped to
+# IMAGE_MAX_DIMENSION pixels on the longest side and stripped of EXIF data;
+# WebP and JPEG renditions fit within each of IMAGE_RENDITION_SIZES.
+IMAGE_MAX_DIMENSION = 2048
+IMAGE_RENDITION_SIZES = {"thumb": 240, "medium": 800}
+IMAGE_QUALITY = 80
+# Uploaded images wait here until the run_jobs worker stores them in
+# MediaStorage; the web and worker processes must share this directory. Files
+# older than IMAGE_STAGING_MAX_AGE_SECONDS that no queued job refers to (the
+# request rolled back) are deleted by the worker.
+IMAGE_STAGING_ROOT = os.path.join(BASE_DIR, "upload_staging")
+IMAGE_STAGING_MAX_AGE_SECONDS = 3600
+# Direct uploads (api/uploads.py): presigned PUT URLs into the media bucket are
+# valid for IMAGE_UPLOAD_URL_SECONDS and must be confirmed within
+# IMAGE_UPLOAD_CONFIRM_SECONDS. Larger files than IMAGE_MAX_UPLOAD_BYTES are
+# rejected (and deleted) on confirmation.
+IMAGE_UPLOAD_URL_SECONDS = 900
+IMAGE_UPLOAD_CONFIRM_SECONDS = 3600
+IMAGE_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+# Image matching (api/image_matching.py): /api/products/<id>/image-matches/
+# suggests global products whose image hash is at most IMAGE_MATCH_MAX_DISTANCE
+# bits (of 64, up to 7) from the product's; None switches matching off. Each
+# process rebuilds its hash index after IMAGE_MATCH_INDEX_SECONDS.
+IMAGE_MATCH_MAX_DISTANCE = 6
+IMAGE_MATCH_INDEX_SECONDS = 300
+
+# Background jobs (api/jobs.py), run by `manage.py run_jobs`. A failing job is
+# retried after JOB_RETRY_SECONDS, doubling each time, and marked FAILED after
+# JOB_MAX_ATTEMPTS attempts. A job still running after JOB_LOCK_SECONDS is
+# assumed to have lost its worker and is run again.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_SECONDS = 30
+JOB_LOCK_SECONDS = 600
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # For React web app